@@ -0,0 +1,59 @@
+"""
+Cache configuration from URLs, in the spirit of dj_database_url.
+
+    locmem://[name]                 per-process memory (the Django default)
+    file:///path/to/dir             file based; on /dev/shm it is shared memory
+                                    for every worker on the host
+    redis://[:password@]host:port/db
+    rediss://...                    Redis or any Redis-compatible server
+                                    (Valkey, KeyDB, a local stand-in for tests)
+    dummy://                        no caching
+
+Query parameters ``timeout``, ``max_entries``, ``cull_frequency`` and
+``key_prefix`` map to the matching CACHES settings.
+"""
+import os
+from urllib.parse import urlsplit, parse_qs
+
+BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+    "rediss": "django.core.cache.backends.redis.RedisCache",
+    "dummy": "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def parse(url, key_prefix=""):
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ValueError(f"Unsupported cache URL scheme: {parts.scheme!r}")
+
+    config = {"BACKEND": BACKENDS[parts.scheme]}
+    if parts.scheme == "locmem":
+        config["LOCATION"] = parts.netloc or key_prefix or "default"
+    elif parts.scheme == "file":
+        config["LOCATION"] = parts.path
+    elif parts.scheme in ("redis", "rediss"):
+        config["LOCATION"] = parts._replace(query="").geturl()
+
+    params = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+    if "timeout" in params:
+        config["TIMEOUT"] = None if params["timeout"] == "none" else int(params["timeout"])
+    options = {}
+    for name in ("max_entries", "cull_frequency"):
+        if name in params:
+            options[name.upper()] = int(params[name])
+    if options:
+        config["OPTIONS"] = options
+    config["KEY_PREFIX"] = params.get("key_prefix", key_prefix)
+    return config
+
+
+def config(env="CACHE_URL", default="locmem://", key_prefix=""):
+    """
+    Cache settings from the ``env`` variable, falling back to CACHE_URL and
+    then to ``default``. ``key_prefix`` keeps aliases sharing one server apart.
+    """
+    url = os.getenv(env) or os.getenv("CACHE_URL") or default
+    return parse(url, key_prefix=key_prefix)
@@ -28,7 +28,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # statiniams failams
+    "libraryapp.middleware.PerformanceMiddleware",  # SQL / laiko metrikos
+    "libraryapp.middleware.StaticFilesMiddleware",  # statiniams failams (WhiteNoise, WSGI ir ASGI)
+    "libraryapp.middleware.ReplicaPinningMiddleware",  # skaitymai iš replikų, po rašymo – iš pagrindinės DB
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -69,6 +71,57 @@ DATABASES = {
     )
 }
 
+# Read replicas: DATABASE_REPLICA_URLS lists (space or comma separated) read-only
+# copies of DATABASE_URL, as aliases replica1, replica2 ... Reads are spread over
+# them, writes and a writer's next requests go to the primary (libraryapp/replicas.py).
+# Locally two SQLite files will do: `manage.py sync_sqlite_replicas` refreshes the copy.
+LIBRARY_DATABASE_REPLICAS = []
+for number, url in enumerate(os.getenv("DATABASE_REPLICA_URLS", "").replace(",", " ").split(), 1):
+    alias = f"replica{number}"
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600)
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    LIBRARY_DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["libraryapp.replicas.PrimaryReplicaRouter"]
+
+# how long (seconds) a reader's requests stay on the primary after a write
+LIBRARY_REPLICA_PIN_SECONDS = int(os.getenv("LIBRARY_REPLICA_PIN_SECONDS", 5))
+# how often (seconds) each process checks a replica, and the lag that takes it out of use
+LIBRARY_REPLICA_CHECK_INTERVAL = 10
+LIBRARY_REPLICA_MAX_LAG = int(os.getenv("LIBRARY_REPLICA_MAX_LAG", 30))
+
+# SQLITE_TUNED=True: WAL, synchronous=NORMAL, mmap, a larger page cache, a busy
+# timeout and BEGIN IMMEDIATE writes on every SQLite connection (core/sqlite_tuning.py),
+# for deployments running several workers on one SQLite file.
+# `manage.py benchmark_sqlite` compares the modes.
+from core import sqlite_tuning
+
+if os.getenv("SQLITE_TUNED", "False") == "True":
+    for database in DATABASES.values():
+        if database["ENGINE"] == "django.db.backends.sqlite3":
+            database.setdefault("OPTIONS", {}).update(sqlite_tuning.config())
+
+# ==============================
+# Cache
+# ==============================
+# Configured from URLs (see core/cache_url.py). CACHE_URL applies to every
+# alias; <ALIAS>_CACHE_URL overrides one of them. The locmem default is per
+# process, so with several gunicorn workers use file:///dev/shm/... or redis://.
+from core import cache_url
+
+CACHES = {
+    "default": cache_url.config("DEFAULT_CACHE_URL"),
+    "views": cache_url.config("VIEWS_CACHE_URL", key_prefix="views"),
+    "queries": cache_url.config("QUERIES_CACHE_URL", key_prefix="queries"),
+    "sessions": cache_url.config("SESSIONS_CACHE_URL", key_prefix="sessions"),
+}
+
+# Cached sessions save the session (and messages, login) lookup on every
+# request. Only enable with a cache shared by all workers.
+if os.getenv("SESSION_CACHE", "False") == "True":
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+    SESSION_CACHE_ALIAS = "sessions"
+
 # ==============================
 # Password validation
 # ==============================
@@ -98,12 +151,110 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# uploads are served by libraryapp/media.py (ranges, ETags, a year's caching for
+# hashed cover copies); False when the front proxy serves MEDIA_ROOT on its own.
+# LIBRARY_MEDIA_ACCEL lets the proxy send the bytes after the view's checks:
+# "x-accel-redirect" (nginx: an `internal` location at LIBRARY_MEDIA_ACCEL_PREFIX
+# with `alias` MEDIA_ROOT) or "x-sendfile" (Apache mod_xsendfile, lighttpd).
+LIBRARY_SERVE_MEDIA = os.getenv("LIBRARY_SERVE_MEDIA", "True") == "True"
+LIBRARY_MEDIA_ACCEL = os.getenv("LIBRARY_MEDIA_ACCEL", "")
+LIBRARY_MEDIA_ACCEL_PREFIX = os.getenv("LIBRARY_MEDIA_ACCEL_PREFIX", "/protected-media/")
+
 # ==============================
 # Auth redirects
 # ==============================
 LOGIN_REDIRECT_URL = "libraryapp:book_list"
 LOGOUT_REDIRECT_URL = "libraryapp:book_list"
 
+# ==============================
+# Catalogue
+# ==============================
+# keyset (cursor) pagination for the book list; ?page=N offset pages stay available
+LIBRARY_CURSOR_PAGINATION = os.getenv("LIBRARY_CURSOR_PAGINATION", "False") == "True"
+
+# cached id lists per filter combination (see libraryapp/catalogue_cache.py)
+LIBRARY_QUERY_CACHE_ALIAS = "queries"
+LIBRARY_QUERY_CACHE_TIMEOUT = int(os.getenv("LIBRARY_QUERY_CACHE_TIMEOUT", 300))
+LIBRARY_QUERY_CACHE_MAX_IDS = int(os.getenv("LIBRARY_QUERY_CACHE_MAX_IDS", 10000))
+
+# rendered pages for anonymous visitors and book fragments for everyone
+LIBRARY_PAGE_CACHE_ALIAS = "views"
+LIBRARY_PAGE_CACHE_TIMEOUT = int(os.getenv("LIBRARY_PAGE_CACHE_TIMEOUT", 60))
+LIBRARY_FRAGMENT_CACHE_TIMEOUT = int(os.getenv("LIBRARY_FRAGMENT_CACHE_TIMEOUT", 3600))
+
+# async versions of the catalogue, book and profile pages, for ASGI
+# deployments (Procfile "web-async"); under WSGI the sync views are faster
+LIBRARY_ASYNC_VIEWS = os.getenv("LIBRARY_ASYNC_VIEWS", "False") == "True"
+
+# how often (seconds) a process checks whether its title/author typeahead index is stale
+LIBRARY_AUTOCOMPLETE_CHECK_INTERVAL = 1.0
+
+# "readers who liked this also liked" books kept per book (libraryapp/recommendations.py)
+LIBRARY_SIMILAR_BOOKS = 6
+# limits of the per-vote refresh of one book's list (the nightly rebuild reads everything):
+# candidates come from its newest readers only, and only the books they share most are scored
+LIBRARY_RECOMMENDATIONS_MAX_READERS = 1000
+LIBRARY_RECOMMENDATIONS_MAX_CANDIDATES = 500
+
+# most items one batch reading-list/rating request may carry (libraryapp/services.py)
+LIBRARY_BATCH_MAX_ITEMS = int(os.getenv("LIBRARY_BATCH_MAX_ITEMS", 500))
+
+# ==============================
+# Background tasks
+# ==============================
+# queued tasks are run by the Procfile's `worker` process (`manage.py run_worker`);
+# deployments without one set True to run them right after the request's commit
+LIBRARY_TASKS_EAGER = os.getenv("LIBRARY_TASKS_EAGER", "False") == "True"
+# retry backoff: 10 s, 20 s, 40 s ... at most an hour
+LIBRARY_TASKS_RETRY_DELAY = 10
+LIBRARY_TASKS_MAX_RETRY_DELAY = 3600
+# a running task's heartbeat (seconds); run_worker --stale-after (600 s) requeues
+# only tasks that missed many of them, so a long task is never run twice
+LIBRARY_TASKS_HEARTBEAT = 30
+
+# ==============================
+# Performance instrumentation
+# ==============================
+# query budgets per view (libraryapp/middleware.py); over budget is logged,
+# or raised with LIBRARY_QUERY_BUDGET_STRICT (the test suite enables it)
+LIBRARY_QUERY_BUDGETS = {
+    "libraryapp:book_list": 8,  # two of them are the sidebar facets, cached per filter set
+    "libraryapp:book_detail": 8,
+    "libraryapp:rate_book": 10,  # the upsert and the book's aggregates; counters are queued
+    "libraryapp:mark_as_read": 10,  # the upsert, then the title for the message
+    "libraryapp:reading_batch": 9,  # the same for any number of items
+    "libraryapp:profile": 12,  # first visit creates the profile; later ones run 4
+}
+LIBRARY_QUERY_BUDGET_STRICT = False
+# the Server-Timing header tells any client, and the shared page cache, how long the
+# database took: development only by default (benchmark_library turns it on itself)
+LIBRARY_SERVER_TIMING = os.getenv("LIBRARY_SERVER_TIMING", str(DEBUG)) == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "libraryapp.performance": {
+            "handlers": ["console"],
+            "level": os.getenv("LIBRARY_PERFORMANCE_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+        "libraryapp.tasks": {
+            "handlers": ["console"],
+            "level": os.getenv("LIBRARY_TASKS_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+        "libraryapp.replicas": {
+            "handlers": ["console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
+
 # ==============================
 # Email (development only)
 # ==============================
@@ -0,0 +1,50 @@
+"""
+Connection options for serving production traffic from one SQLite file with
+several gunicorn workers (SQLITE_TUNED=True, see settings.py).
+
+    journal_mode=WAL        readers no longer wait for a writer, nor it for them
+    synchronous=NORMAL      in WAL mode only a checkpoint syncs the disk; a power
+                            loss can drop the last commits, never corrupt the file
+    mmap_size               pages read through memory mapping instead of read()
+    cache_size              page cache per connection
+    temp_store=MEMORY       sorts and temporary indexes stay off the disk
+    transaction_mode        BEGIN IMMEDIATE: a write transaction takes the write
+                            lock when it starts, so a second writer waits out the
+                            busy timeout instead of failing with "database is
+                            locked" when it upgrades its read lock mid-transaction
+    timeout                 the busy timeout (sqlite3.connect sets busy_timeout)
+
+SQLITE_MMAP_SIZE (bytes), SQLITE_CACHE_SIZE (KiB) and SQLITE_BUSY_TIMEOUT
+(milliseconds) override the defaults below.
+"""
+import os
+
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+BUSY_TIMEOUT_MS = 5000
+
+
+def options(mmap_size=MMAP_SIZE, cache_size_kib=CACHE_SIZE_KIB, busy_timeout_ms=BUSY_TIMEOUT_MS):
+    """DATABASES OPTIONS for a tuned SQLite connection."""
+    pragmas = [
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        f"mmap_size={mmap_size}",
+        # negative: the size in KiB rather than in pages
+        f"cache_size=-{cache_size_kib}",
+        "temp_store=MEMORY",
+    ]
+    return {
+        "init_command": ";".join(f"PRAGMA {pragma}" for pragma in pragmas),
+        "transaction_mode": "IMMEDIATE",
+        "timeout": busy_timeout_ms / 1000,
+    }
+
+
+def config():
+    """options() with the SQLITE_* environment overrides."""
+    return options(
+        mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", MMAP_SIZE)),
+        cache_size_kib=int(os.getenv("SQLITE_CACHE_SIZE", CACHE_SIZE_KIB)),
+        busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT", BUSY_TIMEOUT_MS)),
+    )
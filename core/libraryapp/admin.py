@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Author, Genre, Book, Rating, UserBookStatus, UserProfile
+from .models import Author, Genre, Book, Rating, Task, UserBookStatus, UserProfile
 from django.utils.html import format_html
+from . import covers
 
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
@@ -19,6 +20,8 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ("title", "isbn")
 
     def cover_preview(self, obj):
+        if obj.cover_hash:
+            return covers.picture(obj, "thumb")
         if obj.cover:
             return format_html('<img src="{}" style="height: 80px;"/>', obj.cover.url)
         return "—"
@@ -40,3 +43,9 @@ class UserBookStatusAdmin(admin.ModelAdmin):
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "birth_year", "city")
     search_fields = ("user__username", "city")
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "run_at", "created_at", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = [field.name for field in Task._meta.fields]
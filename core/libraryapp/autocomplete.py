@@ -0,0 +1,119 @@
+# ##### typeahead #####
+# Prefix suggestions for the catalogue's title and author inputs, answered
+# from an in-memory index instead of the database. Each process builds the
+# index of a field on first use: the folded text of every distinct title
+# (or author name) from each word onwards, as one sorted list searched with
+# bisect. The index is rebuilt when the catalogue generation counters it
+# depends on move (checked at most every LIBRARY_AUTOCOMPLETE_CHECK_INTERVAL
+# seconds), so requests in between never leave the process.
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from . import catalogue_cache
+from .models import Author, Book
+from .search import fold
+
+MAX_LIMIT = 20
+
+
+def book_titles():
+    return Book.objects.order_by().values_list("title", flat=True).distinct()
+
+
+def author_names():
+    # authors without books match nothing in the catalogue
+    return Author.objects.filter(books__isnull=False).order_by().values_list("name", flat=True).distinct()
+
+
+# field -> (generation tags, loader)
+FIELDS = {
+    "title": (("books",), book_titles),
+    "author": (("books", "authors"), author_names),
+}
+
+
+def normalize(text):
+    return " ".join(fold(text).split())
+
+
+class PrefixIndex:
+    """Sorted folded keys; matches at the start of the text rank before matches at a later word."""
+
+    def __init__(self, labels):
+        labels = sorted(set(labels), key=normalize)
+        heads, words = [], []
+        for position, label in enumerate(labels):
+            key = normalize(label)
+            heads.append((key, position))
+            # every later word start, so "ledą" finds "Per lūžtantį ledą"
+            words += [(key[match.start():], position) for match in re.finditer(r"(?<= )\w", key)]
+        words.sort()
+        self.labels = labels
+        self.heads = [key for key, _ in heads]
+        self.words = [key for key, _ in words]
+        self.word_labels = [position for _, position in words]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        start = bisect_left(self.heads, prefix)
+        for position in range(start, len(self.heads)):
+            if len(found) >= limit or not self.heads[position].startswith(prefix):
+                break
+            found.append(position)
+
+        seen = set(found)
+        start = bisect_left(self.words, prefix)
+        for i in range(start, len(self.words)):
+            if len(found) >= limit or not self.words[i].startswith(prefix):
+                break
+            if self.word_labels[i] not in seen:
+                seen.add(self.word_labels[i])
+                found.append(self.word_labels[i])
+        return [self.labels[position] for position in found]
+
+
+# field -> (index, generations it was built from, when they were last checked)
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(field):
+    tags, loader = FIELDS[field]
+    index, version, checked = _indexes.get(field, (None, None, 0.0))
+    now = time.monotonic()
+    if index is not None and now - checked < getattr(settings, "LIBRARY_AUTOCOMPLETE_CHECK_INTERVAL", 1.0):
+        return index
+
+    current = catalogue_cache.generations(tags)
+    if index is not None and current == version:
+        _indexes[field] = (index, version, now)
+        return index
+
+    # one thread rebuilds; the others keep answering from the old index meanwhile
+    if not _lock.acquire(blocking=index is None):
+        return index
+    try:
+        index = PrefixIndex(loader())
+        _indexes[field] = (index, current, now)
+        return index
+    finally:
+        _lock.release()
+
+
+def clear():
+    """Forget the built indexes (tests, data changed behind the catalogue signals)."""
+    _indexes.clear()
+
+
+def suggest(field, prefix, limit=8):
+    return get_index(field).search(prefix, min(limit, MAX_LIMIT))
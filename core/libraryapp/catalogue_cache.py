@@ -0,0 +1,146 @@
+# ##### catalogue result cache #####
+# Caches the ordered list of book ids matching a filter combination, so a
+# repeated title/author/genre/year/order query only has to load the rows of
+# the requested page. Keys embed generation counters of the data they depend
+# on; signals bump a counter and every dependent key is simply never read again.
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+# query parameters that select and order the catalogue
+FILTER_PARAMS = ("q", "title", "author", "genre", "year_from", "year_to", "order")
+
+# which generation counters a filter parameter depends on ("books" always)
+PARAM_TAGS = {
+    "q": ("authors", "genres"),
+    "author": ("authors",),
+    "genre": ("genres",),
+}
+
+# stored instead of the id list when a result set is too large to cache
+TOO_LARGE = "too-large"
+
+# when a counter was last bumped, for Last-Modified headers
+CHANGED_AT = "catalogue:changed-at"
+
+
+def get_cache():
+    return caches[getattr(settings, "LIBRARY_QUERY_CACHE_ALIAS", "default")]
+
+
+def normalize(params, order):
+    """Stable, whitespace- and case-insensitive form of the filter parameters."""
+    normalized = {}
+    for name in FILTER_PARAMS:
+        value = order if name == "order" else " ".join((params.get(name) or "").split())
+        if value:
+            normalized[name] = value.casefold()
+    return tuple(sorted(normalized.items()))
+
+
+def generations(tags):
+    cache = get_cache()
+    keys = {tag: f"catalogue:gen:{tag}" for tag in tags}
+    found = cache.get_many(keys.values())
+    return tuple((tag, found.get(key, 0)) for tag, key in sorted(keys.items()))
+
+
+def _incr(key):
+    # counters never expire, otherwise a stale generation could come back to life
+    cache = get_cache()
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def bump(*tags):
+    for tag in tags:
+        _incr(f"catalogue:gen:{tag}")
+    get_cache().set(CHANGED_AT, timezone.now(), timeout=None)
+
+
+def version(tags):
+    """(generations of ``tags``, when a counter was last bumped) with one cache read."""
+    cache = get_cache()
+    keys = {tag: f"catalogue:gen:{tag}" for tag in tags}
+    found = cache.get_many([*keys.values(), CHANGED_AT])
+    changed_at = found.get(CHANGED_AT)
+    if changed_at is None:
+        # nothing bumped since the cache was emptied: count from now on
+        changed_at = timezone.now()
+        if not cache.add(CHANGED_AT, changed_at, timeout=None):
+            changed_at = cache.get(CHANGED_AT, changed_at)
+    return tuple((tag, found.get(key, 0)) for tag, key in sorted(keys.items())), changed_at
+
+
+def cache_key(normalized, kind="ids", tags=()):
+    """Key of a cached ``kind`` of result; ``tags`` are generations it depends on beyond its filters."""
+    tags = {"books", *tags}
+    for name, _ in normalized:
+        tags.update(PARAM_TAGS.get(name, ()))
+    raw = repr((normalized, generations(tags)))
+    return f"catalogue:{kind}:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def record(event):
+    _incr(f"catalogue:stats:{event}")
+
+
+def stats():
+    found = get_cache().get_many(["catalogue:stats:hit", "catalogue:stats:miss"])
+    hits = found.get("catalogue:stats:hit", 0)
+    misses = found.get("catalogue:stats:miss", 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+
+def reset_stats():
+    get_cache().delete_many(["catalogue:stats:hit", "catalogue:stats:miss"])
+
+
+def matching_ids(params, order, queryset):
+    """
+    Ordered ids of the books in ``queryset`` for this filter combination, from
+    the cache when possible. Returns None when the result is too large to cache.
+    """
+    cache = get_cache()
+    key = cache_key(normalize(params, order))
+    ids = cache.get(key)
+    if ids is not None:
+        record("hit")
+        return None if ids == TOO_LARGE else ids
+
+    record("miss")
+    limit = getattr(settings, "LIBRARY_QUERY_CACHE_MAX_IDS", 10000)
+    ids = list(queryset.values_list("pk", flat=True)[:limit + 1])
+    timeout = getattr(settings, "LIBRARY_QUERY_CACHE_TIMEOUT", 300)
+    if len(ids) > limit:
+        cache.set(key, TOO_LARGE, timeout)
+        return None
+    cache.set(key, ids, timeout)
+    return ids
+
+
+class CachedResult:
+    """Sequence over cached ids that loads only the sliced rows (for Paginator)."""
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index]
+        rows = self.queryset.order_by().in_bulk(ids)
+        return [rows[pk] for pk in ids if pk in rows]
@@ -0,0 +1,77 @@
+# ##### conditional GET #####
+# ETag / Last-Modified validators for the catalogue and book pages, so repeat
+# visitors and crawlers get "304 Not Modified" without the page being built.
+# The catalogue validators come from the catalogue_cache generation counters
+# (no query at all), a book's from one indexed query; each is computed once per
+# request (async views compute it up front with the a* variants).
+# Logged-in users see personal blocks, so they always get a full response.
+import hashlib
+
+from asgiref.sync import sync_to_async
+
+from . import catalogue_cache
+from .models import Book
+
+# everything a catalogue page shows: book rows, author names, the genre
+# sidebar and average ratings
+CATALOGUE_TAGS = ("authors", "books", "genres", "ratings")
+
+
+def catalogue_version(request):
+    """
+    (generation counters, last change) of the catalogue. Signals and bulk
+    writes bump the counters, so deletions and genre changes count too.
+    """
+    if not hasattr(request, "_catalogue_version"):
+        request._catalogue_version = catalogue_cache.version(CATALOGUE_TAGS)
+    return request._catalogue_version
+
+
+def book_version(request, pk):
+    if not hasattr(request, "_book_version"):
+        request._book_version = Book.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+    return request._book_version
+
+
+async def acatalogue_version(request):
+    if not hasattr(request, "_catalogue_version"):
+        request._catalogue_version = await sync_to_async(catalogue_cache.version)(CATALOGUE_TAGS)
+    return request._catalogue_version
+
+
+async def abook_version(request, pk):
+    if not hasattr(request, "_book_version"):
+        request._book_version = await Book.objects.filter(pk=pk).values_list("updated_at", flat=True).afirst()
+    return request._book_version
+
+
+def catalogue_etag(request, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    generations, changed_at = catalogue_version(request)
+    raw = repr((
+        catalogue_cache.normalize(request.GET, request.GET.get("order", "")),
+        request.GET.get("page"),
+        request.GET.get("cursor"),
+        generations,
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def catalogue_last_modified(request, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    return catalogue_version(request)[1]
+
+
+def book_etag(request, pk, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    updated_at = book_version(request, pk)
+    return f"book-{pk}-{updated_at.timestamp()}" if updated_at else None
+
+
+def book_last_modified(request, pk, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    return book_version(request, pk)
@@ -0,0 +1,154 @@
+# ##### cover derivatives #####
+# Resized JPEG and WebP copies of every cover in the sizes the templates show
+# (catalogue card, book page, admin thumbnail), each at 1x and 2x width. Files
+# are named after the hash of the original's content, so a URL never changes
+# meaning and can be cached forever; Book.cover_hash records which set exists
+# and Book.cover_width the original's width: smaller originals are never
+# upscaled, so their copies stop at that width and the srcset lists only those.
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.functions import Now
+from django.utils.html import format_html
+from PIL import Image, ImageOps
+
+from . import catalogue_cache
+from .models import Book
+
+DERIVED_DIR = "covers/derived"
+
+# variant -> (rendered CSS width, the `sizes` attribute); files are made at 1x and 2x
+VARIANTS = {
+    "thumb": (60, "60px"),
+    "card": (300, "300px"),
+    "detail": (340, "(max-width: 400px) 100vw, 340px"),
+}
+
+FORMATS = {
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+}
+
+# a year, the longest lifetime clients and proxies are expected to honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def widths(variant):
+    width = VARIANTS[variant][0]
+    return (width, width * 2)
+
+
+def all_widths():
+    return sorted({w for variant in VARIANTS for w in widths(variant)})
+
+
+def capped(widths, cover_width):
+    """The widths actually made from an original ``cover_width`` wide (0: not known, all of them)."""
+    if not cover_width:
+        return sorted(set(widths))
+    return sorted({min(width, cover_width) for width in widths})
+
+
+def derived_name(cover_hash, width, ext):
+    return f"{DERIVED_DIR}/{cover_hash}-{width}.{ext}"
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def render(image, width, ext):
+    # never upscale: small originals keep their own width
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    fmt, options = FORMATS[ext]
+    out = BytesIO()
+    image.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def process(book, storage=default_storage, force=False):
+    """
+    Write the derivatives of ``book.cover`` and store its hash on the book.
+    Returns the number of bytes written (0 when they already existed).
+    """
+    if not book.cover:
+        if book.cover_hash:
+            discard(book, storage)
+            Book.objects.filter(pk=book.pk).update(cover_hash="", cover_width=0, updated_at=Now())
+            catalogue_cache.bump("books")
+        return 0
+
+    with book.cover.open("rb") as file:
+        cover_hash = content_hash(file)
+        cover_width = book.cover_width if cover_hash == book.cover_hash else 0
+        written = 0
+        largest = capped(all_widths(), cover_width)[-1]
+        if force or not cover_width or not storage.exists(derived_name(cover_hash, largest, "webp")):
+            file.seek(0)
+            with Image.open(file) as original:
+                image = ImageOps.exif_transpose(original).convert("RGB")
+            cover_width = image.width
+            for width in capped(all_widths(), cover_width):
+                for ext in FORMATS:
+                    name = derived_name(cover_hash, width, ext)
+                    data = render(image, width, ext)
+                    if storage.exists(name):
+                        storage.delete(name)
+                    storage.save(name, ContentFile(data))
+                    written += len(data)
+
+    if (book.cover_hash, book.cover_width) != (cover_hash, cover_width):
+        if book.cover_hash and book.cover_hash != cover_hash:
+            discard(book, storage)
+        # bumping updated_at refreshes the book's own cached fragments showing the cover,
+        # the "books" generation the lists showing it elsewhere (catalogue, neighbours)
+        Book.objects.filter(pk=book.pk).update(cover_hash=cover_hash, cover_width=cover_width, updated_at=Now())
+        catalogue_cache.bump("books")
+        book.cover_hash, book.cover_width = cover_hash, cover_width
+    return written
+
+
+def discard(book, storage=default_storage):
+    """Delete the copies of the book's previous cover, unless another book shows the same image."""
+    if Book.objects.filter(cover_hash=book.cover_hash).exclude(pk=book.pk).exists():
+        return
+    # copies made before cover_width was recorded may exist in every width
+    for width in set(all_widths()) | set(capped(all_widths(), book.cover_width)):
+        for ext in FORMATS:
+            name = derived_name(book.cover_hash, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+
+
+def srcset(cover_hash, variant, ext, cover_width=0):
+    return ", ".join(
+        f"{default_storage.url(derived_name(cover_hash, width, ext))} {width}w"
+        for width in capped(widths(variant), cover_width)
+    )
+
+
+def picture(book, variant):
+    """<picture> with WebP and JPEG srcsets, or the original file until derivatives exist."""
+    if not book.cover:
+        return ""
+    if not book.cover_hash:
+        return format_html('<img src="{}" alt="{}" loading="lazy">', book.cover.url, book.title)
+
+    width, sizes = VARIANTS[variant]
+    width = capped([width], book.cover_width)[0]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset(book.cover_hash, variant, "webp", book.cover_width), sizes,
+        default_storage.url(derived_name(book.cover_hash, width, "jpg")),
+        srcset(book.cover_hash, variant, "jpg", book.cover_width), sizes, book.title,
+    )
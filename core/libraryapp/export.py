@@ -0,0 +1,126 @@
+# ##### streaming export #####
+# CSV / JSONL dumps of books, ratings and reading statuses, produced as a
+# stream of byte chunks: rows are read in primary-key keyset batches, so
+# memory stays flat whatever the table size, and can be gzipped on the fly.
+# Used by the export views (StreamingHttpResponse) and the export_data command.
+# Under ASGI the views stream astream(): Django would read a plain iterator
+# to the end, into memory, before sending the first byte.
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Book, Rating, UserBookStatus
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+# dataset -> (model, exported columns)
+DATASETS = {
+    "books": (Book, (
+        "id", "isbn", "title", "author__name", "year", "description",
+        "rating_count", "avg_rating", "updated_at",
+    )),
+    "ratings": (Rating, ("id", "book_id", "book__isbn", "user_id", "stars", "created_at")),
+    "statuses": (UserBookStatus, ("id", "book_id", "book__isbn", "user_id", "status", "created_at")),
+}
+
+# datasets a user can export about themselves, without other users' ids
+USER_DATASETS = {
+    "ratings": ("book__isbn", "book__title", "stars", "created_at"),
+    "statuses": ("book__isbn", "book__title", "status", "created_at"),
+}
+
+
+def keyset_batches(queryset, fields, chunk_size=2000):
+    """Lists of row dicts, walking the primary key instead of OFFSET or one huge cursor."""
+    queryset = queryset.order_by("pk").values("pk", *fields)
+    last_pk = None
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(batch[:chunk_size].iterator(chunk_size=chunk_size))
+        if not rows:
+            return
+        last_pk = rows[-1]["pk"]
+        for row in rows:
+            del row["pk"]
+        yield rows
+
+
+def with_genres(batches):
+    """Adds a "genres" column to book batches, one through-table query per batch."""
+    for rows in batches:
+        genres = {}
+        for book_id, name in Book.genres.through.objects.filter(
+            book_id__in=[row["id"] for row in rows]
+        ).order_by("genre__name").values_list("book_id", "genre__name"):
+            genres.setdefault(book_id, []).append(name)
+        for row in rows:
+            row["genres"] = genres.get(row["id"], [])
+        yield rows
+
+
+def encode(batches, fields, fmt):
+    """One bytes chunk per batch; CSV starts with a header row."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for rows in batches:
+            for row in rows:
+                writer.writerow([
+                    "|".join(value) if isinstance(value, list) else value
+                    for value in (row[name] for name in fields)
+                ])
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        for rows in batches:
+            yield "".join(
+                json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + "\n" for row in rows
+            ).encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(dataset, fmt, queryset=None, fields=None, compress=False, chunk_size=2000):
+    """
+    Byte chunks of ``dataset`` in ``fmt``; ``queryset`` and ``fields`` narrow
+    the model's rows and columns (the per-user export).
+    """
+    model, default_fields = DATASETS[dataset]
+    queryset = model._default_manager.all() if queryset is None else queryset
+    fields = tuple(fields or default_fields)
+    batches = keyset_batches(queryset, fields, chunk_size)
+    if dataset == "books":
+        batches = with_genres(batches)
+        fields += ("genres",)
+    chunks = encode(batches, fields, fmt)
+    return gzipped(chunks) if compress else chunks
+
+
+async def astream(*args, **kwargs):
+    """stream() as an async iterator; each chunk is made in the sync thread, where the connection lives."""
+    chunks = stream(*args, **kwargs)
+    done = object()
+    while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+        yield chunk
+
+
+def filename(dataset, fmt, compress=False):
+    return f"{dataset}.{fmt}" + (".gz" if compress else "")
@@ -0,0 +1,56 @@
+# ##### catalogue facets #####
+# Sidebar counts of the books matching the current filters: per genre, per
+# decade and per author. Two grouped queries produce all three (book rows
+# grouped by decade and author, genre links grouped by genre) instead of a
+# COUNT per value. Results are cached under the normalized filters with the
+# generation counters of catalogue_cache.py, so a repeated filter combination
+# costs one cache read whatever the size of the catalogue.
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, F
+
+from . import catalogue_cache
+from .models import Book
+
+# authors listed in the sidebar, most books first
+AUTHOR_LIMIT = 10
+
+
+def compute(queryset):
+    """Facet counts of the books in ``queryset``."""
+    matching = queryset.order_by().values("pk")
+
+    decades, authors = Counter(), Counter()
+    for decade, author, count in (
+        Book.objects.filter(pk__in=matching)
+        .annotate(decade=F("year") / 10 * 10)
+        .values("decade", "author__name").annotate(n=Count("pk")).order_by()
+        .values_list("decade", "author__name", "n")
+    ):
+        if decade is not None:
+            decades[decade] += count
+        authors[author] += count
+
+    genres = dict(
+        Book.genres.through.objects.filter(book__in=matching)
+        .values("genre").annotate(n=Count("book")).order_by()
+        .values_list("genre", "n")
+    )
+    return {
+        "genres": genres,
+        "decades": sorted(decades.items()),
+        "authors": sorted(authors.items(), key=lambda item: (-item[1], item[0]))[:AUTHOR_LIMIT],
+    }
+
+
+def get(params, queryset):
+    """Facet counts for the filter parameters ``params``, from the cache when possible."""
+    cache = catalogue_cache.get_cache()
+    # the order does not change the counts; author names and genres always show
+    key = catalogue_cache.cache_key(catalogue_cache.normalize(params, ""), "facets", ("authors", "genres"))
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute(queryset)
+        cache.set(key, facets, getattr(settings, "LIBRARY_QUERY_CACHE_TIMEOUT", 300))
+    return facets
@@ -1,7 +1,8 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth.models import User
-from .models import Rating, UserProfile
+from .models import Rating
+from . import tasks
 
 
 class RatingForm(forms.ModelForm):
@@ -54,9 +55,32 @@ class CustomUserCreationForm(UserCreationForm):
 
         if commit:
             user.save()
-            UserProfile.objects.create(
-                user=user,
+            # the profile view creates it on demand if the worker has not run yet
+            tasks.create_profile.enqueue(
+                user_id=user.pk,
                 birth_year=self.cleaned_data.get("birth_year"),
                 city=self.cleaned_data.get("city"),
             )
         return user
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """
+    Leaves the reset email to the task worker. Only the user and the template
+    names are queued: the link (uid + token) is made in the worker, so it is
+    never stored in the task table.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        tasks.send_password_reset.enqueue(
+            user_id=context["user"].pk,
+            email=to_email,
+            domain=context["domain"],
+            site_name=context["site_name"],
+            protocol=context["protocol"],
+            subject_template_name=subject_template_name,
+            email_template_name=email_template_name,
+            html_email_template_name=html_email_template_name,
+            from_email=from_email,
+        )
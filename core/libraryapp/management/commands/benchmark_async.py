@@ -0,0 +1,169 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from types import ModuleType
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from core import urls as root_urls
+from libraryapp.models import Book
+from libraryapp.urls import async_urlpatterns
+
+
+def async_urlconf():
+    """The project's URLs with the async versions of the library pages."""
+    # a module rather than a namespace: the URL resolver cache needs it hashable
+    urlconf = ModuleType("async_urls")
+    urlconf.urlpatterns = [
+        path("", include((async_urlpatterns(), "libraryapp")))
+        if getattr(pattern, "app_name", None) == "libraryapp" else pattern
+        for pattern in root_urls.urlpatterns
+    ]
+    return urlconf
+
+
+def split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Palygina sinchroninių rodinių per WSGI ir asinchroninių per ASGI pralaidumą, "
+        "kai užklausos siunčiamos lygiagrečiai (serveriai paleidžiami šiame procese)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="Užklausų skaičius kiekvienam režimui.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Kiek užklausų vykdoma vienu metu.")
+        parser.add_argument(
+            "--url", action="append", dest="urls",
+            help="Tikrinamas adresas (galima kartoti); numatytieji – katalogas ir knygos puslapis.",
+        )
+        parser.add_argument(
+            "--page-cache", action="store_true",
+            help="Palikti įjungtą anoniminių puslapių podėlį (kitaip matuojamas tikras puslapių kūrimas).",
+        )
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+
+        if settings.LIBRARY_ASYNC_VIEWS:
+            raise CommandError("Paleiskite be LIBRARY_ASYNC_VIEWS: sinchroninis režimas turi naudoti sinchroninius rodinius.")
+        urls = options["urls"]
+        if not urls:
+            book = Book.objects.order_by("pk").first()
+            if book is None:
+                raise CommandError("Katalogas tuščias.")
+            urls = ["/", "/?page=2&order=year", f"/book/{book.pk}/"]
+
+        overrides = {} if options["page_cache"] else {"LIBRARY_PAGE_CACHE_TIMEOUT": 0}
+        total, concurrency = options["requests"], options["concurrency"]
+        with override_settings(**overrides):
+            results = {
+                "WSGI, sync": self.run_wsgi(urls, total, concurrency),
+                "ASGI, sync": asyncio.run(self.run_asgi(urls, total, concurrency)),
+            }
+            with override_settings(ROOT_URLCONF=async_urlconf()):
+                results["ASGI, async"] = asyncio.run(self.run_asgi(urls, total, concurrency))
+
+        self.stdout.write(f"{total} užklausų, {concurrency} lygiagrečiai: {', '.join(urls)}")
+        for name, (elapsed, latencies, errors) in results.items():
+            latencies.sort()
+            self.stdout.write(
+                f"{name:12} {total / elapsed:8.1f} užkl./s  "
+                f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+                f"p95 {latencies[int(len(latencies) * .95) - 1] * 1000:7.1f} ms  "
+                f"klaidų {errors}"
+            )
+
+    def run_wsgi(self, urls, total, concurrency):
+        handler = WSGIHandler()
+
+        def request(url):
+            parts = urlsplit(url)
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": parts.path, "QUERY_STRING": parts.query,
+                "SERVER_NAME": "localhost", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+                "wsgi.input": BytesIO(), "wsgi.url_scheme": "http", "wsgi.errors": BytesIO(),
+            }
+            status = []
+            body = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            b"".join(body)
+            body.close()
+            return status[0].startswith("200")
+
+        def worker(offset, count):
+            try:
+                return self.timed(request, [urls[(offset + i) % len(urls)] for i in range(count)])
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            parts = list(pool.map(worker, range(concurrency), split(total, concurrency)))
+        return self.merge(time.perf_counter() - start, parts)
+
+    async def run_asgi(self, urls, total, concurrency):
+        handler = ASGIHandler()
+
+        async def request(url):
+            parts = urlsplit(url)
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                "method": "GET", "scheme": "http", "path": parts.path,
+                "raw_path": parts.path.encode(), "query_string": parts.query.encode(),
+                "root_path": "", "headers": [(b"host", b"localhost")],
+                "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+            }
+            sent = []
+            received = False
+
+            async def receive():
+                nonlocal received
+                if received:
+                    # no disconnect: wait until the handler cancels us
+                    await asyncio.Future()
+                received = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+
+            await handler(scope, receive, send)
+            return sent[0]["status"] == 200
+
+        async def worker(offset, count):
+            latencies, errors = [], 0
+            for i in range(count):
+                start = time.perf_counter()
+                ok = await request(urls[(offset + i) % len(urls)])
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+            return latencies, errors
+
+        start = time.perf_counter()
+        parts = await asyncio.gather(*(
+            worker(offset, count) for offset, count in enumerate(split(total, concurrency))
+        ))
+        return self.merge(time.perf_counter() - start, parts)
+
+    def timed(self, request, urls):
+        latencies, errors = [], 0
+        for url in urls:
+            start = time.perf_counter()
+            ok = request(url)
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+        return latencies, errors
+
+    def merge(self, elapsed, parts):
+        latencies = [latency for part, _ in parts for latency in part]
+        return elapsed, latencies, sum(errors for _, errors in parts)
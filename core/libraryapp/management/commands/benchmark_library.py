@@ -0,0 +1,183 @@
+import json
+import math
+import re
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from libraryapp.models import Author, Book, Genre, UserBookStatus
+from libraryapp.pagination import KeysetPaginator
+from libraryapp.views import BookListView
+
+QUERIES = re.compile(r'desc="(\d+) queries')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted ``values``."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Matuoja katalogo, knygos, įvertinimo ir profilio puslapių trukmę (p50/p95/p99) ir SQL "
+        "užklausų skaičių per Django testų klientą ir palygina su išsaugotu atskaitos tašku. "
+        "Leiskite su seed_library duomenimis; įvertinimo scenarijus keičia vieno skaitytojo įvertinimą."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30, help="Matavimų skaičius kiekvienam scenarijui.")
+        parser.add_argument("--warmup", type=int, default=3, help="Nematuojamų užklausų skaičius prieš matavimą.")
+        parser.add_argument(
+            "--baseline", default="benchmark_baseline.json",
+            help="Atskaitos taško JSON failas, su kuriuo lyginama.",
+        )
+        parser.add_argument("--save", action="store_true", help="Įrašyti šiuos rezultatus kaip atskaitos tašką.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="Leistinas p95 pablogėjimas (0.2 = 20 %%), kol tai laikoma regresija.",
+        )
+        parser.add_argument("--fail", action="store_true", help="Baigti su klaida, jei rasta regresijų.")
+        parser.add_argument(
+            "--page-cache", action="store_true",
+            help="Palikti įjungtą anoniminių puslapių podėlį (kitaip matuojamas tikras puslapių kūrimas).",
+        )
+        parser.add_argument("--only", action="append", help="Matuoti tik scenarijus, kurių pavadinime yra šis tekstas.")
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        if options["only"]:
+            scenarios = [s for s in scenarios if any(part in s[0] for part in options["only"])]
+        if not scenarios:
+            raise CommandError("Nėra ką matuoti: sugeneruokite duomenis su seed_library.")
+
+        overrides = {"LIBRARY_SERVER_TIMING": True, "LIBRARY_QUERY_BUDGET_STRICT": False}
+        if not options["page_cache"]:
+            overrides["LIBRARY_PAGE_CACHE_TIMEOUT"] = 0
+        with override_settings(**overrides):
+            results = {
+                name: self.measure(method, url, data, user, options["iterations"], options["warmup"])
+                for name, method, url, data, user in scenarios
+            }
+
+        path = Path(options["baseline"])
+        baseline = json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+        regressions = self.report(results, baseline, options["tolerance"])
+
+        if options["save"]:
+            path.write_text(json.dumps({
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "database": connection.vendor,
+                "books": Book.objects.count(),
+                "iterations": options["iterations"],
+                "results": results,
+            }, indent=2, ensure_ascii=False), encoding="utf-8")
+            self.stdout.write(f"Atskaitos taškas įrašytas į {path}")
+        if regressions and options["fail"]:
+            raise CommandError("Regresijos: " + ", ".join(regressions))
+
+    def scenarios(self):
+        """(name, method, url, data, user) of every measured request."""
+        books = Book.objects.count()
+        if not books:
+            return []
+        list_url = reverse("libraryapp:book_list")
+        last_page = math.ceil(books / BookListView.paginate_by)
+        middle = Book.objects.order_by("title", "pk")[books // 2]
+        cursor = KeysetPaginator(None, BookListView.paginate_by, ("title", "pk")).encode(middle, "next")
+        genre = Genre.objects.annotate(n=Count("books")).order_by("-n").first()
+        author = Author.objects.annotate(n=Count("books")).order_by("-n").first()
+        # the most rated book and one of its readers
+        book = Book.objects.order_by("-rating_count", "pk").first()
+        status = UserBookStatus.objects.filter(book=book, status="read").select_related("user").first()
+        reader = status.user if status else User.objects.order_by("pk").first()
+
+        scenarios = [
+            ("katalogas", "get", list_url, {}, None),
+            ("katalogas: metai", "get", list_url, {"year_from": 1950, "year_to": 1990, "order": "year"}, None),
+            ("katalogas: paieška", "get", list_url, {"q": middle.title.split()[0]}, None),
+            ("katalogas: gilus puslapis", "get", list_url, {"page": max(1, last_page // 2)}, None),
+            ("katalogas: paskutinis puslapis", "get", list_url, {"page": last_page}, None),
+            ("katalogas: gilus žymeklis", "get", list_url, {"cursor": cursor}, None),
+            ("knyga", "get", reverse("libraryapp:book_detail", args=[book.pk]), {}, None),
+        ]
+        if genre:
+            scenarios.insert(1, ("katalogas: žanras", "get", list_url, {"genre": genre.pk}, None))
+        if author:
+            scenarios.insert(2, ("katalogas: autorius", "get", list_url, {"author": author.name.split()[-1]}, None))
+        if reader:
+            scenarios += [
+                ("knyga (prisijungus)", "get", reverse("libraryapp:book_detail", args=[book.pk]), {}, reader),
+                ("profilis", "get", reverse("libraryapp:profile"), {}, reader),
+            ]
+        if status:
+            # last: a write bumps versions the pages above depend on
+            scenarios.append(("įvertinimas", "post", reverse("libraryapp:rate_book", args=[book.pk]), None, reader))
+        return scenarios
+
+    def measure(self, method, url, data, user, iterations, warmup):
+        client = Client()
+        if user:
+            client.force_login(user)
+        latencies, queries, errors = [], [], 0
+        for i in range(warmup + iterations):
+            # alternate the stars so every rating request is a real update
+            params = {"stars": 3 + i % 2} if data is None else data
+            start = time.perf_counter()
+            response = getattr(client, method)(url, params)
+            elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            match = QUERIES.search(response.get("Server-Timing", ""))
+            queries.append(int(match.group(1)) if match else 0)
+            errors += response.status_code >= 400
+
+        latencies.sort()
+        return {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "queries": statistics.median_low(queries),
+            "errors": errors,
+        }
+
+    def report(self, results, baseline, tolerance):
+        """Print the results next to the baseline; returns the names of regressed scenarios."""
+        previous = (baseline or {}).get("results", {})
+        if baseline and baseline.get("books") != Book.objects.count():
+            self.stdout.write(self.style.WARNING(
+                f"Atskaitos taškas matuotas su {baseline.get('books')} knygų, dabar {Book.objects.count()}."
+            ))
+
+        self.stdout.write(f"{'scenarijus':32} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'užkl.':>6}  palyginimas")
+        regressions = []
+        for name, result in results.items():
+            line = (
+                f"{name:32} {result['p50']:8.1f} {result['p95']:8.1f} {result['p99']:8.1f} {result['queries']:6}"
+            )
+            base = previous.get(name)
+            notes = []
+            if result["errors"]:
+                notes.append(f"klaidų {result['errors']}")
+            if base:
+                change = (result["p95"] - base["p95"]) / base["p95"] if base["p95"] else 0.0
+                notes.append(f"p95 {change:+.0%}")
+                if result["queries"] != base["queries"]:
+                    notes.append(f"užklausų {base['queries']} -> {result['queries']}")
+                if change > tolerance or result["queries"] > base["queries"]:
+                    regressions.append(name)
+            if result["errors"] and name not in regressions:
+                regressions.append(name)
+
+            text = f"{line}  {', '.join(notes)}"
+            self.stdout.write(self.style.ERROR(text) if name in regressions else text)
+        return regressions
@@ -0,0 +1,196 @@
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import sqlite_tuning
+
+# no models at module level: spawned worker processes import this module
+# before Django is set up
+
+# measured requests: kind -> label
+KINDS = {"catalogue": "katalogas", "book": "knyga", "rate": "įvertinimas"}
+
+# mode -> (journal mode of the file, connection OPTIONS)
+MODES = {
+    "default": ("DELETE", {}),
+    "tuned": ("WAL", sqlite_tuning.config()),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, round(p / 100 * len(values)) - 1)] if values else 0.0
+
+
+def worker(path, options, duration, write_ratio, seed, reader_id, read_book_ids, book_ids):
+    """
+    One worker process: a reader browsing the catalogue and book pages and
+    rating books they read, for ``duration`` seconds against the SQLite file
+    at ``path``. Returns (kind, seconds) per request and a Counter of errors.
+    """
+    # the imports need Django set up, which a spawned process has not done yet
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.test.utils import override_settings
+    from django.urls import reverse
+
+    # a fresh connection to the copy, in this process only
+    try:
+        del connections[DEFAULT_DB_ALIAS]
+    except AttributeError:
+        pass  # spawned: nothing connected yet
+    connections.settings[DEFAULT_DB_ALIAS] = {
+        **connections.settings[DEFAULT_DB_ALIAS], "NAME": path, "OPTIONS": options,
+    }
+
+    # failed requests and query budgets are counted below, not logged one by one
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    logging.getLogger("libraryapp.performance").setLevel(logging.ERROR)
+    rng = random.Random(seed)
+    timings, errors = [], Counter()
+    with override_settings(LIBRARY_PAGE_CACHE_TIMEOUT=0, LIBRARY_QUERY_BUDGET_STRICT=False, LIBRARY_DATABASE_REPLICAS=[]):
+        client = Client()
+        client.force_login(User.objects.get(pk=reader_id))
+        pages = max(1, len(book_ids) // 20)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                kind, method = "rate", client.post
+                url = reverse("libraryapp:rate_book", args=[rng.choice(read_book_ids)])
+                data = {"stars": rng.randint(1, 5)}
+            elif rng.random() < 0.5:
+                kind, method = "catalogue", client.get
+                url, data = reverse("libraryapp:book_list"), {"page": rng.randint(1, min(pages, 50))}
+            else:
+                kind, method = "book", client.get
+                url, data = reverse("libraryapp:book_detail", args=[rng.choice(book_ids)]), {}
+            start = time.perf_counter()
+            try:
+                response = method(url, data)
+                if response.status_code >= 500:
+                    errors[f"HTTP {response.status_code}"] += 1
+                    continue
+            except Exception as error:
+                errors[f"{type(error).__name__}: {error}"] += 1
+                continue
+            timings.append((kind, time.perf_counter() - start))
+    connections.close_all()
+    return timings, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Palygina numatytojo ir suderinto (SQLITE_TUNED: WAL, mmap, busy_timeout, BEGIN IMMEDIATE) "
+        "SQLite režimų skaitymo ir rašymo pralaidumą, kai katalogą naršo ir knygas vertina keli "
+        "procesai vienu metu. Matuojama su pagrindinės duomenų bazės kopija, ji pati nekeičiama."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Lygiagrečių procesų (gunicorn darbuotojų) skaičius.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Kiek sekundžių matuoti kiekvieną režimą.")
+        parser.add_argument(
+            "--write-ratio", type=float, default=0.2,
+            help="Kokia užklausų dalis yra įvertinimai (rašymai).",
+        )
+        parser.add_argument("--mode", action="append", choices=MODES, dest="modes", help="Matuojamas režimas (galima kartoti).")
+        parser.add_argument("--seed", type=int, default=1, help="Atsitiktinių skaičių sėkla.")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != "sqlite" or primary.is_in_memory_db():
+            raise CommandError("Pagrindinė duomenų bazė turi būti SQLite failas.")
+        readers, book_ids = self.sample(options["workers"], options["seed"])
+
+        results = {}
+        for mode in options["modes"] or list(MODES):
+            journal_mode, connection_options = MODES[mode]
+            directory = tempfile.mkdtemp(prefix="benchmark_sqlite_")
+            try:
+                path = os.path.join(directory, "db.sqlite3")
+                self.copy(primary, path, journal_mode)
+                results[mode] = self.run(path, connection_options, readers, book_ids, options)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+        self.report(results, options)
+
+    def sample(self, workers, seed):
+        """A reader with read books for every worker, and the books to browse."""
+        from libraryapp.models import Book, UserBookStatus
+
+        read = defaultdict(list)
+        for user_id, book_id in UserBookStatus.objects.filter(status="read").values_list("user_id", "book_id")[:50_000]:
+            read[user_id].append(book_id)
+        if not read:
+            raise CommandError("Nėra skaitytojų su perskaitytomis knygomis: sugeneruokite duomenis su seed_library.")
+        rng = random.Random(seed)
+        user_ids = sorted(read)
+        readers = [(user_id, read[user_id]) for user_id in rng.sample(user_ids, min(workers, len(user_ids)))]
+        # more workers than readers: some share one
+        readers = [readers[i % len(readers)] for i in range(workers)]
+        return readers, list(Book.objects.values_list("pk", flat=True)[:50_000])
+
+    def copy(self, primary, path, journal_mode):
+        primary.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            primary.connection.backup(target)
+            target.execute(f"PRAGMA journal_mode={journal_mode}")
+        finally:
+            target.close()
+
+    def run(self, path, connection_options, readers, book_ids, options):
+        # forked workers must not share the parent's connections
+        connections.close_all()
+        jobs = [
+            (path, connection_options, options["duration"], options["write_ratio"],
+             options["seed"] + i, reader_id, read_book_ids, book_ids)
+            for i, (reader_id, read_book_ids) in enumerate(readers)
+        ]
+        with multiprocessing.Pool(len(jobs)) as pool:
+            outcomes = pool.starmap(worker, jobs)
+
+        timings, errors = defaultdict(list), Counter()
+        for worker_timings, worker_errors in outcomes:
+            for kind, seconds in worker_timings:
+                timings[kind].append(seconds * 1000)
+            errors.update(worker_errors)
+        return {
+            kind: {
+                "per_second": len(timings[kind]) / options["duration"],
+                "p50": statistics.median(timings[kind]) if timings[kind] else 0.0,
+                "p95": percentile(timings[kind], 95),
+            }
+            for kind in KINDS
+        } | {"errors": errors}
+
+    def report(self, results, options):
+        self.stdout.write(
+            f"{options['workers']} procesai, {options['duration']:.0f} s, rašymų dalis {options['write_ratio']:.0%}"
+        )
+        self.stdout.write(f"{'režimas':10} {'užklausa':12} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for mode, result in results.items():
+            for kind, label in KINDS.items():
+                timing = result[kind]
+                self.stdout.write(
+                    f"{mode:10} {label:12} {timing['per_second']:8.1f} {timing['p50']:8.1f} {timing['p95']:8.1f}"
+                )
+            errors = result["errors"]
+            if errors:
+                self.stdout.write(self.style.ERROR(f"{mode:10} klaidų: {sum(errors.values())}"))
+                for error, count in errors.most_common(3):
+                    self.stdout.write(f"    {count}x {error[:100]}")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from libraryapp import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Perskaičiuoja „skaitytojams, kuriems patiko ši knyga, patiko ir“ sąrašus visoms knygoms. "
+        "Nauji įvertinimai juos atnaujina fone; šią komandą verta leisti kas naktį, pvz. per cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=recommendations.CHUNK_SIZE,
+            help="Kiek knygų sąrašų įrašyti viena transakcija.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(done, total):
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{done}/{total} knygų, {time.perf_counter() - start:.1f} s")
+
+        books, changed = recommendations.rebuild(options["batch_size"], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Knygų: {books}, pasikeitė sąrašų: {changed}, užtruko {time.perf_counter() - start:.1f} s"
+        ))
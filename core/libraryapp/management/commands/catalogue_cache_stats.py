@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from libraryapp import catalogue_cache
+
+
+class Command(BaseCommand):
+    help = "Parodo katalogo užklausų podėlio pataikymų ir praleidimų skaičių."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Po parodymo išvalyti skaitiklius.")
+
+    def handle(self, *args, **options):
+        stats = catalogue_cache.stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_ratio={stats['hit_ratio']:.2%}"
+        )
+        if options["reset"]:
+            catalogue_cache.reset_stats()
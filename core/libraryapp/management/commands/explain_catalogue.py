@@ -0,0 +1,68 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from libraryapp.models import Book, Genre, Rating, UserBookStatus
+from libraryapp.views import BookListView
+
+# index names in SQLite and PostgreSQL plans
+INDEX_PATTERNS = [
+    re.compile(r"USING (?:COVERING )?INDEX (\w+)"),
+    re.compile(r"Index (?:Only )?Scan (?:Backward )?using (\w+)"),
+    re.compile(r"Bitmap Index Scan on (\w+)"),
+]
+# full table scans
+SCAN_PATTERNS = [
+    re.compile(r"^.*\bSCAN (\w+)$", re.M),
+    re.compile(r"Seq Scan on (\w+)"),
+]
+
+
+class Command(BaseCommand):
+    help = "Paleidžia EXPLAIN kiekvienai katalogo rodinių užklausai ir parodo, ar naudojami indeksai."
+
+    def handle(self, *args, **options):
+        book = Book.objects.order_by("pk").first()
+        genre = Genre.objects.order_by("pk").first()
+        user = User.objects.order_by("pk").first()
+        book_id = book.pk if book else 0
+        user_id = user.pk if user else 0
+
+        for name, queryset in self.queries(book_id, genre.pk if genre else 0, user_id):
+            plan = queryset.explain()
+            indexes = sorted({
+                match.group(1) for pattern in INDEX_PATTERNS
+                for match in pattern.finditer(plan)
+            })
+            scans = sorted({match.group(1) for pattern in SCAN_PATTERNS for match in pattern.finditer(plan)})
+
+            if scans:
+                status = self.style.WARNING(f"FULL SCAN {', '.join(scans)}")
+            else:
+                status = self.style.SUCCESS("OK")
+            self.stdout.write(f"{name}: {status} indeksai: {', '.join(indexes) or '—'}")
+            if options["verbosity"] > 1:
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+
+    def catalogue(self, **params):
+        view = BookListView()
+        view.setup(RequestFactory().get("/", params))
+        return view.get_queryset()
+
+    def queries(self, book_id, genre_id, user_id):
+        yield "book_list: pavadinimas", self.catalogue()
+        yield "book_list: metai nuo-iki", self.catalogue(year_from=1900, year_to=2000, order="year")
+        yield "book_list: žanras", self.catalogue(genre=genre_id)
+        yield "book_list: autorius", self.catalogue(author="a")
+        yield "book_detail", Book.objects.filter(pk=book_id)
+        yield "book_detail: įvertinimai", Rating.objects.filter(book_id=book_id).order_by("-created_at")
+        yield "rate_book: ar perskaityta", UserBookStatus.objects.filter(
+            user_id=user_id, book_id=book_id, status="read"
+        )
+        yield "profile: knygos pagal statusą", UserBookStatus.objects.filter(
+            user_id=user_id, status="read"
+        ).select_related("book").order_by("-created_at")
+        yield "profile: įvertinimų skaičius", Rating.objects.filter(user_id=user_id).order_by()
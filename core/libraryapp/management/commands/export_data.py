@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from libraryapp import export
+
+
+class Command(BaseCommand):
+    help = "Eksportuoja knygas, įvertinimus arba skaitymo statusus į CSV ar JSONL (srautu, be viso rinkinio atmintyje)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(export.DATASETS), help="Duomenų rinkinys.")
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="csv", help="Failo formatas.")
+        parser.add_argument("--output", "-o", default="-", help="Failas (numatytasis – standartinė išvestis).")
+        parser.add_argument("--gzip", action="store_true", help="Suspausti gzip.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000,
+            help="Kiek eilučių skaityti viena užklausa.",
+        )
+
+    def handle(self, *args, **options):
+        chunks = export.stream(
+            options["dataset"], options["format"],
+            compress=options["gzip"], chunk_size=options["chunk_size"],
+        )
+        if options["output"] == "-":
+            for chunk in chunks:
+                self.stdout.buffer.write(chunk)
+            self.stdout.flush()
+            return
+
+        size = 0
+        with open(options["output"], "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        self.stderr.write(f"Įrašyta {size} B į {options['output']}")
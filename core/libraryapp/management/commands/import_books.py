@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from libraryapp import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Importuoja knygas iš CSV arba JSONL failo (gali būti suspaustas .gz). "
+        "Stulpeliai: isbn, title, author, year, genres (atskirti „|“), description. "
+        "Knygos su tuo pačiu ISBN atnaujinamos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV arba JSONL failas.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Failo formatas (pagal plėtinį, jei nenurodyta).")
+        parser.add_argument("--database", default="default", help="Duomenų bazės alias.")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Kiek eilučių įrašyti vienoje transakcijoje.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Kontrolinio taško failas (numatytasis <path>.checkpoint).",
+        )
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Tęsti nuo paskutinio kontrolinio taško.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.isfile(path):
+            raise CommandError(f"Failas nerastas: {path}")
+        fmt = options["format"] or importer.detect_format(path)
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+
+        # rows already committed by an earlier run
+        done = self.read_checkpoint(checkpoint, path) if options["resume"] else 0
+        if done:
+            self.stdout.write(f"Tęsiama nuo {done} eilutės")
+
+        books = importer.Importer(using=options["database"])
+        skipped = 0
+        position = done
+        start = time.perf_counter()
+
+        def clean(rows, first):
+            nonlocal skipped
+            for number, raw in enumerate(rows, start=first):
+                try:
+                    yield importer.clean_row(raw)
+                except importer.RowError as error:
+                    skipped += 1
+                    self.stderr.write(f"Eilutė {number} praleista: {error}")
+
+        with importer.open_feed(path) as lines:
+            rows = islice(importer.read_rows(lines, fmt), done, None)
+            for chunk in importer.chunked(rows, options["batch_size"]):
+                books.import_chunk(clean(chunk, position + 1))
+                position += len(chunk)
+                self.write_checkpoint(checkpoint, path, position)
+
+                elapsed = time.perf_counter() - start
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{position} eil. ({(position - done) / elapsed:.0f} eil./s)"
+                    )
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.perf_counter() - start
+        processed = position - done
+        self.stdout.write(self.style.SUCCESS(
+            f"Sukurta: {books.created}, atnaujinta: {books.updated}, nepakito: {books.unchanged}, "
+            f"praleista: {skipped}; "
+            f"{processed} eil. per {elapsed:.1f} s ({processed / elapsed if elapsed else 0:.0f} eil./s)"
+        ))
+
+    def read_checkpoint(self, checkpoint, path):
+        if not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint, encoding="utf-8") as f:
+            state = json.load(f)
+        # the offset counts rows of that exact file: skipping them in another would lose rows
+        saved = {key: state.get(key) for key in ("path", "size", "mtime")}
+        if saved != importer.fingerprint(path):
+            raise CommandError(
+                f"Kontrolinis taškas {checkpoint} skirtas kitam arba pakeistam failui; "
+                "importuokite be --resume arba ištrinkite kontrolinį tašką."
+            )
+        return state["rows"]
+
+    def write_checkpoint(self, checkpoint, path, rows):
+        # written after each committed chunk; replace() keeps it whole on a crash
+        with open(f"{checkpoint}.tmp", "w", encoding="utf-8") as f:
+            json.dump({**importer.fingerprint(path), "rows": rows}, f)
+        os.replace(f"{checkpoint}.tmp", checkpoint)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from libraryapp import covers
+from libraryapp.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Sukuria sumažintas viršelių kopijas (JPEG ir WebP) knygoms, kurių viršeliai "
+        "dar neapdoroti. Galima leisti fone, pvz. per cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Apdoroti visus viršelius, ne tik naujus.",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Perrašyti jau sukurtas kopijas.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Kiek knygų nuskaityti viena užklausa.",
+        )
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover="").exclude(cover=None).only("cover", "cover_hash", "cover_width", "title")
+        if not (options["all"] or options["force"]):
+            books = books.filter(cover_hash="")
+
+        processed = failed = written = 0
+        last_pk = 0
+        while True:
+            batch = list(books.filter(pk__gt=last_pk).order_by("pk")[:options["batch_size"]])
+            if not batch:
+                break
+            for book in batch:
+                try:
+                    written += covers.process(book, force=options["force"])
+                    processed += 1
+                except (OSError, ValueError) as error:
+                    # missing or unreadable files must not stop the rest
+                    failed += 1
+                    self.stderr.write(f"„{book.title}“ (#{book.pk}): {error}")
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Apdorota viršelių: {processed}, nepavyko: {failed}, įrašyta {written / 1024:.0f} KB"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from libraryapp.models import Book
+
+
+class Command(BaseCommand):
+    help = "Perskaičiuoja knygų įvertinimų suvestines (rating_count, rating_sum, avg_rating)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Kiek knygų atnaujinti vienoje transakcijoje.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        books = Book.objects.order_by("pk").values_list("pk", flat=True)
+
+        updated = 0
+        last_pk = 0
+        while True:
+            ids = list(books.filter(pk__gt=last_pk)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Book.refresh_rating_stats(ids)
+            last_pk = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Atnaujinta knygų: {updated}"))
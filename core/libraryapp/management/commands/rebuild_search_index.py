@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from libraryapp import catalogue_cache, search
+
+
+class Command(BaseCommand):
+    help = "Iš naujo sukuria knygų pilnojo teksto paieškos indeksą."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Duomenų bazės alias.")
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Kiek knygų indeksuoti vienu kartu.",
+        )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend(options["database"])
+        with transaction.atomic(using=options["database"]):
+            backend.install()
+            indexed = backend.rebuild(batch_size=options["batch_size"])
+        catalogue_cache.bump("books", "authors", "genres")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Suindeksuota knygų: {indexed} ({type(backend).__name__})"
+        ))
@@ -0,0 +1,70 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from libraryapp import tasks
+from libraryapp.models import Task
+
+
+class Command(BaseCommand):
+    help = "Vykdo fonines užduotis (el. laiškai, viršelių apdorojimas ir kt.) iš duomenų bazės eilės."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Įvykdyti visas laukiančias užduotis ir baigti.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Kiek sekundžių laukti, kai eilė tuščia.",
+        )
+        parser.add_argument(
+            "--stale-after", type=int, default=600,
+            help="Po kiek sekundžių be gyvybės signalo „vykdoma“ užduotis laikoma pamesta ir grąžinama į eilę.",
+        )
+        parser.add_argument(
+            "--keep-days", type=int, default=7,
+            help="Kiek dienų laikyti atliktas užduotis.",
+        )
+
+    def handle(self, *args, **options):
+        if options["stale_after"] <= 2 * getattr(settings, "LIBRARY_TASKS_HEARTBEAT", 30):
+            raise CommandError("--stale-after turi būti bent dvigubai ilgesnis už LIBRARY_TASKS_HEARTBEAT.")
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        stale_after = timedelta(seconds=options["stale_after"])
+
+        requeued = tasks.requeue_stale(stale_after)
+        purged, _ = Task.objects.filter(
+            status=Task.DONE, finished_at__lt=timezone.now() - timedelta(days=options["keep_days"])
+        ).delete()
+        self.stdout.write(f"Vykdytojas {worker}: grąžinta į eilę {requeued}, išvalyta {purged}")
+
+        done = failed = 0
+        last_check = time.monotonic()
+        try:
+            while True:
+                task_row = tasks.claim(worker)
+                if task_row is None:
+                    if options["once"]:
+                        break
+                    close_old_connections()
+                    time.sleep(options["interval"])
+                else:
+                    if tasks.run(task_row):
+                        done += 1
+                    else:
+                        failed += 1
+
+                if time.monotonic() - last_check > options["stale_after"]:
+                    tasks.requeue_stale(stale_after)
+                    last_check = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Atlikta: {done}, nepavyko: {failed}"))
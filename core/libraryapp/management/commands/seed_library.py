@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from libraryapp.seed import Seeder
+
+# books, authors, genres, readers, books per reader (average)
+SCALES = {
+    "small": (1_000, 300, 15, 200, 15),
+    "medium": (20_000, 4_000, 30, 5_000, 25),
+    "large": (200_000, 30_000, 60, 50_000, 40),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Sugeneruoja sintetinius duomenis apkrovos testams: autorius, žanrus, knygas, "
+        "skaitytojus, jų statusus ir įvertinimus. Duomenys pridedami prie esamų."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small", help="Duomenų kiekio rinkinys.")
+        parser.add_argument("--books", type=int, help="Knygų skaičius (keičia --scale reikšmę).")
+        parser.add_argument("--authors", type=int, help="Autorių skaičius.")
+        parser.add_argument("--genres", type=int, help="Žanrų skaičius.")
+        parser.add_argument("--users", type=int, help="Skaitytojų skaičius.")
+        parser.add_argument("--per-user", type=int, help="Vidutiniškai knygų vienam skaitytojui.")
+        parser.add_argument("--seed", type=int, help="Atsitiktinių skaičių sėkla (pakartojamiems duomenims).")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Kiek eilučių įrašyti viena užklausa.")
+
+    def handle(self, *args, **options):
+        books, authors, genres, users, per_user = SCALES[options["scale"]]
+        start = time.perf_counter()
+        seeder = Seeder(options["seed"], options["batch_size"], self.stdout if options["verbosity"] >= 2 else None)
+        counts = seeder.run(
+            books=options["books"] if options["books"] is not None else books,
+            authors=max(1, options["authors"] or authors),
+            genres=max(1, options["genres"] or genres),
+            users=options["users"] if options["users"] is not None else users,
+            per_user=max(1, options["per_user"] or per_user),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Sukurta: " + ", ".join(f"{name} {count}" for name, count in counts.items())
+            + f" per {time.perf_counter() - start:.1f} s"
+        ))
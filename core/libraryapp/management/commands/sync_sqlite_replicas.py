@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy(primary, replica):
+    """Copy the primary SQLite database over the replica's file (SQLite backup API)."""
+    primary.ensure_connection()
+    target = sqlite3.connect(replica.settings_dict["NAME"])
+    try:
+        primary.connection.backup(target)
+    finally:
+        target.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Nukopijuoja pagrindinę SQLite duomenų bazę į SQLite replikas (DATABASE_REPLICA_URLS), "
+        "kad skaitymą iš replikų būtų galima išbandyti vietoje. Tarp kopijavimų replika "
+        "atsilieka nuo pagrindinės DB kaip tikra replika."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every", type=float,
+            help="Kopijuoti pakartotinai kas tiek sekundžių (kol nutraukiama), o ne vieną kartą.",
+        )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        aliases = getattr(settings, "LIBRARY_DATABASE_REPLICAS", [])
+        if not aliases:
+            raise CommandError("Replikų nėra: nurodykite DATABASE_REPLICA_URLS.")
+        if any(connections[alias].vendor != "sqlite" for alias in [DEFAULT_DB_ALIAS, *aliases]):
+            raise CommandError("Kopijuoti galima tik SQLite duomenų bazes.")
+
+        while True:
+            start = time.perf_counter()
+            for alias in aliases:
+                connections[alias].close()
+                copy(primary, connections[alias])
+            self.stdout.write(
+                f"Nukopijuota į {', '.join(aliases)} per {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from libraryapp.models import Task
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Parodo foninių užduočių eilės būseną ir vėlavimą (laukimo ir vykdymo laiką)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=24,
+            help="Už kiek paskutinių valandų skaičiuoti atliktas užduotis.",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for row in Task.objects.values("status").annotate(n=Count("id"), oldest=Min("run_at")).order_by("status"):
+            line = f"{row['status']}: {row['n']}"
+            if row["status"] == Task.QUEUED:
+                line += f" (seniausia laukia {max(0, (now - row['oldest']).total_seconds()):.0f} s)"
+            self.stdout.write(line)
+
+        timings = {}
+        for name, created_at, run_at, started_at, finished_at in Task.objects.filter(
+            status=Task.DONE, finished_at__gte=now - timedelta(hours=options["hours"])
+        ).values_list("name", "created_at", "run_at", "started_at", "finished_at").iterator():
+            wait, run = timings.setdefault(name, ([], []))
+            wait.append((started_at - max(created_at, run_at)).total_seconds() * 1000)
+            run.append((finished_at - started_at).total_seconds() * 1000)
+
+        for name, (wait, run) in sorted(timings.items()):
+            self.stdout.write(
+                f"{name}: {len(run)} atlikta; laukimas p50 {percentile(wait, .5):.0f} ms, "
+                f"p95 {percentile(wait, .95):.0f} ms; vykdymas p50 {percentile(run, .5):.0f} ms, "
+                f"p95 {percentile(run, .95):.0f} ms"
+            )
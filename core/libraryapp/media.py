@@ -0,0 +1,151 @@
+# ##### media files #####
+# Uploaded covers and their derivatives under MEDIA_URL, in production too
+# (django.views.static is meant for development only). Files are streamed with
+# FileResponse, answer single byte ranges (Range, If-Range) and conditional
+# requests (If-None-Match, If-Modified-Since). Content-hashed derivatives are
+# cacheable for a year and immutable; originals are revalidated through their
+# ETag. With LIBRARY_MEDIA_ACCEL the front proxy sends the bytes instead
+# (nginx X-Accel-Redirect, Apache/lighttpd X-Sendfile): the worker only checks
+# the file and sets headers, which also suits ASGI, where a FileResponse is
+# read in a thread chunk by chunk.
+import mimetypes
+import re
+import stat
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from . import covers
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """``length`` bytes of ``file`` from its current position, for FileResponse."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    (first, last) byte of a satisfiable single range, or None for the whole
+    file: no Range, a stale If-Range or a form this view does not split up
+    (several ranges) all get the full response.
+    """
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range not in (etag, http_date(last_modified)):
+        return None
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if end < start and last:
+            return None
+    else:
+        # "bytes=-500": the last 500 bytes
+        start, end = max(0, size - int(last)), size - 1
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def cache_control(name):
+    if name.startswith(covers.DERIVED_DIR + "/"):
+        return {"public": True, "max_age": covers.IMMUTABLE_MAX_AGE, "immutable": True}
+    # originals can be replaced under the same name: revalidate, a 304 is cheap
+    return {"public": True, "no_cache": True}
+
+
+def accel_response(name, fullpath, content_type):
+    accel = getattr(settings, "LIBRARY_MEDIA_ACCEL", "")
+    if accel == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, "LIBRARY_MEDIA_ACCEL_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = quote(prefix.rstrip("/") + "/" + name)
+        return response
+    if accel == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        # percent-encoded like the nginx URI (mod_xsendfile unescapes it by default)
+        response["X-Sendfile"] = quote(str(fullpath))
+        return response
+    return None
+
+
+@require_safe
+def serve(request, path):
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404("Failas nerastas")
+    name = Path(path).as_posix()
+    if any(part.startswith(".") for part in Path(path).parts):
+        raise Http404("Failas nerastas")
+    try:
+        info = fullpath.stat()
+    except OSError:
+        raise Http404("Failas nerastas")
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404("Failas nerastas")
+
+    etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+    last_modified = int(info.st_mtime)
+    headers = {"ETag": etag, "Last-Modified": http_date(last_modified), "Accept-Ranges": "bytes"}
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(fullpath.name)
+        content_type = content_type or "application/octet-stream"
+        response = accel_response(name, fullpath, content_type)
+    if response is None:
+        try:
+            requested = byte_range(request, info.st_size, etag, last_modified)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{info.st_size}"
+        else:
+            file = fullpath.open("rb")
+            if requested is None:
+                response = FileResponse(file, content_type=content_type)
+            else:
+                start, end = requested
+                file.seek(start)
+                response = FileResponse(FileRange(file, end - start + 1), status=206, content_type=content_type)
+                response["Content-Range"] = f"bytes {start}-{end}/{info.st_size}"
+                response["Content-Length"] = end - start + 1
+
+    for header, value in headers.items():
+        response[header] = value
+    patch_cache_control(response, **cache_control(name))
+    return response
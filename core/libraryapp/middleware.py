@@ -0,0 +1,209 @@
+# ##### request instrumentation #####
+# Counts SQL queries, SQL time, duplicated statements (N+1 suspects) and
+# template render time per request, reports them in a Server-Timing header
+# and a log line, and checks them against per-view query budgets.
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import replicas
+
+logger = logging.getLogger("libraryapp.performance")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """execute_wrapper callable collecting every statement's SQL and duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Statements run more than once with the same SQL (parameters aside)."""
+        return {sql: n for sql, n in self.statements.items() if n > 1}
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, recorder)
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # connections belong to the thread the async ORM runs queries in
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, start)
+
+    def wrap_connections(self, stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def finish(self, request, response, recorder, start):
+        total = time.perf_counter() - start
+
+        metrics = {
+            "view": request.resolver_match.view_name if request.resolver_match else None,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": recorder.count,
+            "duplicate_queries": sum(n - 1 for n in recorder.duplicates.values()),
+            "db_ms": round(recorder.duration * 1000, 2),
+            "render_ms": round(getattr(request, "_render_time", 0.0) * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+        }
+
+        if getattr(settings, "LIBRARY_SERVER_TIMING", False):
+            response["Server-Timing"] = (
+                f'db;dur={metrics["db_ms"]};desc="{metrics["queries"]} queries, '
+                f'{metrics["duplicate_queries"]} duplicate", '
+                f'render;dur={metrics["render_ms"]}, '
+                f'total;dur={metrics["total_ms"]}'
+            )
+        logger.info(
+            " ".join(f"{name}=%s" for name in metrics), *metrics.values(),
+            extra={"performance": metrics},
+        )
+        self.check_budget(metrics, recorder)
+        return response
+
+    def process_template_response(self, request, response):
+        # TemplateResponses are rendered right after this hook
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def check_budget(self, metrics, recorder):
+        budget = getattr(settings, "LIBRARY_QUERY_BUDGETS", {}).get(metrics["view"])
+        if budget is None or metrics["queries"] <= budget:
+            return
+
+        message = (
+            f"{metrics['view']} ran {metrics['queries']} queries, budget is {budget} "
+            f"({metrics['duplicate_queries']} duplicate)"
+        )
+        for sql, n in sorted(recorder.duplicates.items(), key=lambda item: -item[1]):
+            message += f"\n  {n}x {sql}"
+        if getattr(settings, "LIBRARY_QUERY_BUDGET_STRICT", False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra={"performance": metrics})
+
+
+# ##### static files #####
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that also runs natively under ASGI, so async views behind it
+    are not pushed into a thread per request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+# ##### read replicas #####
+class ReplicaPinningMiddleware:
+    """
+    Routes the request's reads (replicas.py): to the primary when the pinning
+    cookie of a recent write is present, otherwise to a replica until the
+    request writes. A request that wrote sets the cookie.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replicas.begin(pinned=replicas.COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = replicas.end(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        # the state object is shared with the threads sync_to_async runs queries in
+        token = replicas.begin(pinned=replicas.COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = replicas.end(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote and getattr(settings, "LIBRARY_DATABASE_REPLICAS", None):
+            response.set_cookie(
+                replicas.COOKIE, "1", max_age=getattr(settings, "LIBRARY_REPLICA_PIN_SECONDS", 5),
+                httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:43
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_stats(apps, schema_editor):
+    Book = apps.get_model("libraryapp", "Book")
+    Rating = apps.get_model("libraryapp", "Rating")
+
+    ratings = Rating.objects.filter(book=models.OuterRef("pk")).order_by().values("book")
+    Book.objects.update(
+        rating_count=Coalesce(models.Subquery(ratings.annotate(n=models.Count("id")).values("n")), 0),
+        rating_sum=Coalesce(models.Subquery(ratings.annotate(s=models.Sum("stars")).values("s")), 0),
+        avg_rating=models.Subquery(
+            ratings.annotate(a=models.Avg("stars")).values("a"), output_field=models.FloatField()
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0005_alter_author_options_alter_book_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='avg_rating',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Vid. įvertinimas'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Įvertinimų skaičius'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Įvertinimų suma'),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from libraryapp import search
+
+    backend = search.get_backend(schema_editor.connection.alias)
+    backend.install()
+    backend.rebuild(apps.get_model("libraryapp", "Book"))
+
+
+def uninstall_search_index(apps, schema_editor):
+    from libraryapp import search
+
+    search.get_backend(schema_editor.connection.alias).uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0006_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
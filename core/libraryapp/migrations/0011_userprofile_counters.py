@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:54
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    UserProfile = apps.get_model("libraryapp", "UserProfile")
+    UserBookStatus = apps.get_model("libraryapp", "UserBookStatus")
+    Rating = apps.get_model("libraryapp", "Rating")
+
+    statuses = UserBookStatus.objects.filter(user=models.OuterRef("user")).order_by().values("user")
+    ratings = Rating.objects.filter(user=models.OuterRef("user")).order_by().values("user")
+
+    def count(queryset):
+        return Coalesce(models.Subquery(queryset.annotate(n=models.Count("id")).values("n")), 0)
+
+    UserProfile.objects.update(
+        read_count=count(statuses.filter(status="read")),
+        reading_count=count(statuses.filter(status="reading")),
+        want_count=count(statuses.filter(status="want")),
+        rated_count=count(ratings),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0010_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='rated_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Įvertinta'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='read_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Perskaityta'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='reading_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Skaitoma'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='want_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Norima perskaityti'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0011_userprofile_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_hash',
+            field=models.CharField(blank=True, editable=False, max_length=20, verbose_name='Viršelio maiša'),
+        ),
+    ]
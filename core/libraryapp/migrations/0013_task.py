@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0012_book_cover_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Užduotis')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='Argumentai')),
+                ('status', models.CharField(choices=[('queued', 'Laukia'), ('running', 'Vykdoma'), ('done', 'Atlikta'), ('failed', 'Nepavyko')], default='queued', max_length=10, verbose_name='Statusas')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Bandymai')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='Daugiausia bandymų')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Vykdyti nuo')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Sukurta')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Pradėta')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Baigta')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Vykdytojas')),
+                ('last_error', models.TextField(blank=True, verbose_name='Paskutinė klaida')),
+            ],
+            options={
+                'verbose_name': 'Foninė užduotis',
+                'verbose_name_plural': 'Foninės užduotys',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0013_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Panašumas')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='libraryapp.book', verbose_name='Knyga')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='libraryapp.book', verbose_name='Panaši knyga')),
+            ],
+            options={
+                'verbose_name': 'Panaši knyga',
+                'verbose_name_plural': 'Panašios knygos',
+                'indexes': [models.Index(fields=['book', '-score'], name='similarity_book_score_idx')],
+            },
+        ),
+    ]
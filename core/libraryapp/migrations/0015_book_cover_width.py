@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0014_book_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_width',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Viršelio plotis'),
+        ),
+    ]
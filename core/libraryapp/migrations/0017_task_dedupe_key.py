@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0016_remove_book_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='dedupe_key',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True, verbose_name='Dublikatų raktas'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:18
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0017_task_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='author',
+            name='author_name_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_title_lower_idx',
+        ),
+    ]
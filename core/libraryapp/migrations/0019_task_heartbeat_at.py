@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libraryapp', '0018_remove_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Gyvybės signalas'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 # ##### django models #####
 from django.db import models
+from django.db.models.functions import Coalesce, Now
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Author(models.Model):
@@ -29,6 +31,15 @@ class Genre(models.Model):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    # columns rendered by a catalogue card in book_list.html
+    CATALOGUE_FIELDS = ("title", "year", "cover", "cover_hash", "cover_width", "avg_rating", "updated_at", "author__name")
+
+    def for_catalogue(self):
+        """Books with just the card columns and their author fetched in the same query."""
+        return self.select_related("author").only(*self.CATALOGUE_FIELDS)
+
+
 class Book(models.Model):
     title = models.CharField("Pavadinimas", max_length=200)
     author = models.ForeignKey(
@@ -41,15 +52,57 @@ class Book(models.Model):
     )
     description = models.TextField("Aprašymas", blank=True, null=True)
     cover = models.ImageField("Viršelis", upload_to="covers/", blank=True, null=True)
+    # content hash naming the resized copies of the cover (see covers.py); blank until made
+    cover_hash = models.CharField("Viršelio maiša", max_length=20, blank=True, editable=False)
+    # the original's width in pixels; copies are not made wider than it (0: not known)
+    cover_width = models.PositiveIntegerField("Viršelio plotis", default=0, editable=False)
+
+    # denormalized rating aggregates, kept in sync by signals (see signals.py)
+    rating_count = models.PositiveIntegerField("Įvertinimų skaičius", default=0, editable=False)
+    rating_sum = models.PositiveIntegerField("Įvertinimų suma", default=0, editable=False)
+    avg_rating = models.FloatField("Vid. įvertinimas", null=True, blank=True, editable=False)
+
+    # bumped whenever anything shown on the book's card or page changes
+    updated_at = models.DateTimeField("Atnaujinta", auto_now=True)
+
+    objects = BookQuerySet.as_manager()
 
     class Meta:
         ordering = ["title"]
+        indexes = [
+            # catalogue sort keys (order, title, id), also serving year ranges
+            models.Index(fields=["title", "id"], name="book_title_idx"),
+            models.Index(fields=["year", "title", "id"], name="book_year_title_idx"),
+        ]
         verbose_name = "Knyga"
         verbose_name_plural = "Knygos"
 
     def __str__(self):
         return f"{self.title} ({self.author})"
 
+    @classmethod
+    def refresh_rating_stats(cls, book_ids=None):
+        """Recompute rating aggregates from the Rating table in a single UPDATE."""
+        ratings = Rating.objects.filter(book=models.OuterRef("pk")).order_by().values("book")
+        count = ratings.annotate(n=models.Count("id")).values("n")
+        total = ratings.annotate(s=models.Sum("stars")).values("s")
+        average = ratings.annotate(a=models.Avg("stars")).values("a")
+
+        books = cls.objects.all()
+        if book_ids is not None:
+            books = books.filter(pk__in=book_ids)
+        return books.update(
+            rating_count=Coalesce(models.Subquery(count), 0),
+            rating_sum=Coalesce(models.Subquery(total), 0),
+            avg_rating=models.Subquery(average, output_field=models.FloatField()),
+            updated_at=Now(),
+        )
+
+    @classmethod
+    def touch(cls, book_ids):
+        """Mark books as changed without saving them (e.g. their author was renamed)."""
+        return cls.objects.filter(pk__in=book_ids).update(updated_at=Now())
+
 
 class UserBookStatus(models.Model):
     STATUS_CHOICES = [
@@ -69,6 +122,10 @@ class UserBookStatus(models.Model):
 
     class Meta:
         unique_together = ("user", "book")
+        indexes = [
+            # profile: a user's books with one status, newest first
+            models.Index(fields=["user", "status", "-created_at"], name="status_user_status_idx"),
+        ]
         verbose_name = "Knygos statusas"
         verbose_name_plural = "Knygų statusai"
 
@@ -88,6 +145,12 @@ class Rating(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["book", "user"], name="unique_user_book_rating")
         ]
+        indexes = [
+            # book page: its ratings, newest first
+            models.Index(fields=["book", "-created_at"], name="rating_book_created_idx"),
+            # profile: ratings counted per user
+            models.Index(fields=["user", "stars"], name="rating_user_stars_idx"),
+        ]
         ordering = ["-created_at"]
         verbose_name = "Įvertinimas"
         verbose_name_plural = "Įvertinimai"
@@ -103,9 +166,96 @@ class UserProfile(models.Model):
     birth_year = models.PositiveIntegerField("Gimimo metai", null=True, blank=True)
     city = models.CharField("Miestas", max_length=100, blank=True)
 
+    # reading counters, kept in sync by signals (see signals.py)
+    read_count = models.PositiveIntegerField("Perskaityta", default=0, editable=False)
+    reading_count = models.PositiveIntegerField("Skaitoma", default=0, editable=False)
+    want_count = models.PositiveIntegerField("Norima perskaityti", default=0, editable=False)
+    rated_count = models.PositiveIntegerField("Įvertinta", default=0, editable=False)
+
     class Meta:
         verbose_name = "Vartotojo profilis"
         verbose_name_plural = "Vartotojų profiliai"
 
     def __str__(self):
         return f"Profilis: {self.user.username}"
+
+    def status_count(self, status):
+        return getattr(self, f"{status}_count")
+
+    @classmethod
+    def refresh_counters(cls, user_ids):
+        """Recompute the reading counters of the given users in a single UPDATE."""
+        statuses = UserBookStatus.objects.filter(user=models.OuterRef("user")).order_by().values("user")
+        ratings = Rating.objects.filter(user=models.OuterRef("user")).order_by().values("user")
+
+        def count(queryset):
+            return Coalesce(models.Subquery(queryset.annotate(n=models.Count("id")).values("n")), 0)
+
+        return cls.objects.filter(user__in=user_ids).update(
+            read_count=count(statuses.filter(status="read")),
+            reading_count=count(statuses.filter(status="reading")),
+            want_count=count(statuses.filter(status="want")),
+            rated_count=count(ratings),
+        )
+
+
+class BookSimilarity(models.Model):
+    """A precomputed "readers who liked this also liked" neighbour (see recommendations.py)."""
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="similarities", verbose_name="Knyga")
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+", verbose_name="Panaši knyga")
+    score = models.FloatField("Panašumas")
+
+    class Meta:
+        indexes = [
+            # book page: a book's neighbours, best first
+            models.Index(fields=["book", "-score"], name="similarity_book_score_idx"),
+        ]
+        verbose_name = "Panaši knyga"
+        verbose_name_plural = "Panašios knygos"
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.score:.3f})"
+
+
+class Task(models.Model):
+    """A queued call of a function registered with @tasks.task, run by `manage.py run_worker`."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Laukia"),
+        (RUNNING, "Vykdoma"),
+        (DONE, "Atlikta"),
+        (FAILED, "Nepavyko"),
+    ]
+
+    name = models.CharField("Užduotis", max_length=100)
+    kwargs = models.JSONField("Argumentai", default=dict, blank=True)
+    status = models.CharField("Statusas", max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField("Bandymai", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Daugiausia bandymų", default=5)
+    run_at = models.DateTimeField("Vykdyti nuo", default=timezone.now)
+    created_at = models.DateTimeField("Sukurta", auto_now_add=True)
+    started_at = models.DateTimeField("Pradėta", null=True, blank=True)
+    # refreshed by the worker while the task runs; a stale one means the worker died
+    heartbeat_at = models.DateTimeField("Gyvybės signalas", null=True, blank=True)
+    finished_at = models.DateTimeField("Baigta", null=True, blank=True)
+    worker = models.CharField("Vykdytojas", max_length=100, blank=True)
+    last_error = models.TextField("Paskutinė klaida", blank=True)
+    # set on queued unique tasks only (a hash of the call), so the same call is queued once
+    dedupe_key = models.CharField("Dublikatų raktas", max_length=40, null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # the worker's next due task
+            models.Index(fields=["status", "run_at"], name="task_status_run_at_idx"),
+        ]
+        ordering = ["-created_at"]
+        verbose_name = "Foninė užduotis"
+        verbose_name_plural = "Foninės užduotys"
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
@@ -0,0 +1,108 @@
+# ##### anonymous page cache #####
+# Whole rendered pages for anonymous visitors, keyed on the normalized query
+# string and on versions of the data they show. Logged-in users always get a
+# fresh page; their templates still reuse the cached book fragments.
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+def get_cache():
+    return caches[getattr(settings, "LIBRARY_PAGE_CACHE_ALIAS", "views")]
+
+
+def get_timeout():
+    return getattr(settings, "LIBRARY_PAGE_CACHE_TIMEOUT", 60)
+
+
+def is_cacheable(request):
+    return (
+        request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+        and not len(messages.get_messages(request))
+    )
+
+
+class AnonymousPageCacheMixin:
+    """Serve anonymous GETs from the page cache; subclasses define get_page_version()."""
+
+    def get_page_version(self):
+        """Anything that changes when the page content does; None disables caching."""
+        raise NotImplementedError
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["fragment_cache_timeout"] = getattr(settings, "LIBRARY_FRAGMENT_CACHE_TIMEOUT", 3600)
+        return context
+
+    def get_page_cache_key(self, version):
+        raw = repr((self.request.path, version))
+        return "page:" + hashlib.sha1(raw.encode()).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return self.finish_private(request, super().dispatch(request, *args, **kwargs))
+
+        version = self.get_page_version()
+        if version is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_page_cache_key(version)
+        cached = get_cache().get(key)
+        if cached is not None:
+            response = self.cached_response(cached)
+        else:
+            response = self.store(key, super().dispatch(request, *args, **kwargs))
+        return self.finish_public(response)
+
+    def finish_private(self, request, response):
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True)
+        return response
+
+    def finish_public(self, response):
+        patch_cache_control(response, public=True, max_age=get_timeout())
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+    def cached_response(self, cached):
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def store(self, key, response):
+        def store(response):
+            if response.status_code == 200 and not response.cookies:
+                get_cache().set(key, (response.content, response["Content-Type"]), get_timeout())
+
+        # template responses are stored once they have been rendered
+        if hasattr(response, "render") and callable(response.render):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+
+class AsyncAnonymousPageCacheMixin(AnonymousPageCacheMixin):
+    """The same for async views: the session and version lookups run off the event loop."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        view_dispatch = super(AnonymousPageCacheMixin, self).dispatch
+        if not await sync_to_async(is_cacheable)(request):
+            return self.finish_private(request, await view_dispatch(request, *args, **kwargs))
+
+        version = await sync_to_async(self.get_page_version)()
+        if version is None:
+            return await view_dispatch(request, *args, **kwargs)
+
+        key = self.get_page_cache_key(version)
+        cached = await get_cache().aget(key)
+        if cached is not None:
+            response = self.cached_response(cached)
+        else:
+            response = self.store(key, await view_dispatch(request, *args, **kwargs))
+        return self.finish_public(response)
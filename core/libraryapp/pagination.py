@@ -0,0 +1,135 @@
+# ##### pagination #####
+# Paginators that avoid COUNT queries. CountedPaginator takes a size that is
+# already known. KeysetPaginator serves cursor pages for the catalogue: instead
+# of COUNT + OFFSET every page is a single "rows after/before this sort key"
+# query, so deep pages cost the same as the first one. Cursors are signed,
+# opaque query string tokens.
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from django.http import Http404
+
+CURSOR_SALT = "libraryapp.pagination.cursor"
+
+
+class CountedPaginator(Paginator):
+    """Paginator for lists whose size is already known (e.g. a stored counter), skipping COUNT."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by the unique sort key ``fields`` (ascending, the
+    last one must be unique, e.g. the primary key). Nullable fields sort first.
+    """
+
+    def __init__(self, queryset, per_page, fields):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = fields
+
+    def encode(self, obj, direction):
+        key = [getattr(obj, field) for field in self.fields]
+        return signing.dumps({"k": key, "d": direction}, salt=CURSOR_SALT, compress=True)
+
+    def decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            key, direction = data["k"], data["d"]
+        except (signing.BadSignature, KeyError, TypeError):
+            raise Http404("Neteisingas puslapio žymeklis.")
+        if direction not in ("next", "previous") or len(key) != len(self.fields):
+            raise Http404("Neteisingas puslapio žymeklis.")
+        return key, direction
+
+    def page(self, cursor=None):
+        queryset, came_from, forward = self.page_query(cursor)
+        rows = list(queryset)
+        return self._page(rows, has_more=len(rows) > self.per_page, came_from=came_from, forward=forward)
+
+    async def apage(self, cursor=None):
+        queryset, came_from, forward = self.page_query(cursor)
+        rows = [row async for row in queryset.aiterator()]
+        return self._page(rows, has_more=len(rows) > self.per_page, came_from=came_from, forward=forward)
+
+    def page_query(self, cursor):
+        """(rows of the page plus one, whether we came from another page, direction)"""
+        if not cursor:
+            return self.ordered(forward=True)[:self.per_page + 1], False, True
+
+        key, direction = self.decode(cursor)
+        forward = direction == "next"
+        queryset = self.ordered(forward).filter(self.beyond(key, forward))[:self.per_page + 1]
+        return queryset, True, forward
+
+    def ordered(self, forward):
+        if forward:
+            ordering = [F(f).asc(nulls_first=True) for f in self.fields]
+        else:
+            ordering = [F(f).desc(nulls_last=True) for f in self.fields]
+        return self.queryset.order_by(*ordering)
+
+    def beyond(self, key, forward):
+        """Rows strictly after (forward) or before ``key`` in the sort order."""
+        condition = Q(pk__in=[])
+        for i, (field, value) in enumerate(zip(self.fields, key)):
+            step = self._step(field, value, forward)
+            if step is None:
+                continue
+            for prev_field, prev_value in zip(self.fields[:i], key[:i]):
+                if prev_value is None:
+                    step &= Q(**{f"{prev_field}__isnull": True})
+                else:
+                    step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    @staticmethod
+    def _step(field, value, forward):
+        # NULLs sort before every value
+        if value is None:
+            return Q(**{f"{field}__isnull": False}) if forward else None
+        if forward:
+            return Q(**{f"{field}__gt": value})
+        return Q(**{f"{field}__lt": value}) | Q(**{f"{field}__isnull": True})
+
+    def _page(self, rows, has_more, came_from, forward):
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        if not rows:
+            return KeysetPage([])
+
+        # walking forward we came from a previous page; walking back we came from a next one
+        has_next = has_more if forward else came_from
+        has_previous = came_from if forward else has_more
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode(rows[-1], "next") if has_next else None,
+            previous_cursor=self.encode(rows[0], "previous") if has_previous else None,
+        )
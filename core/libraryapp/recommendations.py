@@ -0,0 +1,194 @@
+# ##### recommendations #####
+# "Readers who liked this also liked": item-to-item collaborative filtering
+# over ratings and read statuses. Every book is a sparse vector of reader
+# weights and its neighbours are the books with the highest cosine similarity
+# to it, damped when only a few readers are shared. They are computed offline
+# (`manage.py build_recommendations`, nightly) and stored in BookSimilarity, so
+# the book page reads them with one indexed query. In between, a new rating or
+# read status queues a refresh of that book's list alone (one pending task per
+# book, however many votes arrive); the lists of the reader's other books
+# catch up with the next rebuild.
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Book, BookSimilarity, Rating, UserBookStatus
+
+# how much a rating says the reader liked the book; low stars count against it
+STAR_WEIGHTS = {1: -1.0, 2: -0.5, 3: 0.25, 4: 0.75, 5: 1.0}
+# read but not rated
+READ_WEIGHT = 0.5
+# similarity * shared / (shared + SHRINKAGE): one shared reader proves little
+SHRINKAGE = 3
+# ids per IN (...) list and books written per transaction
+CHUNK_SIZE = 500
+
+
+def top_k():
+    return getattr(settings, "LIBRARY_SIMILAR_BOOKS", 6)
+
+
+def chunks(ids, size=CHUNK_SIZE):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class Matrix:
+    """Sparse book x reader weights, indexed both ways."""
+
+    def __init__(self):
+        self.by_book = defaultdict(dict)
+        self.by_user = defaultdict(dict)
+        self.norms = {}
+
+    @classmethod
+    def full(cls):
+        matrix = cls()
+        matrix.load()
+        return matrix
+
+    @classmethod
+    def around(cls, book_ids, max_readers=None, max_candidates=None):
+        """
+        Just what scoring ``book_ids`` needs: their readers, everything those
+        readers read, and every reader of those books (for the norms). With
+        the limits, candidates come from the ``max_readers`` readers who read
+        or rated the books most recently, and just the ``max_candidates``
+        books they share most are scored, so a popular book does not load
+        half the database.
+        """
+        matrix = cls()
+        matrix.load_in("book_id", book_ids)
+        readers = list(matrix.by_user)
+        if max_readers and len(readers) > max_readers:
+            readers = [user_id for user_id in latest_readers(book_ids, max_readers) if user_id in matrix.by_user]
+        matrix.load_in("user_id", readers)
+
+        shared = Counter(other for user_id in readers for other in matrix.by_user[user_id])
+        for book_id in book_ids:
+            shared.pop(book_id, None)
+        candidates = [other for other, _ in shared.most_common(max_candidates)]
+        # books left out hold a partial column, which would inflate their score
+        keep = set(book_ids).union(candidates)
+        for row in matrix.by_user.values():
+            for other in row.keys() - keep:
+                del row[other]
+        for other in matrix.by_book.keys() - keep:
+            del matrix.by_book[other]
+        matrix.load_in("book_id", candidates)
+        return matrix
+
+    def load(self, **filters):
+        # a rating overrides the plain read status of the same book
+        weights = {}
+        statuses = UserBookStatus.objects.filter(status="read", **filters).values_list("user_id", "book_id")
+        for user_id, book_id in statuses.iterator(chunk_size=2000):
+            weights[user_id, book_id] = READ_WEIGHT
+        ratings = Rating.objects.filter(**filters).values_list("user_id", "book_id", "stars")
+        for user_id, book_id, stars in ratings.iterator(chunk_size=2000):
+            weights[user_id, book_id] = STAR_WEIGHTS.get(stars, 0.0)
+
+        for (user_id, book_id), weight in weights.items():
+            if weight:
+                self.by_book[book_id][user_id] = weight
+                self.by_user[user_id][book_id] = weight
+
+    def load_in(self, field, ids):
+        for chunk in chunks(ids):
+            self.load(**{f"{field}__in": chunk})
+
+    def norm(self, book_id):
+        if book_id not in self.norms:
+            self.norms[book_id] = math.sqrt(sum(w * w for w in self.by_book[book_id].values()))
+        return self.norms[book_id]
+
+    def neighbours(self, book_id, k):
+        """The ``k`` most similar books as (score, book id), best first."""
+        readers = self.by_book.get(book_id)
+        if not readers:
+            return []
+
+        # sparse dot products: only books sharing a reader get a score
+        dots = defaultdict(float)
+        shared = defaultdict(int)
+        for user_id, weight in readers.items():
+            for other, other_weight in self.by_user[user_id].items():
+                dots[other] += weight * other_weight
+                shared[other] += 1
+        dots.pop(book_id, None)
+
+        norm = self.norm(book_id)
+        return heapq.nlargest(k, (
+            (dot / (norm * self.norm(other)) * shared[other] / (shared[other] + SHRINKAGE), other)
+            for other, dot in dots.items() if dot > 0
+        ))
+
+
+def latest_readers(book_ids, limit):
+    """Up to ``limit`` readers of ``book_ids``, the latest to mark one read or rate it first."""
+    latest = {}
+    for model, filters in ((UserBookStatus, {"status": "read"}), (Rating, {})):
+        for chunk in chunks(book_ids):
+            rows = (
+                model.objects.filter(book_id__in=chunk, **filters)
+                .order_by("-created_at").values_list("user_id", "created_at")[:limit]
+            )
+            for user_id, created_at in rows:
+                latest[user_id] = max(latest.get(user_id, created_at), created_at)
+    return heapq.nlargest(limit, latest, key=latest.get)
+
+
+def store(matrix, book_ids, k=None):
+    """
+    Write the neighbours of ``book_ids`` whose ranking changed and touch those
+    books, so their cached pages show the new list. Returns how many changed.
+    """
+    k = k or top_k()
+    current = defaultdict(list)
+    for book_id, similar_id in (
+        BookSimilarity.objects.filter(book_id__in=book_ids)
+        .order_by("book_id", "-score", "-similar_id").values_list("book_id", "similar_id")
+    ):
+        current[book_id].append(similar_id)
+
+    changed, rows = [], []
+    for book_id in book_ids:
+        neighbours = matrix.neighbours(book_id, k)
+        if [other for _, other in neighbours] != current.get(book_id, []):
+            changed.append(book_id)
+            rows += [BookSimilarity(book_id=book_id, similar_id=other, score=score) for score, other in neighbours]
+
+    if changed:
+        with transaction.atomic():
+            BookSimilarity.objects.filter(book_id__in=changed).delete()
+            BookSimilarity.objects.bulk_create(rows)
+            Book.touch(changed)
+    return len(changed)
+
+
+def rebuild(batch_size=CHUNK_SIZE, progress=None):
+    """Recompute every book's neighbours; returns (books, changed)."""
+    matrix = Matrix.full()
+    book_ids = list(Book.objects.values_list("pk", flat=True))
+    changed = done = 0
+    for chunk in chunks(book_ids, batch_size):
+        changed += store(matrix, chunk)
+        done += len(chunk)
+        if progress:
+            progress(done, len(book_ids))
+    return len(book_ids), changed
+
+
+def refresh(book_ids):
+    """Recompute the neighbours of ``book_ids`` only; returns how many changed."""
+    book_ids = set(Book.objects.filter(pk__in=book_ids).values_list("pk", flat=True))
+    matrix = Matrix.around(
+        book_ids,
+        max_readers=getattr(settings, "LIBRARY_RECOMMENDATIONS_MAX_READERS", 1000),
+        max_candidates=getattr(settings, "LIBRARY_RECOMMENDATIONS_MAX_CANDIDATES", 500),
+    )
+    return sum(store(matrix, chunk) for chunk in chunks(book_ids))
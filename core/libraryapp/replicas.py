@@ -0,0 +1,131 @@
+# ##### read replicas #####
+# Reads go to one of the replica databases (DATABASE_REPLICA_URLS, see
+# settings.py), writes to the primary. A replica is a little behind, so:
+#   - a request that wrote reads from the primary for the rest of the request,
+#     and its response sets a short-lived cookie that keeps the reader's next
+#     requests on the primary (LIBRARY_REPLICA_PIN_SECONDS): after rating a
+#     book they see their rating, after logging in their session;
+#   - background tasks act on rows just committed and read the primary too;
+#   - a replica that does not answer, or lags more than LIBRARY_REPLICA_MAX_LAG
+#     seconds, is skipped until its next check (LIBRARY_REPLICA_CHECK_INTERVAL).
+# Cached catalogue pages and id lists can be built from replica rows and so may
+# briefly trail the primary, by at most the lag allowed here.
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger("libraryapp.replicas")
+
+COOKIE = "library_primary"
+
+
+class RoutingState:
+    """Routing of one request (or task): the replica it reads and whether it is pinned."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_state = contextvars.ContextVar("library_routing", default=None)
+
+
+def begin(pinned=False):
+    return _state.set(RoutingState(pinned))
+
+
+def end(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block."""
+    token = begin(pinned=True)
+    try:
+        yield
+    finally:
+        end(token)
+
+
+# ##### health #####
+# alias -> (healthy, when it was checked), per process
+_health = {}
+
+
+def check(alias):
+    """True when the replica answers and, on PostgreSQL, is not too far behind."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # NULL on an idle standby that has replayed everything
+                cursor.execute(
+                    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                )
+                lag = cursor.fetchone()[0]
+                if lag > getattr(settings, "LIBRARY_REPLICA_MAX_LAG", 30):
+                    logger.warning("replica %s is %.0f s behind, reading from the primary", alias, lag)
+                    return False
+            else:
+                # a real table: SQLite opens a missing or empty file without complaint
+                cursor.execute("SELECT 1 FROM django_migrations LIMIT 1")
+        return True
+    except DatabaseError as error:
+        logger.warning("replica %s is unavailable: %s", alias, error)
+        connection.close()
+        return False
+
+
+def healthy(alias):
+    ok, checked = _health.get(alias, (True, None))
+    now = time.monotonic()
+    if checked is None or now - checked >= getattr(settings, "LIBRARY_REPLICA_CHECK_INTERVAL", 10):
+        ok = check(alias)
+        _health[alias] = (ok, now)
+    return ok
+
+
+def choose():
+    """A healthy replica alias, or None to read from the primary."""
+    replicas = [alias for alias in getattr(settings, "LIBRARY_DATABASE_REPLICAS", []) if healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+# ##### router #####
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not getattr(settings, "LIBRARY_DATABASE_REPLICAS", None):
+            return None
+        state = _state.get()
+        if state is None:
+            return choose() or DEFAULT_DB_ALIAS
+        if state.pinned:
+            return DEFAULT_DB_ALIAS
+        # one replica per request, so its queries see one consistent snapshot
+        if state.replica is None:
+            state.replica = choose() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in getattr(settings, "LIBRARY_DATABASE_REPLICAS", []):
+            return False
+        return None
@@ -0,0 +1,280 @@
+# ##### full-text search #####
+# Catalogue search over title, author name, genres and description.
+#
+# Text is folded (lower case, diacritics stripped) before it is indexed and
+# before it is queried, so "zalgiris" matches "Žalgiris" on every backend.
+# SQLite uses an FTS5 virtual table, PostgreSQL a weighted tsvector side
+# table with a GIN index; other databases fall back to plain icontains lookups.
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Book
+
+# searchable fields, in order of importance
+FIELDS = ("title", "author", "genres", "description")
+
+_backends = {}
+
+
+def fold(text):
+    """Lower-case text and strip diacritics ("Žalgiris" -> "zalgiris")."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text):
+    return re.findall(r"\w+", fold(text))
+
+
+def book_document(book):
+    """Folded text of every searchable field of a book."""
+    return {
+        "title": fold(book.title),
+        "author": fold(book.author.name),
+        "genres": fold(" ".join(g.name for g in book.genres.all())),
+        "description": fold(book.description),
+    }
+
+
+def reindex(book_ids, using="default"):
+    """Refresh the index entries of the given books, dropping ones that no longer exist."""
+    book_ids = set(book_ids)
+    if not book_ids:
+        return
+    backend = get_backend(using)
+    books = list(
+        Book.objects.using(using).filter(pk__in=book_ids)
+        .select_related("author").prefetch_related("genres")
+    )
+    backend.index_books(books)
+    backend.remove_books(book_ids - {book.pk for book in books})
+
+
+def get_backend(using="default"):
+    if using not in _backends:
+        path = getattr(settings, "LIBRARY_SEARCH_BACKEND", None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = BACKENDS.get(connections[using].vendor, SimpleSearchBackend)
+        _backends[using] = backend_class(using)
+    return _backends[using]
+
+
+class SimpleSearchBackend:
+    """Unindexed fallback: icontains on every field, no ranking."""
+
+    lookups = {
+        "title": "title__icontains",
+        "author": "author__name__icontains",
+        "genres": "genres__name__icontains",
+        "description": "description__icontains",
+    }
+
+    def __init__(self, using="default"):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def search(self, queryset, terms):
+        """
+        Filter ``queryset`` by ``terms``, a mapping of field name (or None for
+        any field) to user input, and annotate ``search_rank`` (higher is better).
+        """
+        condition = Q()
+        for field, text in terms.items():
+            for token in (text or "").split():
+                if field:
+                    condition &= Q(**{self.lookups[field]: token})
+                else:
+                    any_field = Q()
+                    for lookup in self.lookups.values():
+                        any_field |= Q(**{lookup: token})
+                    condition &= any_field
+        if not condition:
+            return queryset
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def index_books(self, books):
+        pass
+
+    def remove_books(self, book_ids):
+        pass
+
+    def rebuild(self, book_model=Book, batch_size=500):
+        return 0
+
+    def _iter_books(self, book_model, batch_size):
+        books = (
+            book_model._default_manager.using(self.using)
+            .select_related("author").prefetch_related("genres").order_by("pk")
+        )
+        last_pk = 0
+        while True:
+            batch = list(books.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            yield batch
+            last_pk = batch[-1].pk
+
+
+class SQLiteSearchBackend(SimpleSearchBackend):
+    """FTS5 virtual table keyed by the book's rowid, ranked with bm25()."""
+
+    table = "libraryapp_book_fts"
+    # bm25() column weights, same order as FIELDS
+    weights = (10.0, 5.0, 2.0, 1.0)
+
+    def match_expression(self, terms):
+        parts = []
+        for field, text in terms.items():
+            prefix = f"{{{field}}} : " if field else ""
+            parts.extend(f'{prefix}"{token}"*' for token in tokenize(text))
+        return " AND ".join(parts)
+
+    def search(self, queryset, terms):
+        match = self.match_expression(terms)
+        if not match:
+            return queryset
+        book_table = queryset.model._meta.db_table
+        weights = ", ".join(str(w) for w in self.weights)
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        ).annotate(search_rank=RawSQL(
+            f"SELECT -bm25({self.table}, {weights}) FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND rowid = {book_table}.id",
+            [match], output_field=FloatField(),
+        ))
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5({', '.join(FIELDS)}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_books(self, books):
+        rows = []
+        for book in books:
+            document = book_document(book)
+            rows.append([book.pk] + [document[f] for f in FIELDS])
+        if not rows:
+            return
+        placeholders = ", ".join(["%s"] * (len(FIELDS) + 1))
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[row[0]] for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(FIELDS)}) VALUES ({placeholders})", rows
+            )
+
+    def remove_books(self, book_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[pk] for pk in book_ids])
+
+    def rebuild(self, book_model=Book, batch_size=500):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+        indexed = 0
+        for batch in self._iter_books(book_model, batch_size):
+            self.index_books(batch)
+            indexed += len(batch)
+        return indexed
+
+
+class PostgreSQLSearchBackend(SimpleSearchBackend):
+    """Weighted tsvector per book in a side table, GIN-indexed, ranked with ts_rank()."""
+
+    table = "libraryapp_book_search"
+    config = "simple"
+    # tsvector weight label per field, same order as FIELDS
+    labels = {"title": "A", "author": "B", "genres": "C", "description": "D"}
+
+    def tsquery(self, terms):
+        parts = []
+        for field, text in terms.items():
+            label = self.labels[field] if field else ""
+            parts.extend(f"{token}:*{label}" for token in tokenize(text))
+        return " & ".join(parts)
+
+    def search(self, queryset, terms):
+        query = self.tsquery(terms)
+        if not query:
+            return queryset
+        book_table = queryset.model._meta.db_table
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT book_id FROM {self.table} WHERE document @@ to_tsquery('{self.config}', %s)", [query]
+        )).annotate(search_rank=RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('{self.config}', %s)) FROM {self.table} "
+            f"WHERE book_id = {book_table}.id",
+            [query], output_field=FloatField(),
+        ))
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"book_id bigint PRIMARY KEY REFERENCES libraryapp_book (id) ON DELETE CASCADE "
+                f"DEFERRABLE INITIALLY DEFERRED, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_document_gin ON {self.table} USING GIN (document)"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_books(self, books):
+        rows = []
+        for book in books:
+            document = book_document(book)
+            rows.append([book.pk] + [document[f] for f in FIELDS])
+        if not rows:
+            return
+        vector = " || ".join(
+            f"setweight(to_tsvector('{self.config}', %s), '{self.labels[f]}')" for f in FIELDS
+        )
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (book_id, document) VALUES (%s, {vector}) "
+                f"ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove_books(self, book_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE book_id = ANY(%s)", [list(book_ids)])
+
+    def rebuild(self, book_model=Book, batch_size=500):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+        indexed = 0
+        for batch in self._iter_books(book_model, batch_size):
+            self.index_books(batch)
+            indexed += len(batch)
+        return indexed
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgreSQLSearchBackend,
+}
@@ -0,0 +1,186 @@
+# ##### synthetic catalogue #####
+# Realistic fake data for load tests and benchmarks (`manage.py seed_library`):
+# authors with a few books each, books spread over two centuries and one to
+# three genres, and readers whose statuses and ratings follow a long tail, a
+# few popular books collecting most of them. Rows are written with
+# bulk_create in batches; bulk writes skip signals, so the denormalized
+# counters, the search index and the cache generations are refreshed at the end.
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import catalogue_cache, search
+from .importer import chunked
+from .models import Author, Book, Genre, Rating, UserBookStatus, UserProfile
+
+GENRES = [
+    "Romanas", "Poezija", "Apsakymai", "Drama", "Istorinis", "Detektyvas", "Fantastika",
+    "Mokslinė fantastika", "Biografija", "Memuarai", "Vaikams", "Jaunimui", "Filosofija",
+    "Istorija", "Kelionės", "Esė", "Humoras", "Siaubo", "Trileris", "Pasakos",
+]
+FIRST_NAMES = [
+    "Jonas", "Ona", "Petras", "Marija", "Antanas", "Ieva", "Juozas", "Rūta", "Kazys",
+    "Birutė", "Vytautas", "Aldona", "Saulius", "Giedrė", "Algirdas", "Eglė", "Rimas", "Jūratė",
+]
+LAST_NAMES = [
+    "Kazlauskas", "Jankauskienė", "Petrauskas", "Stankevičiūtė", "Vasiliauskas", "Žukauskaitė",
+    "Butkus", "Paulauskienė", "Urbonas", "Kavaliauskaitė", "Navickas", "Ramanauskienė",
+    "Baranauskas", "Šimkutė", "Vaitkus", "Mockevičienė", "Grigas", "Lukoševičiūtė",
+]
+TITLE_WORDS = [
+    "Metai", "Žemė", "Sodas", "Vėjas", "Tyla", "Upė", "Miškas", "Namai", "Naktis", "Ruduo",
+    "Šviesa", "Kelias", "Sapnas", "Laikas", "Atmintis", "Giria", "Jūra", "Žiema", "Dangus",
+    "Vakaras", "Pilis", "Laiškai", "Šešėliai", "Paslaptis", "Daina", "Gimtinė", "Duona",
+]
+TITLE_LINKS = ["ir", "be", "po", "už", "prie"]
+STATUSES = [("read", 70), ("reading", 10), ("want", 20)]
+# stars of a rating, skewed the way real ratings are
+STARS = [(1, 5), (2, 8), (3, 20), (4, 35), (5, 32)]
+# share of read books the reader also rated
+RATED_SHARE = 0.8
+ISBN_PREFIX = "seed-"
+USERNAME_PREFIX = "skaitytojas"
+# every seeded reader can log in with it (benchmarks, manual testing)
+PASSWORD = "skaitytojas-123"
+
+
+def next_number(manager, field, prefix):
+    """The number after the highest one already used in ``prefix``-numbered values."""
+    last = (
+        manager.filter(**{f"{field}__startswith": prefix})
+        .order_by(f"-{field}").values_list(field, flat=True).first()
+    )
+    return int(last[len(prefix):]) + 1 if last and last[len(prefix):].isdigit() else 0
+
+
+class Seeder:
+    def __init__(self, seed=None, batch_size=2000, stdout=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def bulk_create(self, model, objects):
+        created = []
+        for batch in chunked(objects, self.batch_size):
+            with transaction.atomic():
+                created += model.objects.bulk_create(batch)
+        return created
+
+    def genres(self, count):
+        names = GENRES[:count] + [f"Žanras {i}" for i in range(len(GENRES) + 1, count + 1)]
+        Genre.objects.bulk_create([Genre(name=name) for name in names], ignore_conflicts=True)
+        return list(Genre.objects.filter(name__in=names).values_list("pk", flat=True))
+
+    def authors(self, count):
+        rnd = self.random
+        return [author.pk for author in self.bulk_create(Author, (
+            Author(
+                name=f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                birth_year=rnd.randint(1750, 2000),
+            )
+            for _ in range(count)
+        ))]
+
+    def title(self):
+        rnd = self.random
+        words = rnd.sample(TITLE_WORDS, 2)
+        return rnd.choice([words[0], f"{words[0]} {rnd.choice(TITLE_LINKS)} {words[1].lower()}"])
+
+    def year(self):
+        # mostly the 20th century; a few books without a known year
+        if self.random.random() < 0.03:
+            return None
+        return min(2025, max(1800, round(self.random.gauss(1965, 40))))
+
+    def books(self, count, author_ids, genre_ids):
+        rnd = self.random
+        start = next_number(Book.objects, "isbn", ISBN_PREFIX)
+        books = self.bulk_create(Book, (
+            Book(
+                title=self.title(),
+                author_id=rnd.choice(author_ids),
+                year=self.year(),
+                isbn=f"{ISBN_PREFIX}{start + i:09d}",
+                description=f"Sugeneruotas knygos aprašymas nr. {start + i}.",
+            )
+            for i in range(count)
+        ))
+
+        # a handful of genres hold most of the books
+        genre_weights = list(accumulate(1 / rank for rank in range(1, len(genre_ids) + 1)))
+        through = Book.genres.through
+        self.bulk_create(through, (
+            through(book_id=book.pk, genre_id=genre_id)
+            for book in books
+            for genre_id in set(rnd.choices(genre_ids, cum_weights=genre_weights, k=rnd.randint(1, 3)))
+        ))
+        return [book.pk for book in books]
+
+    def users(self, count):
+        start = next_number(User.objects, "username", USERNAME_PREFIX)
+        password = make_password(PASSWORD)
+        users = self.bulk_create(User, (
+            User(username=f"{USERNAME_PREFIX}{start + i:06d}", password=password)
+            for i in range(count)
+        ))
+        self.bulk_create(UserProfile, (
+            UserProfile(user=user, city=self.random.choice(["Vilnius", "Kaunas", "Klaipėda", ""]))
+            for user in users
+        ))
+        return [user.pk for user in users]
+
+    def activity(self, user_ids, book_ids, per_user):
+        """Statuses and ratings, popular books (a Zipf-like tail) chosen far more often."""
+        rnd = self.random
+        popularity = list(book_ids)
+        rnd.shuffle(popularity)
+        book_weights = list(accumulate(1 / rank ** 0.8 for rank in range(1, len(popularity) + 1)))
+        status_names, status_weights = zip(*STATUSES)
+        star_values, star_weights = zip(*STARS)
+
+        statuses = ratings = 0
+        # a few hundred readers at a time keep memory flat at any scale
+        for chunk in chunked(user_ids, max(1, self.batch_size // per_user)):
+            new_statuses, new_ratings = [], []
+            for user_id in chunk:
+                count = min(len(popularity), max(1, round(rnd.expovariate(1 / per_user))))
+                for book_id in set(rnd.choices(popularity, cum_weights=book_weights, k=count)):
+                    status = rnd.choices(status_names, status_weights)[0]
+                    new_statuses.append(UserBookStatus(user_id=user_id, book_id=book_id, status=status))
+                    if status == "read" and rnd.random() < RATED_SHARE:
+                        stars = rnd.choices(star_values, star_weights)[0]
+                        new_ratings.append(Rating(user_id=user_id, book_id=book_id, stars=stars))
+            self.bulk_create(UserBookStatus, new_statuses)
+            self.bulk_create(Rating, new_ratings)
+            statuses += len(new_statuses)
+            ratings += len(new_ratings)
+        return statuses, ratings
+
+    def run(self, books, authors, genres, users, per_user):
+        genre_ids = self.genres(genres)
+        author_ids = self.authors(authors)
+        self.log(f"Žanrų: {len(genre_ids)}, autorių: {len(author_ids)}")
+        book_ids = self.books(books, author_ids, genre_ids)
+        self.log(f"Knygų: {len(book_ids)}")
+        user_ids = self.users(users)
+        statuses, ratings = self.activity(user_ids, book_ids, per_user) if book_ids else (0, 0)
+        self.log(f"Skaitytojų: {len(user_ids)}, statusų: {statuses}, įvertinimų: {ratings}")
+
+        # what the signals would have kept in sync
+        for chunk in chunked(book_ids, self.batch_size):
+            Book.refresh_rating_stats(chunk)
+            search.reindex(chunk)
+        for chunk in chunked(user_ids, self.batch_size):
+            UserProfile.refresh_counters(chunk)
+        catalogue_cache.bump("books", "authors", "genres", "ratings")
+        return {
+            "genres": len(genre_ids), "authors": len(author_ids), "books": len(book_ids),
+            "users": len(user_ids), "statuses": statuses, "ratings": ratings,
+        }
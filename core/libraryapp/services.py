@@ -0,0 +1,235 @@
+# ##### reader writes #####
+# Rating a book and marking it as read, each as one native upsert
+# (INSERT ... ON CONFLICT DO UPDATE) instead of a SELECT followed by an INSERT
+# or UPDATE, so concurrent double submits cannot race into IntegrityError.
+# The "read first" rule of ratings is part of the same statement: the row to
+# insert is selected from the reader's read status, so without one nothing is
+# written. The upserts bypass model signals, so the derived data the signals
+# keep in sync is refreshed here: the book's aggregates in the same transaction
+# (the pages show them right away), the reader's counters by a queued task.
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.utils import timezone
+
+from . import catalogue_cache, tasks
+from .models import Book, Rating, UserBookStatus, UserProfile
+
+
+class NotRead(Exception):
+    """Rating a book the reader has not marked as read."""
+
+
+def native_upserts(connection):
+    return (
+        connection.features.supports_update_conflicts_with_target
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def columns(connection, model, *names):
+    return [connection.ops.quote_name(model._meta.get_field(name).column) for name in names]
+
+
+def upsert(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def rate_book(user, book_id, stars):
+    """
+    Save the reader's rating of a book; returns True when it is new. Raises
+    NotRead without a read status and Book.DoesNotExist for an unknown book.
+    """
+    using = router.db_for_write(Rating)
+    connection = connections[using]
+    if not native_upserts(connection):
+        return _rate_book_orm(user, book_id, stars, using)
+
+    quote = connection.ops.quote_name
+    book, reader, rating_stars, created_at = columns(connection, Rating, "book", "user", "stars", "created_at")
+    status_book, status_user, status = columns(connection, UserBookStatus, "book", "user", "status")
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql = (
+        f"INSERT INTO {quote(Rating._meta.db_table)} ({book}, {reader}, {rating_stars}, {created_at}) "
+        f"SELECT {status_book}, {status_user}, %s, %s FROM {quote(UserBookStatus._meta.db_table)} "
+        f"WHERE {status_user} = %s AND {status_book} = %s AND {status} = %s "
+        f"ON CONFLICT ({book}, {reader}) DO UPDATE SET {rating_stars} = EXCLUDED.{rating_stars} "
+        # an updated row keeps its old created_at
+        f"RETURNING {created_at} = %s"
+    )
+    with transaction.atomic(using=using):
+        row = upsert(connection, sql, [stars, now, user.pk, book_id, "read", now])
+        if row is None:
+            if not Book.objects.using(using).filter(pk=book_id).exists():
+                raise Book.DoesNotExist
+            raise NotRead
+        created = bool(row[0])
+        Book.refresh_rating_stats([book_id])
+    catalogue_cache.bump("ratings")
+    if created:
+        tasks.refresh_counters.enqueue(user_ids=[user.pk])
+    tasks.refresh_recommendations.enqueue(book_ids=[book_id])
+    return created
+
+
+def mark_as_read(user, book_id):
+    """Mark a book as read by the reader; returns True when the status is new."""
+    using = router.db_for_write(UserBookStatus)
+    connection = connections[using]
+    if not native_upserts(connection):
+        return _mark_as_read_orm(user, book_id, using)
+
+    quote = connection.ops.quote_name
+    book, reader, status, created_at = columns(connection, UserBookStatus, "book", "user", "status", "created_at")
+    (pk,) = columns(connection, Book, "id")
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    # selecting the book's id makes an unknown book insert nothing
+    sql = (
+        f"INSERT INTO {quote(UserBookStatus._meta.db_table)} ({reader}, {book}, {status}, {created_at}) "
+        f"SELECT %s, {pk}, %s, %s FROM {quote(Book._meta.db_table)} WHERE {pk} = %s "
+        f"ON CONFLICT ({reader}, {book}) DO UPDATE SET {status} = EXCLUDED.{status} "
+        f"RETURNING {created_at} = %s"
+    )
+    with transaction.atomic(using=using):
+        row = upsert(connection, sql, [user.pk, "read", now, book_id, now])
+        if row is None:
+            raise Book.DoesNotExist
+        UserProfile.refresh_counters([user.pk])
+    tasks.refresh_recommendations.enqueue(book_ids=[book_id])
+    return bool(row[0])
+
+
+# databases without ON CONFLICT ... RETURNING: the ORM, with signals doing the rest
+def _rate_book_orm(user, book_id, stars, using):
+    with transaction.atomic(using=using):
+        book = Book.objects.using(using).get(pk=book_id)
+        if not UserBookStatus.objects.using(using).filter(user=user, book=book, status="read").exists():
+            raise NotRead
+        rating, created = Rating.objects.using(using).update_or_create(
+            book=book, user=user, defaults={"stars": stars}
+        )
+    return created
+
+
+def _mark_as_read_orm(user, book_id, using):
+    with transaction.atomic(using=using):
+        book = Book.objects.using(using).get(pk=book_id)
+        status, created = UserBookStatus.objects.using(using).update_or_create(
+            user=user, book=book, defaults={"status": "read"}
+        )
+    return created
+
+
+# ##### batch updates #####
+# Many (book, status, stars) items of one reader at once, e.g. a library moved
+# over from another service: the books are checked with one IN query, every
+# valid item is written with one bulk upsert per table, and the derived data is
+# refreshed once for the whole batch rather than once per row.
+STATUSES = dict(UserBookStatus.STATUS_CHOICES)
+STARS = dict(Rating._meta.get_field("stars").choices)
+# the largest primary key a 64-bit integer column holds
+MAX_BOOK_ID = 2 ** 63 - 1
+
+
+class BatchError(Exception):
+    """A batch that cannot be applied at all (not a list, too many items)."""
+
+
+def clean_item(item):
+    """(book_id, status, stars) of one raw item; raises ValueError with the reason."""
+    if not isinstance(item, dict):
+        raise ValueError("Įrašas turi būti objektas.")
+    book_id, status, stars = item.get("book"), item.get("status"), item.get("stars")
+    # type checks first: a list or dict is not hashable, "in" would raise TypeError
+    if not isinstance(book_id, int) or isinstance(book_id, bool):
+        raise ValueError("Nenurodyta knyga.")
+    if not 0 < book_id <= MAX_BOOK_ID:
+        raise ValueError("Knyga nerasta.")
+    if status is None and stars is None:
+        raise ValueError("Nurodykite statusą arba įvertinimą.")
+    if status is not None and (not isinstance(status, str) or status not in STATUSES):
+        raise ValueError("Neleistinas statusas.")
+    if stars is not None and (not isinstance(stars, int) or isinstance(stars, bool) or stars not in STARS):
+        raise ValueError("Įvertinimas turi būti nuo 1 iki 5.")
+    if stars is not None and status not in (None, "read"):
+        raise ValueError("Įvertinti galima tik perskaitytą knygą.")
+    return book_id, status, stars
+
+
+def apply_batch(user, items):
+    """
+    Apply a reader's items; returns one result dict per item, in order. Invalid
+    items are reported and skipped, the rest are saved in one transaction.
+    """
+    if not isinstance(items, list):
+        raise BatchError("Tikimasi įrašų sąrašo.")
+    limit = getattr(settings, "LIBRARY_BATCH_MAX_ITEMS", 500)
+    if len(items) > limit:
+        raise BatchError(f"Per daug įrašų: daugiausia {limit}.")
+
+    results, cleaned = [], {}
+    for index, item in enumerate(items):
+        try:
+            book_id, status, stars = clean_item(item)
+            if book_id in cleaned:
+                raise ValueError("Knyga šiame sąraše jau yra.")
+        except ValueError as error:
+            results.append({"index": index, "ok": False, "error": str(error)})
+            continue
+        cleaned[book_id] = (index, status, stars)
+        results.append(None)
+
+    using = router.db_for_write(UserBookStatus)
+    with transaction.atomic(using=using):
+        # one query: which books exist and the reader's current status of each
+        current = dict(
+            Book.objects.using(using)
+            .filter(pk__in=cleaned)
+            .annotate(status=models.Subquery(
+                UserBookStatus.objects.filter(user=user, book=models.OuterRef("pk")).values("status")[:1]
+            ))
+            .values_list("pk", "status")
+        )
+
+        statuses, ratings = [], []
+        for book_id, (index, status, stars) in cleaned.items():
+            if book_id not in current:
+                results[index] = {"index": index, "book": book_id, "ok": False, "error": "Knyga nerasta."}
+                continue
+            # a rating needs the book read: in this item or already before
+            if stars is not None and (status or current[book_id]) != "read":
+                results[index] = {
+                    "index": index, "book": book_id, "ok": False,
+                    "error": "Norėdami įvertinti, pirmiausia pažymėkite knygą kaip perskaitytą.",
+                }
+                continue
+            if status is not None:
+                statuses.append(UserBookStatus(user=user, book_id=book_id, status=status))
+            if stars is not None:
+                ratings.append(Rating(user=user, book_id=book_id, stars=stars))
+            results[index] = {
+                "index": index, "book": book_id, "ok": True,
+                "status": status or current[book_id], "stars": stars,
+            }
+
+        # bulk_create sends no signals: counters, aggregates and caches are refreshed below
+        if statuses:
+            UserBookStatus.objects.using(using).bulk_create(
+                statuses, update_conflicts=True, unique_fields=["user", "book"], update_fields=["status"]
+            )
+        if ratings:
+            Rating.objects.using(using).bulk_create(
+                ratings, update_conflicts=True, unique_fields=["book", "user"], update_fields=["stars"]
+            )
+            Book.refresh_rating_stats([rating.book_id for rating in ratings])
+        if statuses or ratings:
+            UserProfile.refresh_counters([user.pk])
+
+    if ratings:
+        catalogue_cache.bump("ratings")
+    # every book whose status or rating changed, including ones no longer marked read
+    changed = sorted({obj.book_id for obj in [*statuses, *ratings]})
+    if changed:
+        tasks.refresh_recommendations.enqueue(book_ids=changed)
+    return results
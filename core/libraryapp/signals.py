@@ -0,0 +1,189 @@
+# ##### django signals #####
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+
+# ##### project models #####
+from .models import Author, Book, Genre, Rating, UserBookStatus, UserProfile
+from . import catalogue_cache, search, tasks
+
+
+# ##### rating aggregates #####
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, **kwargs):
+    Book.refresh_rating_stats([instance.book_id])
+    catalogue_cache.bump("ratings")
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, origin=None, **kwargs):
+    # the book itself is being deleted, nothing left to keep in sync
+    if isinstance(origin, Book):
+        return
+    Book.refresh_rating_stats([instance.book_id])
+    catalogue_cache.bump("ratings")
+
+
+# ##### profile counters #####
+@receiver(post_save, sender=UserBookStatus)
+@receiver(post_delete, sender=UserBookStatus)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def reading_counters_changed(sender, instance, origin=None, **kwargs):
+    # a deleted book refreshes its readers once below, a deleted user takes the profile along
+    if isinstance(origin, (Author, Book, User)):
+        return
+    UserProfile.refresh_counters([instance.user_id])
+
+
+@receiver(pre_delete, sender=Book)
+def book_readers_deleting(sender, instance, using, **kwargs):
+    # the cascade deletes their statuses and ratings without refreshing the counters
+    instance._reader_ids = list(
+        UserBookStatus.objects.using(using).filter(book=instance).order_by().values_list("user_id", flat=True)
+        .union(Rating.objects.using(using).filter(book=instance).order_by().values_list("user_id", flat=True))
+    )
+
+
+@receiver(post_delete, sender=Book)
+def book_readers_deleted(sender, instance, **kwargs):
+    if getattr(instance, "_reader_ids", None):
+        UserProfile.refresh_counters(instance._reader_ids)
+
+
+# ##### recommendations #####
+@receiver(post_save, sender=Rating)
+@receiver(post_save, sender=UserBookStatus)
+@receiver(post_delete, sender=Rating)
+@receiver(post_delete, sender=UserBookStatus)
+def reader_opinion_changed(sender, instance, created=False, origin=None, **kwargs):
+    # a new "want"/"reading" status says nothing about liking the book
+    if created and sender is UserBookStatus and instance.status != "read":
+        return
+    # deleting the book (or user) removes its similarity rows with it
+    if isinstance(origin, (Book, User)):
+        return
+    tasks.refresh_recommendations.enqueue(book_ids=[instance.book_id])
+
+
+# ##### search index #####
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        search.reindex([instance.pk], using)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, using, **kwargs):
+    search.get_backend(using).remove_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == "pre_clear" and reverse:
+        # genre.books.clear() does not report which books lost the genre
+        instance._cleared_book_ids = list(instance.books.using(using).values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            search.reindex([instance.pk], using)
+        elif action == "post_clear":
+            search.reindex(getattr(instance, "_cleared_book_ids", ()), using)
+        else:
+            search.reindex(pk_set, using)
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, using, created, raw=False, **kwargs):
+    if not raw and not created:
+        search.reindex(instance.books.using(using).values_list("pk", flat=True), using)
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, using, created, raw=False, **kwargs):
+    if not raw and not created:
+        search.reindex(instance.books.using(using).values_list("pk", flat=True), using)
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleting(sender, instance, using, **kwargs):
+    # the through rows go away without an m2m_changed signal
+    instance._deleted_book_ids = list(instance.books.using(using).values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_deleted(sender, instance, using, **kwargs):
+    search.reindex(getattr(instance, "_deleted_book_ids", ()), using)
+
+
+# ##### catalogue result cache #####
+# Ratings do not change which books match a filter or their order, so they
+# leave the cached id lists alone (they only bump the "ratings" generation
+# the anonymous page cache depends on).
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, **kwargs):
+    catalogue_cache.bump("books")
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_changed(sender, **kwargs):
+    catalogue_cache.bump("authors")
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_changed(sender, **kwargs):
+    catalogue_cache.bump("genres")
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def book_genres_membership_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        catalogue_cache.bump("genres")
+
+
+# ##### book versions #####
+# Book.updated_at versions the cached book fragments, so it has to move when
+# related data shown next to the book changes too.
+@receiver(post_save, sender=Author)
+def author_renamed(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        Book.touch(instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Genre)
+def genre_renamed(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        Book.touch(instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_removed(sender, instance, **kwargs):
+    Book.touch(getattr(instance, "_deleted_book_ids", ()))
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def book_genres_touched(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        Book.touch([instance.pk])
+    elif action == "post_clear":
+        Book.touch(getattr(instance, "_cleared_book_ids", ()))
+    else:
+        Book.touch(pk_set)
+
+
+# ##### cover derivatives #####
+@receiver(pre_save, sender=Book)
+def book_cover_changing(sender, instance, raw=False, **kwargs):
+    # a freshly uploaded file is not committed to storage until the save
+    instance._cover_uploaded = not raw and bool(instance.cover) and not instance.cover._committed
+    instance._cover_cleared = not raw and not instance.cover and bool(instance.cover_hash)
+
+
+@receiver(post_save, sender=Book)
+def book_cover_changed(sender, instance, **kwargs):
+    if getattr(instance, "_cover_uploaded", False) or getattr(instance, "_cover_cleared", False):
+        tasks.process_cover.enqueue(book_id=instance.pk)
@@ -0,0 +1,40 @@
+// ##### typeahead #####
+// Fills the <datalist> of every input with a data-suggest URL from the
+// autocomplete endpoint while the user types.
+(function () {
+  "use strict";
+
+  const DELAY = 120;
+
+  document.querySelectorAll("input[data-suggest]").forEach(function (input) {
+    const list = document.getElementById(input.getAttribute("list"));
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        const q = input.value.trim();
+        if (!q) {
+          list.replaceChildren();
+          return;
+        }
+        // only the answer to the latest keystroke matters
+        if (controller) {
+          controller.abort();
+        }
+        controller = new AbortController();
+        fetch(input.dataset.suggest + "?q=" + encodeURIComponent(q), {signal: controller.signal})
+          .then(function (response) { return response.json(); })
+          .then(function (data) {
+            list.replaceChildren(...data.results.map(function (label) {
+              const option = document.createElement("option");
+              option.value = label;
+              return option;
+            }));
+          })
+          .catch(function () {});
+      }, DELAY);
+    });
+  });
+})();
@@ -0,0 +1,254 @@
+# ##### background tasks #####
+# A small database-backed queue, no broker needed: Task rows are inserted when
+# the enqueuing transaction commits and `manage.py run_worker` claims and runs
+# them, retrying failures with exponential backoff. With LIBRARY_TASKS_EAGER
+# the function runs right after the commit instead (development, tests).
+import hashlib
+import json
+import logging
+import random
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Q
+from django.template import loader
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import covers, recommendations, replicas
+from .models import Book, Task, UserProfile
+
+logger = logging.getLogger("libraryapp.tasks")
+
+# name -> TaskFunction
+registry = {}
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts, unique=False):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.unique = unique
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, delay=None, **kwargs):
+        """
+        Queue a call with JSON-serializable keyword arguments once the current
+        transaction commits (right away outside one); nothing is queued on rollback.
+        """
+        if getattr(settings, "LIBRARY_TASKS_EAGER", False):
+            transaction.on_commit(lambda: self.func(**kwargs))
+            return
+
+        def insert():
+            task_row = Task(
+                name=self.name,
+                kwargs=kwargs,
+                max_attempts=self.max_attempts,
+                run_at=timezone.now() + (delay or timedelta()),
+            )
+            if not self.unique:
+                task_row.save()
+                return
+            # one INSERT that does nothing when the same call is already waiting:
+            # that task will see this change too
+            task_row.dedupe_key = dedupe_key(self.name, kwargs)
+            Task.objects.bulk_create([task_row], ignore_conflicts=True)
+
+        transaction.on_commit(insert)
+
+
+def task(name=None, max_attempts=5, unique=False):
+    """
+    Register a function as a background task: ``func.enqueue(**kwargs)``.
+    A ``unique`` task is not queued again while the same call is still waiting.
+    """
+    def register(func):
+        task_function = TaskFunction(func, name or f"{func.__module__}.{func.__name__}", max_attempts, unique)
+        registry[task_function.name] = task_function
+        return task_function
+    return register
+
+
+def dedupe_key(name, kwargs):
+    return hashlib.sha1(json.dumps([name, kwargs], sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at LIBRARY_TASKS_MAX_RETRY_DELAY seconds."""
+    base = getattr(settings, "LIBRARY_TASKS_RETRY_DELAY", 10)
+    cap = getattr(settings, "LIBRARY_TASKS_MAX_RETRY_DELAY", 3600)
+    return timedelta(seconds=min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2))
+
+
+def claim(worker):
+    """Mark the next due task as running for ``worker``; None when nothing is due."""
+    while True:
+        candidate = (
+            Task.objects.filter(status=Task.QUEUED, run_at__lte=timezone.now())
+            .order_by("run_at").values_list("pk", flat=True).first()
+        )
+        if candidate is None:
+            return None
+        # compare-and-set: another worker may have taken it since the SELECT
+        now = timezone.now()
+        claimed = Task.objects.filter(pk=candidate, status=Task.QUEUED).update(
+            status=Task.RUNNING, worker=worker, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1,
+            # from now on the same call can be queued again
+            dedupe_key=None,
+        )
+        if claimed:
+            return Task.objects.get(pk=candidate)
+
+
+def run(task_row):
+    """Run a claimed task and record the outcome; returns True on success."""
+    try:
+        task_function = registry[task_row.name]
+        # tasks act on rows committed moments ago, which a replica may not have yet
+        with replicas.use_primary(), heartbeat(task_row):
+            task_function(**task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        task_row.last_error = error
+        if task_row.attempts < task_row.max_attempts:
+            task_row.status = Task.QUEUED
+            task_row.run_at = timezone.now() + retry_delay(task_row.attempts)
+        else:
+            task_row.status = Task.FAILED
+            task_row.finished_at = timezone.now()
+        task_row.save(update_fields=["status", "run_at", "finished_at", "last_error"])
+        logger.warning(
+            "task=%s id=%s attempt=%s/%s status=%s\n%s", task_row.name, task_row.pk,
+            task_row.attempts, task_row.max_attempts, task_row.status, error,
+        )
+        return False
+
+    task_row.status = Task.DONE
+    task_row.finished_at = timezone.now()
+    task_row.save(update_fields=["status", "finished_at"])
+    metrics = {
+        "task": task_row.name,
+        "id": task_row.pk,
+        "attempt": task_row.attempts,
+        # queue latency: from enqueuing (or the retry time) to the start
+        "wait_ms": round((task_row.started_at - max(task_row.created_at, task_row.run_at)).total_seconds() * 1000, 2),
+        "run_ms": round((task_row.finished_at - task_row.started_at).total_seconds() * 1000, 2),
+    }
+    logger.info(" ".join(f"{name}=%s" for name in metrics), *metrics.values(), extra={"task": metrics})
+    return True
+
+
+@contextmanager
+def heartbeat(task_row):
+    """
+    Refresh the running task's ``heartbeat_at`` every LIBRARY_TASKS_HEARTBEAT
+    seconds from a side thread, so requeue_stale leaves it alone however long it runs.
+    """
+    interval = getattr(settings, "LIBRARY_TASKS_HEARTBEAT", 30)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    Task.objects.filter(pk=task_row.pk, status=Task.RUNNING).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    # a missed beat is retried with the next one
+                    logger.warning("task=%s id=%s heartbeat failed", task_row.name, task_row.pk, exc_info=True)
+        finally:
+            # this thread's own connection
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"task-heartbeat-{task_row.pk}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(older_than):
+    """Put back tasks whose worker died: no heartbeat for ``older_than``."""
+    cutoff = timezone.now() - older_than
+    return Task.objects.filter(
+        # rows claimed before heartbeats existed have none
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Task.RUNNING,
+    ).update(status=Task.QUEUED, worker="")
+
+
+# ##### tasks #####
+@task()
+def send_mail(subject, body, from_email, to, html=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html:
+        message.attach_alternative(html, "text/html")
+    message.send()
+
+
+@task()
+def send_password_reset(user_id, email, domain, site_name, protocol, subject_template_name,
+                        email_template_name, html_email_template_name=None, from_email=None):
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None:
+        return
+    context = {
+        "email": email,
+        "domain": domain,
+        "site_name": site_name,
+        "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+        "user": user,
+        # made here rather than in the request, so the link is never queued
+        "token": default_token_generator.make_token(user),
+        "protocol": protocol,
+    }
+    subject = "".join(loader.render_to_string(subject_template_name, context).splitlines())
+    send_mail(
+        subject=subject,
+        body=loader.render_to_string(email_template_name, context),
+        from_email=from_email,
+        to=[email],
+        html=loader.render_to_string(html_email_template_name, context) if html_email_template_name else None,
+    )
+
+
+@task()
+def create_profile(user_id, birth_year=None, city=""):
+    profile, created = UserProfile.objects.get_or_create(
+        user_id=user_id, defaults={"birth_year": birth_year, "city": city or ""}
+    )
+    if not created:
+        # the user opened their profile before the worker got here
+        UserProfile.objects.filter(pk=profile.pk).update(birth_year=birth_year, city=city or "")
+    UserProfile.refresh_counters([user_id])
+
+
+@task(max_attempts=3)
+def process_cover(book_id):
+    book = Book.objects.filter(pk=book_id).only("cover", "cover_hash", "cover_width").first()
+    if book is not None:
+        covers.process(book)
+
+
+@task(unique=True)
+def refresh_counters(user_ids):
+    UserProfile.refresh_counters(user_ids)
+
+
+@task(max_attempts=3, unique=True)
+def refresh_recommendations(book_ids):
+    recommendations.refresh(book_ids)
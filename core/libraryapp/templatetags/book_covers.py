@@ -0,0 +1,11 @@
+from django import template
+
+from libraryapp import covers
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover_picture(book, variant):
+    """{% cover_picture book "card" %}: responsive <picture> of the book's cover."""
+    return covers.picture(book, variant)
@@ -1,3 +1,1633 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from urllib.parse import quote
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, router, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from core import cache_url, sqlite_tuning
+
+from . import autocomplete, catalogue_cache, covers, importer, recommendations, replicas, search, services, tasks, urls
+from .middleware import QueryBudgetExceeded
+from .models import Author, Book, BookSimilarity, Genre, Rating, Task, UserBookStatus, UserProfile
+from .views import BookListView
+
+
+@override_settings(LIBRARY_PAGE_CACHE_TIMEOUT=0, LIBRARY_QUERY_BUDGET_STRICT=True, LIBRARY_DATABASE_REPLICAS=[])
+class LibraryTestCase(TestCase):
+    """
+    Every test starts with empty caches (whole-page caching is tested on its
+    own) and fails when a view goes over its query budget. Reads stay on the
+    test database: a replica mirror would not see the test's transaction.
+    """
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+
+def make_book(title="Metai", author=None, **kwargs):
+    author = author or Author.objects.create(name="Kristijonas Donelaitis")
+    kwargs.setdefault("isbn", f"isbn-{Book.objects.count() + 1}")
+    return Book.objects.create(title=title, author=author, **kwargs)
+
+
+# ##### rating aggregates #####
+class RatingAggregateTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book()
+        self.user = User.objects.create_user("jonas", password="Slaptas123")
+
+    def test_rate_view_updates_aggregates(self):
+        UserBookStatus.objects.create(user=self.user, book=self.book, status="read")
+        self.client.force_login(self.user)
+        url = reverse("libraryapp:rate_book", kwargs={"pk": self.book.pk})
+
+        self.client.post(url, {"stars": 4})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum, self.book.avg_rating), (1, 4, 4.0))
+
+        self.client.post(url, {"stars": 2})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum, self.book.avg_rating), (1, 2, 2.0))
+
+    def test_delete_rating_updates_aggregates(self):
+        other = User.objects.create_user("ona")
+        Rating.objects.create(book=self.book, user=self.user, stars=5)
+        rating = Rating.objects.create(book=self.book, user=other, stars=2)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.avg_rating, 3.5)
+
+        rating.delete()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum, self.book.avg_rating), (1, 5, 5.0))
+
+    def test_rebuild_command(self):
+        Rating.objects.create(book=self.book, user=self.user, stars=3)
+        Book.objects.update(rating_count=0, rating_sum=0, avg_rating=None)
+
+        call_command("rebuild_rating_stats", stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum, self.book.avg_rating), (1, 3, 3.0))
+
+
+# ##### catalogue queries #####
+class CatalogueQueryTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        genre = Genre.objects.create(name="Poezija")
+        for i in range(12):
+            author = Author.objects.create(name=f"Autorius {i}")
+            make_book(f"Knyga {i:02}", author=author, year=1900 + i).genres.add(genre)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        url = reverse("libraryapp:book_list")
+        for page_size in (4, 12):
+            for alias in settings.CACHES:
+                caches[alias].clear()
+            with self.subTest(page_size=page_size), mock.patch.object(BookListView, "paginate_by", page_size):
+                # matching ids + page rows (with authors) + sidebar genres + 2 facets
+                with self.assertNumQueries(5):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context["books"]), page_size)
+                self.assertContains(response, "Autorius 0")
+                self.assertNotIn("authors", response.context)
+
+
+# ##### sidebar facets #####
+class FacetTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.poetry = Genre.objects.create(name="Poezija")
+        self.prose = Genre.objects.create(name="Proza")
+        neris = Author.objects.create(name="Salomėja Nėris")
+        vaizgantas = Author.objects.create(name="Vaižgantas")
+        for title, author, year, genres in (
+            ("Pėdos smėly", neris, 1931, [self.poetry]),
+            ("Per lūžtantį ledą", neris, 1935, [self.poetry]),
+            ("Dėdės ir dėdienės", vaizgantas, 1929, [self.prose]),
+            ("Pragiedruliai", vaizgantas, 1918, [self.prose, self.poetry]),
+        ):
+            make_book(title, author, year=year).genres.set(genres)
+
+    def facets(self, **params):
+        response = self.client.get(reverse("libraryapp:book_list"), params)
+        counts = {g.name: g.book_count for g in response.context["genres"]}
+        return counts, response.context["facets"]
+
+    def test_counts_follow_filters(self):
+        genres, facets = self.facets()
+        self.assertEqual(genres, {"Poezija": 3, "Proza": 2})
+        self.assertEqual(facets["decades"], [(1910, 1), (1920, 1), (1930, 2)])
+        self.assertEqual(facets["authors"], [("Salomėja Nėris", 2), ("Vaižgantas", 2)])
+
+        genres, facets = self.facets(genre=self.prose.pk, year_from="1920")
+        self.assertEqual(genres, {"Poezija": 0, "Proza": 1})
+        self.assertEqual(facets["decades"], [(1920, 1)])
+        self.assertEqual(facets["authors"], [("Vaižgantas", 1)])
+
+    def test_cached_per_filter_set(self):
+        self.facets(year_from="1930")
+        with CaptureQueriesContext(connection) as queries:
+            # another order and page: the same filters, so the same counts
+            self.facets(year_from=" 1930", order="year")
+        self.assertFalse([q for q in queries if "GROUP BY" in q["sql"]])
+
+        Book.objects.get(title="Pėdos smėly").genres.add(self.prose)
+        self.assertEqual(self.facets(year_from="1930")[0], {"Poezija": 2, "Proza": 1})
+
+
+# ##### typeahead #####
+@override_settings(LIBRARY_AUTOCOMPLETE_CHECK_INTERVAL=0)
+class AutocompleteTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete.clear()
+        neris = Author.objects.create(name="Salomėja Nėris")
+        make_book("Per lūžtantį ledą", neris)
+        make_book("Pėdos smėly", neris)
+        make_book("Pėdsakai", Author.objects.create(name="Petras Cvirka"))
+        Author.objects.create(name="Pranas Be Knygų")
+
+    def suggest(self, field, q, **params):
+        url = reverse("libraryapp:autocomplete", args=[field])
+        return self.client.get(url, {"q": q, **params}).json()["results"]
+
+    def test_prefixes_ignore_case_and_diacritics(self):
+        self.assertEqual(self.suggest("title", "PED"), ["Pėdos smėly", "Pėdsakai"])
+        self.assertEqual(self.suggest("title", "pedos  sm"), ["Pėdos smėly"])
+        self.assertEqual(self.suggest("author", "neri"), ["Salomėja Nėris"])
+        self.assertEqual(self.suggest("author", "pr"), [])
+        self.assertEqual(self.suggest("title", ""), [])
+
+    def test_title_start_ranks_first(self):
+        make_book("Ledo gėlės")
+        self.assertEqual(self.suggest("title", "led"), ["Ledo gėlės", "Per lūžtantį ledą"])
+        self.assertEqual(self.suggest("title", "led", limit=1), ["Ledo gėlės"])
+
+    def test_answers_from_memory_until_books_change(self):
+        self.suggest("title", "p")
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.suggest("title", "p")), 3)
+
+        make_book("Paslaptis")
+        self.assertEqual(self.suggest("title", "pa"), ["Paslaptis"])
+        self.assertEqual(self.client.get(reverse("libraryapp:autocomplete", args=["isbn"])).status_code, 404)
+
+
+# ##### full-text search #####
+class SearchTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.history = Genre.objects.create(name="Istorinis")
+        self.author = Author.objects.create(name="Vincas Pietaris")
+        self.book = make_book("Algimantas", author=self.author, description="Žalgirio mūšis ir kunigaikščiai.")
+        self.other = make_book("Metai", description="Poema apie būrų gyvenimą.")
+
+    def search(self, **params):
+        response = self.client.get(reverse("libraryapp:book_list"), params)
+        return [b.title for b in response.context["books"]]
+
+    def test_fold(self):
+        self.assertEqual(search.fold("Žalgiris Ąžuolas"), "zalgiris azuolas")
+
+    def test_diacritic_insensitive_prefix_search(self):
+        self.assertEqual(self.search(q="zalgir"), ["Algimantas"])
+        self.assertEqual(self.search(q="BURU"), ["Metai"])
+        self.assertEqual(self.search(author="pietar"), ["Algimantas"])
+        self.assertEqual(self.search(title="pietar"), [])
+
+    def test_ranked_by_relevance(self):
+        make_book("Mūšis", description="Apie Algimantą.")
+        self.assertEqual(self.search(q="musis"), ["Mūšis", "Algimantas"])
+
+    def test_index_follows_changes(self):
+        self.book.genres.add(self.history)
+        self.assertEqual(self.search(q="istorinis"), ["Algimantas"])
+
+        self.author.name = "Kitas Autorius"
+        self.author.save()
+        self.assertEqual(self.search(author="pietaris"), [])
+        self.assertEqual(self.search(author="kitas"), ["Algimantas"])
+
+        self.history.delete()
+        self.assertEqual(self.search(q="istorinis"), [])
+
+        self.book.delete()
+        self.assertEqual(self.search(q="zalgirio"), [])
+
+    def test_rebuild_command(self):
+        with search.get_backend().connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.get_backend().table}")
+        self.assertEqual(self.search(q="metai"), [])
+
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search(q="metai"), ["Metai"])
+
+
+# ##### keyset pagination #####
+@override_settings(LIBRARY_CURSOR_PAGINATION=True)
+class CursorPaginationTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name="Autorius")
+        for i, year in enumerate([1990, None, 1990, 1850, None, 2001, 1990, 1920, 2010]):
+            make_book(f"Knyga {i % 4}", author=author, year=year)
+
+    def walk(self, order):
+        url = reverse("libraryapp:book_list")
+        response = self.client.get(url, {"order": order})
+        pages = [[b.pk for b in response.context["books"]]]
+        while response.context["page_obj"].has_next():
+            response = self.client.get(url, {"order": order, "cursor": response.context["page_obj"].next_cursor})
+            pages.append([b.pk for b in response.context["books"]])
+
+        back = [pages[-1]]
+        while response.context["page_obj"].has_previous():
+            response = self.client.get(url, {"order": order, "cursor": response.context["page_obj"].previous_cursor})
+            back.insert(0, [b.pk for b in response.context["books"]])
+        return pages, back
+
+    def test_walks_whole_catalogue_in_order(self):
+        for order, key in (("title", ("title", "pk")), ("year", ("year", "title", "pk"))):
+            with self.subTest(order=order):
+                expected = sorted(
+                    Book.objects.all(),
+                    key=lambda b: tuple((v is not None, v) for v in (getattr(b, k) for k in key)),
+                )
+                pages, back = self.walk(order)
+                self.assertEqual(sum(pages, []), [b.pk for b in expected])
+                self.assertTrue(all(len(page) == 4 for page in pages[:-1]))
+                self.assertEqual(back, pages)
+
+    def test_no_count_query(self):
+        # page rows + sidebar genres + 2 facets
+        with self.assertNumQueries(4):
+            self.client.get(reverse("libraryapp:book_list"))
+
+    def test_offset_pages_still_available(self):
+        response = self.client.get(reverse("libraryapp:book_list"), {"page": 3})
+        self.assertEqual(response.context["page_obj"].number, 3)
+        self.assertFalse(response.context["cursor_pagination"])
+
+    def test_tampered_cursor(self):
+        response = self.client.get(reverse("libraryapp:book_list"), {"cursor": "nonsense"})
+        self.assertEqual(response.status_code, 404)
+
+
+# ##### catalogue result cache #####
+class CatalogueCacheTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.genre = Genre.objects.create(name="Poezija")
+        self.author = Author.objects.create(name="Salomėja Nėris")
+        for i in range(6):
+            make_book(f"Eilėraščiai {i}", author=self.author, year=1930 + i)
+
+    def titles(self, **params):
+        response = self.client.get(reverse("libraryapp:book_list"), params)
+        return [b.title for b in response.context["books"]]
+
+    def test_normalized_key(self):
+        self.assertEqual(
+            catalogue_cache.normalize({"title": "  Metai ", "genre": "", "page": "2"}, "title"),
+            catalogue_cache.normalize({"title": "metai"}, "title"),
+        )
+
+    def test_hits_skip_the_filter_query(self):
+        self.titles(title="eilėraščiai", year_from="1931")
+        # page rows + sidebar genres
+        with self.assertNumQueries(2):
+            self.assertEqual(self.titles(title=" Eilėraščiai ", year_from="1931", page="2"), ["Eilėraščiai 5"])
+        self.assertEqual(catalogue_cache.stats()["hits"], 1)
+        self.assertEqual(catalogue_cache.stats()["misses"], 1)
+
+    def test_invalidated_by_changes(self):
+        self.assertEqual(self.titles(genre=self.genre.pk), [])
+        Book.objects.get(title="Eilėraščiai 3").genres.add(self.genre)
+        self.assertEqual(self.titles(genre=self.genre.pk), ["Eilėraščiai 3"])
+
+        self.assertEqual(self.titles(author="neris", year_from="1935"), ["Eilėraščiai 5"])
+        self.author.name = "Kitas"
+        self.author.save()
+        self.assertEqual(self.titles(author="neris", year_from="1935"), [])
+
+        self.assertEqual(self.titles(year_from="1934"), ["Eilėraščiai 4", "Eilėraščiai 5"])
+        Book.objects.filter(title="Eilėraščiai 5").delete()
+        self.assertEqual(self.titles(year_from="1934"), ["Eilėraščiai 4"])
+
+    @override_settings(LIBRARY_QUERY_CACHE_MAX_IDS=3)
+    def test_large_results_are_not_cached(self):
+        self.assertEqual(len(self.titles()), 4)
+        self.assertEqual(len(self.titles(page="2")), 2)
+        key = catalogue_cache.cache_key(catalogue_cache.normalize({}, "title"))
+        self.assertEqual(catalogue_cache.get_cache().get(key), catalogue_cache.TOO_LARGE)
+
+
+# ##### cache configuration #####
+class FakeRedisPool:
+    """Stands in for redis.ConnectionPool: one dict per server URL."""
+
+    servers = {}
+
+    @classmethod
+    def from_url(cls, url, **options):
+        pool = cls()
+        pool.data = cls.servers.setdefault(url, {})
+        return pool
+
+
+class FakeRedis:
+    """The commands RedisCache sends, stored the way a redis server returns them (bytes)."""
+
+    def __init__(self, connection_pool):
+        self.data = connection_pool.data
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def incr(self, key, delta):
+        value = int(self.data[key]) + delta
+        self.data[key] = str(value).encode()
+        return value
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+fake_redis = SimpleNamespace(Redis=FakeRedis, ConnectionPool=FakeRedisPool, connection=SimpleNamespace(DefaultParser=None))
+
+
+class CacheUrlTests(LibraryTestCase):
+    def test_parse(self):
+        self.assertEqual(cache_url.parse("locmem://", key_prefix="views"), {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "views",
+            "KEY_PREFIX": "views",
+        })
+        self.assertEqual(cache_url.parse("file:///dev/shm/library?timeout=60&max_entries=500"), {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": "/dev/shm/library",
+            "TIMEOUT": 60,
+            "OPTIONS": {"MAX_ENTRIES": 500},
+            "KEY_PREFIX": "",
+        })
+        self.assertEqual(cache_url.parse("redis://:secret@127.0.0.1:6379/1?key_prefix=lib"), {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://:secret@127.0.0.1:6379/1",
+            "KEY_PREFIX": "lib",
+        })
+        with self.assertRaises(ValueError):
+            cache_url.parse("memcached://localhost")
+
+    def test_env_fallback(self):
+        with mock.patch.dict("os.environ", {"CACHE_URL": "dummy://", "VIEWS_CACHE_URL": "locmem://v"}):
+            self.assertEqual(cache_url.config("QUERIES_CACHE_URL")["BACKEND"], cache_url.BACKENDS["dummy"])
+            self.assertEqual(cache_url.config("VIEWS_CACHE_URL")["LOCATION"], "v")
+
+    def test_aliases_are_separate(self):
+        caches["views"].set("k", "views")
+        caches["queries"].set("k", "queries")
+        self.assertEqual(caches["views"].get("k"), "views")
+
+    def test_redis_backend(self):
+        # runs without a server; test_redis_compatible_server below uses a real one
+        FakeRedisPool.servers.clear()
+        config = cache_url.parse("redis://127.0.0.1:6379/1?key_prefix=lib")
+        with mock.patch.dict(sys.modules, {"redis": fake_redis}), \
+                override_settings(CACHES={"default": config, "queries": config}):
+            caches["default"].set("libraryapp:test", [1, 2, 3])
+            self.assertEqual(caches["default"].get("libraryapp:test"), [1, 2, 3])
+            # the catalogue counters: add, incr and get_many
+            catalogue_cache.bump("books")
+            catalogue_cache.bump("books")
+            self.assertEqual(catalogue_cache.generations(["books", "genres"]), (("books", 2), ("genres", 0)))
+        stored = FakeRedisPool.servers["redis://127.0.0.1:6379/1"]
+        self.assertIn("lib:1:catalogue:gen:books", stored)
+        self.assertTrue(all(key.startswith("lib:") for key in stored))
+
+    @skipUnless(os.getenv("TEST_REDIS_URL"), "TEST_REDIS_URL nenustatytas")
+    def test_redis_compatible_server(self):
+        # e.g. TEST_REDIS_URL=redis://127.0.0.1:6379/15 against a local redis/valkey
+        with override_settings(CACHES={"default": cache_url.parse(os.environ["TEST_REDIS_URL"])}):
+            caches["default"].set("libraryapp:test", [1, 2, 3])
+            self.assertEqual(caches["default"].get("libraryapp:test"), [1, 2, 3])
+            caches["default"].delete("libraryapp:test")
+
+
+# ##### page and fragment caching #####
+@override_settings(LIBRARY_PAGE_CACHE_TIMEOUT=60)
+class PageCacheTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book("Anykščių šilelis", description="Poema.")
+        self.user = User.objects.create_user("petras")
+
+    def test_anonymous_pages_are_cached(self):
+        # only the validator query of the book page is left, the catalogue's come from the cache
+        pages = {reverse("libraryapp:book_list"): 0, reverse("libraryapp:book_detail", args=[self.book.pk]): 1}
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertIn("public", first["Cache-Control"])
+                self.assertIn("Cookie", first["Vary"])
+                with self.assertNumQueries(queries):
+                    second = self.client.get(url)
+                self.assertEqual(second.content, first.content)
+
+    def test_new_rating_invalidates_pages(self):
+        url = reverse("libraryapp:book_detail", args=[self.book.pk])
+        self.client.get(reverse("libraryapp:book_list"))
+        self.client.get(url)
+
+        Rating.objects.create(book=self.book, user=self.user, stars=4)
+        self.assertContains(self.client.get(reverse("libraryapp:book_list")), "(4,0)")
+        self.assertContains(self.client.get(url), "petras: 4 ★")
+
+    def test_logged_in_users_get_personal_blocks(self):
+        self.client.get(reverse("libraryapp:book_detail", args=[self.book.pk]))
+        UserBookStatus.objects.create(user=self.user, book=self.book, status="read")
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("libraryapp:book_detail", args=[self.book.pk]))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertContains(response, "Pažymėta kaip perskaityta")
+        self.assertContains(response, "Anykščių šilelis")
+
+    def test_fragments_follow_author_rename(self):
+        url = reverse("libraryapp:book_list")
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(url), "Kristijonas Donelaitis")
+        Author.objects.update(name="Antanas Baranauskas")
+        Author.objects.get().save()
+        self.assertContains(self.client.get(url), "Antanas Baranauskas")
+
+
+# ##### conditional GET #####
+class ConditionalGetTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book("Altorių šešėly")
+        self.user = User.objects.create_user("marija")
+
+    def test_not_modified(self):
+        pages = {reverse("libraryapp:book_list"): 0, reverse("libraryapp:book_detail", args=[self.book.pk]): 1}
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response.has_header("Last-Modified"))
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_validators(self):
+        detail = reverse("libraryapp:book_detail", args=[self.book.pk])
+        list_etag = self.client.get(reverse("libraryapp:book_list"))["ETag"]
+        detail_etag = self.client.get(detail)["ETag"]
+
+        Rating.objects.create(book=self.book, user=self.user, stars=5)
+        response = self.client.get(reverse("libraryapp:book_list"), HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        self.book.genres.add(Genre.objects.create(name="Romanas"))
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deletes_and_genres_change_the_catalogue_etag(self):
+        url = reverse("libraryapp:book_list")
+        book = make_book("Paslaptingas kambarys")
+
+        def rename_genre():
+            genre = Genre.objects.get()
+            genre.name = "Apysaka"
+            genre.save()
+
+        changes = [book.delete, lambda: Genre.objects.create(name="Romanas"), rename_genre, Genre.objects.all().delete]
+        for change in changes:
+            etag = self.client.get(url)["ETag"]
+            change()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_filters_have_their_own_etag(self):
+        url = reverse("libraryapp:book_list")
+        self.assertNotEqual(self.client.get(url)["ETag"], self.client.get(url, {"year_from": 1900})["ETag"])
+
+    def test_logged_in_users_get_full_pages(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("libraryapp:book_detail", args=[self.book.pk]))
+        self.assertFalse(response.has_header("ETag"))
+
+
+# ##### indexes #####
+class ExplainCatalogueTests(LibraryTestCase):
+    def test_catalogue_queries_use_indexes(self):
+        make_book(year=1900)
+        out = StringIO()
+        call_command("explain_catalogue", stdout=out)
+        report = dict(line.split(": OK ", 1) for line in out.getvalue().splitlines() if ": OK " in line)
+        self.assertIn("book_year_title_idx", report["book_list: metai nuo-iki"])
+        self.assertIn("status_user_status_idx", report["profile: knygos pagal statusą"])
+        self.assertNotIn("FULL SCAN", out.getvalue())
+
+
+# ##### instrumentation #####
+@override_settings(LIBRARY_SERVER_TIMING=True)
+class PerformanceMiddlewareTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("rimas")
+        self.books = [make_book(f"Knyga {i}") for i in range(3)]
+        for book in self.books:
+            UserBookStatus.objects.create(user=self.user, book=book, status="read")
+            Rating.objects.create(user=self.user, book=book, stars=3)
+
+    def test_views_stay_within_budget(self):
+        self.client.force_login(self.user)
+        book = self.books[0]
+        for method, url in (
+            ("get", reverse("libraryapp:book_list")),
+            ("get", reverse("libraryapp:book_detail", args=[book.pk])),
+            ("post", reverse("libraryapp:rate_book", args=[book.pk])),
+            ("post", reverse("libraryapp:mark_as_read", args=[book.pk])),
+            ("get", reverse("libraryapp:profile")),
+        ):
+            with self.subTest(url=url):
+                response = getattr(self.client, method)(url, {"stars": 4} if "rate" in url else {})
+                self.assertIn("db;dur=", response["Server-Timing"])
+
+    def test_render_time_reported(self):
+        response = self.client.get(reverse("libraryapp:book_list"))
+        self.assertRegex(response["Server-Timing"], r"render;dur=(?!0\.0,)[\d.]+")
+
+    @override_settings(LIBRARY_SERVER_TIMING=False)
+    def test_timings_stay_private_when_off(self):
+        response = self.client.get(reverse("libraryapp:book_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    @override_settings(LIBRARY_QUERY_BUDGETS={"libraryapp:book_detail": 1})
+    def test_over_budget(self):
+        url = reverse("libraryapp:book_detail", args=[self.books[0].pk])
+        with self.assertRaisesMessage(QueryBudgetExceeded, "budget is 1"):
+            self.client.get(url)
+
+        with override_settings(LIBRARY_QUERY_BUDGET_STRICT=False):
+            with self.assertLogs("libraryapp.performance", "WARNING") as logs:
+                self.client.get(url)
+        self.assertIn("libraryapp:book_detail ran", logs.output[0])
+
+
+# ##### profile #####
+class ProfileTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("egle")
+        self.profile = UserProfile.objects.create(user=self.user, city="Kaunas")
+        self.client.force_login(self.user)
+
+    def add_books(self, count, status="read"):
+        author = Author.objects.create(name=f"Autorius {Author.objects.count()}")
+        for i in range(count):
+            book = make_book(f"Knyga {Book.objects.count()}", author=author)
+            UserBookStatus.objects.create(user=self.user, book=book, status=status)
+
+    def counters(self):
+        self.profile.refresh_from_db()
+        p = self.profile
+        return p.read_count, p.reading_count, p.want_count, p.rated_count
+
+    def test_counters_follow_statuses_and_ratings(self):
+        self.add_books(2, "read")
+        self.add_books(1, "want")
+        self.assertEqual(self.counters(), (2, 0, 1, 0))
+
+        status = UserBookStatus.objects.get(status="want")
+        status.status = "reading"
+        status.save()
+        Rating.objects.create(user=self.user, book=status.book, stars=5)
+        self.assertEqual(self.counters(), (2, 1, 0, 1))
+
+        status.book.delete()
+        self.assertEqual(self.counters(), (2, 0, 0, 0))
+
+    def test_book_delete_refreshes_each_reader_once(self):
+        book = make_book()
+        for name in ("ona", "jonas", "ieva"):
+            user = User.objects.create_user(name)
+            UserProfile.objects.create(user=user)
+            UserBookStatus.objects.create(user=user, book=book, status="read")
+            Rating.objects.create(user=user, book=book, stars=4)
+        self.assertEqual(UserProfile.objects.filter(read_count=1, rated_count=1).count(), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            book.delete()
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "libraryapp_userprofile"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(UserProfile.objects.filter(read_count=0, rated_count=0).count(), 4)
+
+    def test_constant_query_count(self):
+        url = reverse("libraryapp:profile")
+        self.add_books(3)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        self.add_books(30)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, {"page": 2})
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.context["books_status"]), 12)
+        self.assertEqual(response.context["page_obj"].paginator.num_pages, 3)
+        self.assertContains(response, "Autorius 1")
+
+    def test_profile_created_on_first_visit(self):
+        user = User.objects.create_user("naujas")
+        UserBookStatus.objects.create(user=user, book=make_book(), status="read")
+        UserProfile.objects.filter(user=user).delete()
+        self.client.force_login(user)
+        response = self.client.get(reverse("libraryapp:profile"))
+        self.assertEqual(response.context["profile"].read_count, 1)
+
+
+# ##### bulk import #####
+class ImportBooksTests(LibraryTestCase):
+    CSV = (
+        "isbn,title,author,year,genres,description\n"
+        "111,Metai,Kristijonas Donelaitis,1818,Poema|Klasika,\n"
+        "222,Anykščių šilelis,Antanas Baranauskas,1860,Poema,\n"
+        "333,Be metų,Kristijonas Donelaitis,,,\n"
+        ",Be ISBN,Niekas,2000,,\n"
+    )
+
+    def import_file(self, content, name="books.csv", **options):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        call_command("import_books", path, stdout=StringIO(), stderr=StringIO(), **options)
+        return path
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_import_creates_and_updates(self):
+        self.import_file(self.CSV, batch_size=2)
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(Author.objects.count(), 2)
+        metai = Book.objects.get(isbn="111")
+        self.assertEqual(sorted(metai.genres.values_list("name", flat=True)), ["Klasika", "Poema"])
+        self.assertEqual(metai.author, Book.objects.get(isbn="333").author)
+
+        self.import_file(
+            '{"isbn": "111", "title": "Metų laikai", "author": "Kristijonas Donelaitis", "genres": ["Poema"]}\n',
+            name="books.jsonl",
+        )
+        self.assertEqual(Book.objects.count(), 3)
+        metai.refresh_from_db()
+        self.assertEqual(metai.title, "Metų laikai")
+        self.assertEqual(list(metai.genres.values_list("name", flat=True)), ["Poema"])
+        self.assertEqual(search.get_backend().search(Book.objects.all(), {None: "laikai"}).get(), metai)
+
+    def test_bad_jsonl_lines_are_skipped(self):
+        self.import_file(
+            '{"isbn": "111", "title": "Metai", "author": "Kristijonas Donelaitis"}\n'
+            '{"isbn": "222", "title": \n'
+            '["x"]\n'
+            '{"isbn": "333", "title": "Be metų", "author": "Kristijonas Donelaitis"}\n',
+            name="books.jsonl",
+        )
+        self.assertEqual(sorted(Book.objects.values_list("isbn", flat=True)), ["111", "333"])
+
+    def test_impossible_years_are_skipped(self):
+        self.import_file(
+            "isbn,title,author,year\n"
+            "111,Metai,Kristijonas Donelaitis,-5\n"
+            "222,Anykščių šilelis,Antanas Baranauskas,99999\n"
+            "333,Be metų,Kristijonas Donelaitis,1818\n"
+        )
+        self.assertEqual(list(Book.objects.values_list("isbn", flat=True)), ["333"])
+
+    def write_feed(self, content, checkpoint_rows=None):
+        path = os.path.join(self.tmp, "books.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        if checkpoint_rows is not None:
+            with open(f"{path}.checkpoint", "w", encoding="utf-8") as f:
+                json.dump({**importer.fingerprint(path), "rows": checkpoint_rows}, f)
+        return path
+
+    def test_resume_from_checkpoint(self):
+        path = self.write_feed(self.CSV, checkpoint_rows=2)
+        call_command("import_books", path, resume=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(list(Book.objects.values_list("isbn", flat=True)), ["333"])
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_resume_refuses_a_changed_file(self):
+        path = self.write_feed(self.CSV, checkpoint_rows=2)
+        # another feed under the same name
+        self.write_feed(self.CSV.replace("111,", "444,"))
+        os.utime(path, ns=(0, 0))
+        with self.assertRaisesMessage(CommandError, "pakeistam failui"):
+            call_command("import_books", path, resume=True, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Book.objects.exists())
+
+
+# ##### export #####
+class ExportTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("ona")
+        other = User.objects.create_user("petras")
+        self.books = [make_book(f"Knyga {i}") for i in range(5)]
+        self.books[0].genres.add(Genre.objects.create(name="Romanas"), Genre.objects.create(name="Poema"))
+        for book in self.books:
+            UserBookStatus.objects.create(user=self.user, book=book, status="read")
+            UserBookStatus.objects.create(user=other, book=book, status="want")
+        Rating.objects.create(user=self.user, book=self.books[0], stars=5)
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_user_exports_only_own_rows(self):
+        self.client.force_login(self.user)
+        url = reverse("libraryapp:export_my_data", args=["statuses"])
+        response = self.client.get(url, {"format": "csv"})
+        self.assertIn('filename="statuses.csv"', response["Content-Disposition"])
+        rows = list(csv.reader(StringIO(self.content(response).decode())))
+        self.assertEqual(rows[0], ["book__isbn", "book__title", "status", "created_at"])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row[2] for row in rows[1:]}, {"read"})
+
+        response = self.client.get(
+            reverse("libraryapp:export_my_data", args=["ratings"]), {"format": "jsonl", "gzip": "1"}
+        )
+        rows = [json.loads(line) for line in gzip.decompress(self.content(response)).splitlines()]
+        self.assertEqual([(row["book__title"], row["stars"]) for row in rows], [("Knyga 0", 5)])
+
+    def test_catalogue_export_is_staff_only(self):
+        url = reverse("libraryapp:export_catalogue", args=["books"])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        rows = list(csv.DictReader(StringIO(self.content(self.client.get(url)).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["genres"], "Poema|Romanas")
+
+    async def test_asgi_streams_asynchronously(self):
+        # a sync iterator would be read into memory by the ASGI handler first
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse("libraryapp:export_my_data", args=["statuses"]), {"format": "jsonl"}
+        )
+        self.assertTrue(response.is_async)
+        rows = [json.loads(line) async for chunk in response.streaming_content for line in chunk.splitlines()]
+        self.assertEqual(len(rows), 5)
+
+    def test_command_streams_in_keyset_batches(self):
+        path = os.path.join(tempfile.mkdtemp(), "statuses.jsonl")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        # 10 rows in batches of 3: four batch queries and a final empty one
+        with self.assertNumQueries(5):
+            call_command("export_data", "statuses", format="jsonl", output=path, chunk_size=3, stderr=StringIO())
+        with open(path, encoding="utf-8") as f:
+            ids = [json.loads(line)["id"] for line in f]
+        self.assertEqual(ids, sorted(UserBookStatus.objects.values_list("pk", flat=True)))
+
+
+# ##### cover derivatives #####
+class CoverTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_book(self, **kwargs):
+        # the cover is processed by a queued task
+        with self.captureOnCommitCallbacks(execute=True):
+            book = make_book(**kwargs)
+        call_command("run_worker", once=True, stdout=StringIO())
+        return book
+
+    def upload(self, width=900, height=1350):
+        out = BytesIO()
+        Image.new("RGB", (width, height), "navy").save(out, "JPEG")
+        return SimpleUploadedFile("viršelis.jpg", out.getvalue(), content_type="image/jpeg")
+
+    def test_upload_creates_derivatives(self):
+        book = self.make_book(cover=self.upload())
+        book.refresh_from_db()
+        self.assertTrue(book.cover_hash)
+        for width in covers.all_widths():
+            for ext in covers.FORMATS:
+                with default_storage.open(covers.derived_name(book.cover_hash, width, ext)) as f:
+                    self.assertEqual(Image.open(f).width, width)
+
+        response = self.client.get(reverse("libraryapp:book_list"))
+        self.assertContains(response, f"{book.cover_hash}-600.webp 600w")
+        self.assertContains(response, 'sizes="300px"')
+
+    def test_command_processes_existing_covers(self):
+        book = self.make_book(cover=self.upload(width=200, height=300))
+        Book.objects.filter(pk=book.pk).update(cover_hash="")
+        call_command("process_covers", stdout=StringIO())
+        book.refresh_from_db()
+        self.assertEqual(book.cover_width, 200)
+        with default_storage.open(covers.derived_name(book.cover_hash, 200, "webp")) as f:
+            self.assertEqual(Image.open(f).width, 200)
+
+    def test_small_originals_are_not_upscaled(self):
+        book = self.make_book(cover=self.upload(width=200, height=300))
+        book.refresh_from_db()
+        # 60 and 120 for the thumbnail, the card and page sizes all capped at 200
+        for width in (60, 120, 200):
+            self.assertTrue(default_storage.exists(covers.derived_name(book.cover_hash, width, "webp")))
+        for width in (300, 340, 600, 680):
+            self.assertFalse(default_storage.exists(covers.derived_name(book.cover_hash, width, "webp")))
+        self.assertIn(
+            f'srcset="{default_storage.url(covers.derived_name(book.cover_hash, 200, "webp"))} 200w"',
+            covers.picture(book, "card"),
+        )
+
+    def test_replaced_cover_leaves_no_copies_behind(self):
+        book = self.make_book(cover=self.upload())
+        book.refresh_from_db()
+        old_hash = book.cover_hash
+        with self.captureOnCommitCallbacks(execute=True):
+            book.cover = self.upload(width=400, height=600)
+            book.save()
+        call_command("run_worker", once=True, stdout=StringIO())
+        book.refresh_from_db()
+        self.assertNotEqual(book.cover_hash, old_hash)
+        self.assertEqual(sorted(default_storage.listdir(covers.DERIVED_DIR)[1]), sorted(
+            os.path.basename(covers.derived_name(book.cover_hash, width, ext))
+            for width in covers.capped(covers.all_widths(), 400) for ext in covers.FORMATS
+        ))
+
+    def test_derivatives_are_cached_forever(self):
+        book = self.make_book(cover=self.upload())
+        book.refresh_from_db()
+        response = self.client.get(settings.MEDIA_URL + covers.derived_name(book.cover_hash, 300, "webp"))
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        response = self.client.get(book.cover.url)
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+
+
+# ##### media files #####
+class MediaTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = bytes(range(256)) * 4
+        default_storage.save("covers/viršelis.jpg", BytesIO(self.data))
+        self.url = settings.MEDIA_URL + "covers/viršelis.jpg"
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_whole_file_and_conditional_get(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response, body = self.get(if_none_match=response["ETag"])
+        self.assertEqual((response.status_code, body), (304, b""))
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+
+    def test_ranges(self):
+        response, body = self.get(range="bytes=10-19")
+        self.assertEqual((response.status_code, body), (206, self.data[10:20]))
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 10-19/1024", "10"))
+
+        response, body = self.get(range="bytes=-4")
+        self.assertEqual(body, self.data[-4:])
+        response, body = self.get(range="bytes=1000-")
+        self.assertEqual(body, self.data[1000:])
+
+        response, body = self.get(range="bytes=2000-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */1024"))
+        # several ranges, or a file changed since: the whole file
+        self.assertEqual(self.get(range="bytes=0-1,5-6")[1], self.data)
+        self.assertEqual(self.get(range="bytes=0-1", if_range='"stale"')[1], self.data)
+
+    def test_hand_off_to_the_proxy(self):
+        with override_settings(LIBRARY_MEDIA_ACCEL="x-accel-redirect", LIBRARY_MEDIA_ACCEL_PREFIX="/protected/"):
+            response, body = self.get()
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/covers/vir%C5%A1elis.jpg")
+        self.assertEqual((body, response["Content-Type"]), (b"", "image/jpeg"))
+
+        with override_settings(LIBRARY_MEDIA_ACCEL="x-sendfile"):
+            response, body = self.get()
+        self.assertEqual(response["X-Sendfile"], quote(os.path.join(settings.MEDIA_ROOT, "covers", "viršelis.jpg")))
+
+    def test_only_files_inside_media_root(self):
+        for path in ("covers/", "covers/nera.jpg", "../manage.py", "covers/../../manage.py", ".hidden"):
+            self.assertEqual(self.client.get(settings.MEDIA_URL + path).status_code, 404, path)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+# ##### synthetic data and benchmarks #####
+class SeedBenchmarkTests(LibraryTestCase):
+    def seed(self):
+        call_command(
+            "seed_library", books=30, authors=5, genres=4, users=6, per_user=6, seed=1, stdout=StringIO()
+        )
+
+    def test_seed_keeps_denormalized_data_in_sync(self):
+        self.seed()
+        self.seed()
+        self.assertEqual(Book.objects.count(), 60)
+        self.assertEqual(User.objects.count(), 12)
+        self.assertTrue(Rating.objects.exists())
+
+        book = Book.objects.order_by("-rating_count").first()
+        self.assertEqual(book.rating_count, book.ratings.count())
+        profile = UserProfile.objects.order_by("-read_count").first()
+        self.assertEqual(profile.read_count, profile.user.book_statuses.filter(status="read").count())
+        self.assertEqual(profile.rated_count, profile.user.ratings.count())
+        self.assertIn(book, search.get_backend().search(Book.objects.all(), {"title": book.title}))
+
+    def test_benchmark_compares_with_baseline(self):
+        self.seed()
+        baseline = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(baseline))
+        options = {"iterations": 2, "warmup": 0, "baseline": baseline, "stdout": StringIO()}
+
+        call_command("benchmark_library", save=True, **options)
+        with open(baseline, encoding="utf-8") as f:
+            results = json.load(f)["results"]
+        self.assertEqual(results["katalogas"]["errors"], 0)
+        self.assertEqual(results["įvertinimas"]["errors"], 0)
+        self.assertGreater(results["knyga"]["queries"], 0)
+
+        # one query more than the baseline is a regression
+        results["profilis"]["queries"] -= 1
+        with open(baseline, "w", encoding="utf-8") as f:
+            json.dump({"books": 30, "results": results}, f)
+        with self.assertRaisesMessage(CommandError, "profilis"):
+            call_command("benchmark_library", only=["profilis"], fail=True, tolerance=100, **options)
+
+
+# ##### background tasks #####
+calls = []
+
+
+@tasks.task(name="tests.flaky", max_attempts=2)
+def flaky(fail):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError("nepavyko")
+
+
+@tasks.task(name="tests.slow")
+def slow(seconds):
+    time.sleep(seconds)
+
+
+class TaskQueueTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def work(self):
+        call_command("run_worker", once=True, stdout=StringIO())
+
+    def test_enqueue_runs_after_commit_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            flaky.enqueue(fail=False)
+            self.assertFalse(Task.objects.exists())
+        self.work()
+        task_row = Task.objects.get()
+        self.assertEqual((task_row.status, task_row.attempts, calls), (Task.DONE, 1, [False]))
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            flaky.enqueue(fail=False)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_retry_with_backoff_then_fail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            flaky.enqueue(fail=True)
+        with self.assertLogs("libraryapp.tasks", "WARNING"):
+            self.work()
+        task_row = Task.objects.get()
+        self.assertEqual((task_row.status, task_row.attempts), (Task.QUEUED, 1))
+        self.assertGreater(task_row.run_at, timezone.now())
+        self.assertIn("nepavyko", task_row.last_error)
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs("libraryapp.tasks", "WARNING") as logs:
+            self.work()
+        self.assertIn("status=failed", logs.output[0])
+        task_row.refresh_from_db()
+        self.assertEqual((task_row.status, task_row.attempts, len(calls)), (Task.FAILED, 2, 2))
+
+    def test_password_reset_mail_is_queued(self):
+        User.objects.create_user("ieva", email="ieva@example.com", password="Slaptas123")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("libraryapp:password_reset"), {"email": "ieva@example.com"})
+        self.assertEqual(len(mail.outbox), 0)
+        # the queued task holds no reset link, the worker makes it
+        queued = Task.objects.get().kwargs
+        self.assertEqual(queued["user_id"], User.objects.get(username="ieva").pk)
+        self.assertNotIn("token", queued)
+        self.assertNotIn("/reset/", json.dumps(queued))
+        self.work()
+        self.assertEqual(mail.outbox[0].to, ["ieva@example.com"])
+        self.assertIn("/reset/", mail.outbox[0].body)
+
+    def test_registration_profile_created_by_worker(self):
+        data = {
+            "username": "lukas", "first_name": "Lukas", "last_name": "Kairys",
+            "city": "Vilnius", "password1": "Sudetinga-123", "password2": "Sudetinga-123",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("libraryapp:register"), data)
+        self.assertFalse(UserProfile.objects.exists())
+        self.work()
+        self.assertEqual(UserProfile.objects.get().city, "Vilnius")
+
+    def test_only_tasks_without_a_heartbeat_are_requeued(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        alive = Task.objects.create(name="tests.slow", status=Task.RUNNING, started_at=long_ago, heartbeat_at=timezone.now())
+        dead = Task.objects.create(name="tests.slow", status=Task.RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        self.assertEqual(tasks.requeue_stale(timedelta(minutes=10)), 1)
+        self.assertEqual(
+            dict(Task.objects.values_list("pk", "status")), {alive.pk: Task.RUNNING, dead.pk: Task.QUEUED}
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("run_worker", once=True, stale_after=60, stdout=StringIO())
+
+
+@override_settings(LIBRARY_TASKS_HEARTBEAT=0.01)
+class TaskHeartbeatTests(TransactionTestCase):
+    """The heartbeat writes from its own thread, which needs committed rows."""
+
+    def test_running_task_keeps_beating(self):
+        with transaction.atomic():
+            slow.enqueue(seconds=0.2)
+        task_row = tasks.claim("test")
+        Task.objects.filter(pk=task_row.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(tasks.run(task_row))
+        task_row.refresh_from_db()
+        self.assertGreater(task_row.heartbeat_at, task_row.started_at)
+
+
+# ##### async views #####
+class AsyncUrls:
+    # the async views mounted in place of the sync ones, as with LIBRARY_ASYNC_VIEWS
+    urlpatterns = [
+        path("", include((urls.async_urlpatterns(), "libraryapp"))),
+        path("accounts/", include("django.contrib.auth.urls")),
+    ]
+
+
+class AsyncViewTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("austeja")
+        UserProfile.objects.create(user=self.user)
+        author = Author.objects.create(name="Žemaitė")
+        self.books = [make_book(f"Knyga {i:02}", author=author, year=1890 + i) for i in range(14)]
+        for book in self.books:
+            UserBookStatus.objects.create(user=self.user, book=book, status="read")
+        Rating.objects.create(user=self.user, book=self.books[0], stars=4)
+
+    async def both(self, url, data=None, login=False):
+        """(sync response, async response) for the same request."""
+        if login:
+            await self.async_client.aforce_login(self.user)
+        sync_response = await sync_to_async(self.client.get)(url, data) if not login else None
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            async_response = await self.async_client.get(url, data)
+        return sync_response, async_response
+
+    async def test_catalogue_matches_sync_view(self):
+        url = reverse("libraryapp:book_list")
+        for data in ({}, {"page": 2}, {"order": "year", "year_from": 1895}, {"q": "knyga"}, {"cursor": ""}):
+            with self.subTest(data=data):
+                sync_response, async_response = await self.both(url, data)
+                self.assertEqual(async_response.status_code, 200)
+                self.assertEqual(async_response.content, sync_response.content)
+                self.assertEqual(async_response["ETag"], sync_response["ETag"])
+
+        _, response = await self.both(url, {"page": 99})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_book_page(self):
+        url = reverse("libraryapp:book_detail", args=[self.books[0].pk])
+        sync_response, response = await self.both(url)
+        self.assertEqual(response.content, sync_response.content)
+
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            not_modified = await self.async_client.get(url, headers={"If-None-Match": response["ETag"]})
+            self.assertEqual(not_modified.status_code, 304)
+            missing = await self.async_client.get(reverse("libraryapp:book_detail", args=[0]))
+            self.assertEqual(missing.status_code, 404)
+
+        with override_settings(LIBRARY_SERVER_TIMING=True):
+            _, response = await self.both(url, login=True)
+        # queries run by the async ORM are still counted
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries')
+        self.assertEqual(response.context["user_rating"].stars, 4)
+        self.assertTrue(response.context["has_read"])
+
+    async def test_profile(self):
+        _, response = await self.both(reverse("libraryapp:profile"), {"page": 2}, login=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["page_obj"].number, 2)
+        self.assertEqual(len(response.context["books_status"]), 2)
+
+        _, response = await self.both(reverse("libraryapp:profile"), {"page": 9}, login=True)
+        self.assertEqual(response.context["page_obj"].number, 2)
+
+
+# ##### recommendations #####
+class RecommendationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        author = Author.objects.create(name="Žemaitė")
+        self.books = {title: make_book(title, author) for title in ("Marti", "Petras Kurmelis", "Topylis", "Sutkai")}
+        self.users = [User.objects.create_user(name) for name in ("ona", "jonas", "ieva")]
+
+    def rate(self, user, title, stars):
+        Rating.objects.create(user=user, book=self.books[title], stars=stars)
+
+    def similar(self, title):
+        return [
+            b.similar.title for b in
+            BookSimilarity.objects.filter(book=self.books[title]).order_by("-score").select_related("similar")
+        ]
+
+    def test_rebuild_ranks_books_liked_together(self):
+        ona, jonas, ieva = self.users
+        self.rate(ona, "Marti", 5)
+        self.rate(ona, "Petras Kurmelis", 5)
+        self.rate(jonas, "Marti", 5)
+        self.rate(jonas, "Petras Kurmelis", 4)
+        self.rate(jonas, "Topylis", 1)
+        UserBookStatus.objects.create(user=ieva, book=self.books["Marti"], status="read")
+        UserBookStatus.objects.create(user=ieva, book=self.books["Sutkai"], status="read")
+
+        call_command("build_recommendations", stdout=StringIO())
+        # disliked by a reader of "Marti": never recommended next to it
+        self.assertEqual(self.similar("Marti"), ["Petras Kurmelis", "Sutkai"])
+        self.assertEqual(self.similar("Topylis"), [])
+
+    def test_new_rating_refreshes_the_book(self):
+        ona, jonas, ieva = self.users
+        self.rate(ona, "Marti", 5)
+        self.rate(ona, "Petras Kurmelis", 5)
+        self.rate(jonas, "Marti", 5)
+        self.rate(jonas, "Petras Kurmelis", 5)
+        recommendations.rebuild()
+        self.assertEqual(self.similar("Topylis"), [])
+        before = Book.objects.get(pk=self.books["Topylis"].pk).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rate(ona, "Topylis", 4)
+        call_command("run_worker", once=True, stdout=StringIO())
+        self.assertCountEqual(self.similar("Topylis"), ["Marti", "Petras Kurmelis"])
+        # the changed list must not hide behind the cached book fragments
+        self.assertGreater(Book.objects.get(pk=self.books["Topylis"].pk).updated_at, before)
+        # the reader's other books wait for the nightly rebuild
+        self.assertEqual(self.similar("Marti"), ["Petras Kurmelis"])
+        recommendations.rebuild()
+        self.assertEqual(self.similar("Marti"), ["Petras Kurmelis", "Topylis"])
+
+    def test_refreshes_are_coalesced_per_book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users:
+                self.rate(user, "Marti", 5)
+            self.rate(self.users[0], "Sutkai", 3)
+        self.assertEqual(
+            sorted(kwargs["book_ids"][0] for kwargs in Task.objects.values_list("kwargs", flat=True)),
+            sorted([self.books["Marti"].pk, self.books["Sutkai"].pk]),
+        )
+
+    def test_refresh_neighbourhood_is_capped(self):
+        ona, jonas, ieva = self.users
+        for user in self.users:
+            self.rate(user, "Marti", 5)
+        self.rate(ona, "Petras Kurmelis", 5)
+        self.rate(jonas, "Petras Kurmelis", 5)
+        self.rate(ieva, "Sutkai", 5)
+        marti = self.books["Marti"].pk
+
+        matrix = recommendations.Matrix.around({marti}, max_candidates=1)
+        self.assertEqual(set(matrix.by_book), {marti, self.books["Petras Kurmelis"].pk})
+        # the scored candidate still has its whole column, so its norm is exact
+        self.assertEqual(len(matrix.by_book[self.books["Petras Kurmelis"].pk]), 2)
+        # only the latest reader of the book is asked for candidates, whatever their user id
+        Rating.objects.filter(user=ieva, book=marti).update(created_at=timezone.now() - timedelta(days=2))
+        Rating.objects.filter(user=jonas, book=marti).update(created_at=timezone.now() - timedelta(days=1))
+        matrix = recommendations.Matrix.around({marti}, max_readers=1)
+        self.assertEqual(set(matrix.by_book), {marti, self.books["Petras Kurmelis"].pk})
+
+    def test_book_page_lists_neighbours(self):
+        ona, jonas, ieva = self.users
+        self.rate(ona, "Marti", 5)
+        self.rate(ona, "Sutkai", 4)
+        recommendations.rebuild()
+
+        response = self.client.get(reverse("libraryapp:book_detail", kwargs={"pk": self.books["Marti"].pk}))
+        self.assertContains(response, "Kam patiko ši knyga, patiko ir")
+        self.assertContains(response, reverse("libraryapp:book_detail", kwargs={"pk": self.books["Sutkai"].pk}))
+
+    def test_neighbour_changes_reach_the_cached_list(self):
+        ona = self.users[0]
+        self.rate(ona, "Marti", 5)
+        self.rate(ona, "Sutkai", 4)
+        recommendations.rebuild()
+        self.client.force_login(ona)
+        url = reverse("libraryapp:book_detail", kwargs={"pk": self.books["Marti"].pk})
+        self.assertContains(self.client.get(url), "Sutkai")
+
+        # neither Marti nor its list changed, only the neighbour shown in it
+        sutkai = self.books["Sutkai"]
+        sutkai.title = "Sutkai (2 leid.)"
+        sutkai.save()
+        self.assertContains(self.client.get(url), "Sutkai (2 leid.)")
+
+
+# ##### reader writes #####
+class ReaderWriteTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book()
+        self.user = User.objects.create_user("rasa")
+        UserProfile.objects.create(user=self.user)
+
+    def test_mark_as_read_is_one_upsert(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(services.mark_as_read(self.user, self.book.pk))
+        writes = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(writes), 2)
+        self.assertIn("ON CONFLICT", writes[0])
+
+        UserBookStatus.objects.filter(user=self.user).update(status="want")
+        self.assertFalse(services.mark_as_read(self.user, self.book.pk))
+        self.assertEqual(UserBookStatus.objects.get(user=self.user).status, "read")
+        self.assertEqual(UserProfile.objects.get(user=self.user).read_count, 1)
+
+    def test_rate_book_requires_read_status(self):
+        with self.assertRaises(services.NotRead):
+            services.rate_book(self.user, self.book.pk, 4)
+        with self.assertRaises(Book.DoesNotExist):
+            services.rate_book(self.user, self.book.pk + 100, 4)
+        self.assertFalse(Rating.objects.exists())
+
+    def test_rate_book_upserts(self):
+        services.mark_as_read(self.user, self.book.pk)
+        for stars, created in ((4, True), (2, False)):
+            with self.subTest(created=created):
+                # savepoint, the upsert, the book's aggregates, release; then one INSERT per
+                # queued task: the recommendations, and the reader's counters on a new rating
+                with self.assertNumQueries(6 if created else 5), self.captureOnCommitCallbacks(execute=True):
+                    self.assertIs(services.rate_book(self.user, self.book.pk, stars), created)
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum), (1, 2))
+        call_command("run_worker", once=True, stdout=StringIO())
+        self.assertEqual(UserProfile.objects.get(user=self.user).rated_count, 1)
+
+    def test_unique_tasks_are_queued_once(self):
+        services.mark_as_read(self.user, self.book.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.rate_book(self.user, self.book.pk, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.rate_book(self.user, self.book.pk, 5)
+        self.assertEqual(
+            sorted(Task.objects.values_list("name", flat=True)),
+            ["libraryapp.tasks.refresh_counters", "libraryapp.tasks.refresh_recommendations"],
+        )
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("libraryapp:rate_book", args=[self.book.pk]), {"stars": 5})
+        self.assertFalse(Rating.objects.exists())
+
+        response = self.client.post(reverse("libraryapp:mark_as_read", args=[self.book.pk]))
+        self.assertEqual(
+            str(list(get_messages(response.wsgi_request))[-1]),
+            f"Knyga „{self.book.title}“ pažymėta kaip perskaityta.",
+        )
+        self.client.post(reverse("libraryapp:rate_book", args=[self.book.pk]), {"stars": 5})
+        self.assertEqual(Rating.objects.get().stars, 5)
+
+        response = self.client.post(reverse("libraryapp:mark_as_read", args=[self.book.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+
+
+class ReadingBatchTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("ieva")
+        UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.url = reverse("libraryapp:reading_batch")
+        author = Author.objects.create(name="Žemaitė")
+        self.books = [make_book(f"Knyga {i}", author=author) for i in range(40)]
+
+    def post(self, items):
+        return self.client.post(self.url, json.dumps({"items": items}), content_type="application/json")
+
+    def test_applies_items_and_reports_each(self):
+        a, b, c = self.books[:3]
+        UserBookStatus.objects.create(user=self.user, book=c, status="read")
+        response = self.post([
+            {"book": a.pk, "status": "read", "stars": 5},
+            {"book": b.pk, "status": "want"},
+            {"book": c.pk, "stars": 3},  # read before
+            {"book": b.pk, "stars": 4},  # want, and listed twice
+            {"book": 999999, "status": "read"},
+            {"book": a.pk + 1000, "status": "lost"},
+            {"book": self.books[3].pk, "stars": 4},  # never read
+        ])
+        data = response.json()
+        self.assertEqual(data["saved"], 3)
+        self.assertEqual([r["ok"] for r in data["results"]], [True, True, True, False, False, False, False])
+        self.assertEqual(data["results"][2], {"index": 2, "book": c.pk, "ok": True, "status": "read", "stars": 3})
+
+        self.assertEqual(
+            dict(UserBookStatus.objects.filter(user=self.user).values_list("book", "status")),
+            {a.pk: "read", b.pk: "want", c.pk: "read"},
+        )
+        a.refresh_from_db()
+        self.assertEqual((a.rating_count, a.avg_rating), (1, 5.0))
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.read_count, profile.want_count, profile.rated_count), (2, 1, 2))
+
+    def test_updates_existing_rows(self):
+        book = self.books[0]
+        self.post([{"book": book.pk, "status": "read", "stars": 2}])
+        self.post([{"book": book.pk, "status": "read", "stars": 4}])
+        self.assertEqual(Rating.objects.get(user=self.user, book=book).stars, 4)
+        book.refresh_from_db()
+        self.assertEqual((book.rating_count, book.rating_sum), (1, 4))
+
+    def test_constant_query_count(self):
+        def items(books):
+            return [{"book": book.pk, "status": "read", "stars": 1 + book.pk % 5} for book in books]
+
+        with CaptureQueriesContext(connection) as few:
+            self.post(items(self.books[:2]))
+        with CaptureQueriesContext(connection) as many:
+            response = self.post(items(self.books[2:]))
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(response.json()["saved"], 38)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.post(self.url, "{", content_type="application/json").status_code, 400)
+        self.assertEqual(self.post({"book": 1}).status_code, 400)
+        with override_settings(LIBRARY_BATCH_MAX_ITEMS=2):
+            self.assertEqual(self.post([{"book": 1, "status": "read"}] * 3).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+        self.client.logout()
+        self.assertEqual(self.post([]).status_code, 401)
+
+    def test_refreshes_recommendations_of_every_changed_book(self):
+        a, b, c = self.books[:3]
+        UserBookStatus.objects.create(user=self.user, book=c, status="read")
+        with self.captureOnCommitCallbacks(execute=True):
+            # c is no longer read, but its neighbours still change
+            self.post([{"book": a.pk, "status": "read", "stars": 5}, {"book": b.pk, "status": "read"},
+                       {"book": c.pk, "status": "want"}])
+        self.assertEqual(Task.objects.get().kwargs, {"book_ids": sorted([a.pk, b.pk, c.pk])})
+
+    def test_rejects_malformed_items(self):
+        book = self.books[0]
+        response = self.post([
+            {"book": book.pk, "stars": [5]},
+            {"book": book.pk, "status": {}},
+            {"book": book.pk, "status": ["read"], "stars": 5},
+            {"book": book.pk, "status": "read", "stars": 4.5},
+            {"book": 2 ** 63, "status": "read"},
+            {"book": -(2 ** 70), "status": "read"},
+            {"book": [book.pk], "status": "read"},
+            "read",
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["saved"], 0)
+        self.assertFalse(any(result["ok"] for result in data["results"]))
+        self.assertFalse(UserBookStatus.objects.exists())
+
+
+@override_settings(LIBRARY_DATABASE_REPLICAS=[])
+class ConcurrentReaderWriteTests(TransactionTestCase):
+    """Many threads submitting for the same reader and book end with one row each, never an error."""
+
+    THREADS = 8
+
+    def hammer(self, write):
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def run(i):
+            barrier.wait()
+            try:
+                for attempt in range(5):
+                    # the shared in-memory test database fails lock waits at once where a
+                    # database file would wait out its busy timeout: wait here instead
+                    while True:
+                        try:
+                            write(i)
+                            break
+                        except OperationalError as error:
+                            if "locked" not in str(error):
+                                raise
+                            time.sleep(0.001)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    @skipUnless(services.native_upserts(connection), "needs INSERT ... ON CONFLICT")
+    def test_same_reader_and_book(self):
+        book = make_book()
+        user = User.objects.create_user("tomas")
+        UserProfile.objects.create(user=user)
+
+        def write(i):
+            services.mark_as_read(user, book.pk)
+            services.rate_book(user, book.pk, 1 + i % 5)
+
+        self.assertEqual(self.hammer(write), [])
+        self.assertEqual(UserBookStatus.objects.filter(user=user, book=book).count(), 1)
+        self.assertEqual(Rating.objects.filter(user=user, book=book).count(), 1)
+        book.refresh_from_db()
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((book.rating_count, profile.read_count, profile.rated_count), (1, 1, 1))
+
+
+# ##### read replicas #####
+@override_settings(LIBRARY_PAGE_CACHE_TIMEOUT=0, LIBRARY_QUERY_BUDGET_STRICT=True, LIBRARY_DATABASE_REPLICAS=[])
+class ReplicaTests(TransactionTestCase):
+    """
+    A second SQLite file, copied from the test database, stands in for a lagging
+    replica. The copy needs committed data, hence no TestCase transaction.
+    """
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.book = make_book()
+        self.user = User.objects.create_user("paulius")
+        self.client.force_login(self.user)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def add_replica(self, alias, name):
+        # a connection of this thread only, outside DATABASES and the test isolation checks
+        primary = connections["default"]
+        connections[alias] = type(primary)({**primary.settings_dict, "NAME": name}, alias)
+
+        def remove():
+            connections[alias].close()
+            del connections[alias]
+            replicas._health.pop(alias, None)
+
+        self.addCleanup(remove)
+        return connections[alias]
+
+    @override_settings(LIBRARY_DATABASE_REPLICAS=["copy"])
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        replica = self.add_replica("copy", os.path.join(self.dir, "replica.sqlite3"))
+        call_command("sync_sqlite_replicas", stdout=StringIO())
+        url = reverse("libraryapp:book_detail", args=[self.book.pk])
+
+        with CaptureQueriesContext(replica) as on_replica:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(on_replica)
+
+        response = self.client.post(reverse("libraryapp:mark_as_read", args=[self.book.pk]))
+        self.assertIn(replicas.COOKIE, response.cookies)
+        with CaptureQueriesContext(replica) as on_replica:
+            response = self.client.get(url)
+        self.assertFalse(on_replica)
+        self.assertTrue(response.context["has_read"])
+
+        # without the cookie the replica answers, not yet knowing about the write
+        del self.client.cookies[replicas.COOKIE]
+        self.assertFalse(self.client.get(url).context["has_read"])
+        with replicas.use_primary():
+            self.assertEqual(router.db_for_read(Book), "default")
+
+    @override_settings(LIBRARY_DATABASE_REPLICAS=["unreachable"])
+    def test_unavailable_replica_is_skipped(self):
+        self.add_replica("unreachable", os.path.join(self.dir, "missing", "replica.sqlite3"))
+        with self.assertLogs("libraryapp.replicas", "WARNING"):
+            response = self.client.get(reverse("libraryapp:book_detail", args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replicas._health["unreachable"][0], False)
+        self.assertEqual(router.db_for_read(Book), "default")
+
+    @override_settings(LIBRARY_DATABASE_REPLICAS=["empty"])
+    def test_empty_replica_is_skipped(self):
+        self.add_replica("empty", os.path.join(self.dir, "empty.sqlite3"))
+        with self.assertLogs("libraryapp.replicas", "WARNING"):
+            self.assertFalse(replicas.check("empty"))
+
+    @override_settings(LIBRARY_DATABASE_REPLICAS=["copy"])
+    def test_profile_visit_reads_the_replica(self):
+        UserProfile.objects.create(user=self.user)
+        replica = self.add_replica("copy", os.path.join(self.dir, "replica.sqlite3"))
+        call_command("sync_sqlite_replicas", stdout=StringIO())
+
+        with CaptureQueriesContext(replica) as on_replica:
+            response = self.client.get(reverse("libraryapp:profile"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(on_replica)
+        self.assertNotIn(replicas.COOKIE, response.cookies)
+
+    def test_no_replicas(self):
+        response = self.client.post(reverse("libraryapp:mark_as_read", args=[self.book.pk]))
+        self.assertNotIn(replicas.COOKIE, response.cookies)
+        self.assertIsNone(replicas.PrimaryReplicaRouter().db_for_read(Book))
+
+
+# ##### tuned sqlite #####
+class SqliteTuningTests(LibraryTestCase):
+    def test_connection_options(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        primary = connections["default"]
+        tuned = type(primary)({
+            **primary.settings_dict,
+            "NAME": os.path.join(directory, "db.sqlite3"),
+            "OPTIONS": sqlite_tuning.options(cache_size_kib=2048, busy_timeout_ms=2500),
+        }, "tuned")
+        self.addCleanup(tuned.close)
+
+        with tuned.cursor() as cursor:
+            pragmas = {}
+            for name in ("journal_mode", "synchronous", "cache_size", "busy_timeout"):
+                cursor.execute(f"PRAGMA {name}")
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "cache_size": -2048, "busy_timeout": 2500})
+        self.assertEqual(tuned.transaction_mode, "IMMEDIATE")
+
+    def test_benchmark_needs_a_database_file(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_sqlite", stdout=StringIO())
@@ -1,9 +1,13 @@
 # ##### django urls #####
+from django.conf import settings
 from django.urls import path
 
 # ##### django auth views #####
 from django.contrib.auth import views as auth_views
 
+# ##### project forms #####
+from .forms import QueuedPasswordResetForm
+
 # ##### project views #####
 from .views import (
     BookListView,
@@ -12,6 +16,13 @@ from .views import (
     register,
     profile,
     mark_as_read,
+    reading_batch,
+    export_my_data,
+    export_catalogue,
+    suggest,
+    AsyncBookListView,
+    AsyncBookDetailView,
+    profile_async,
 )
 
 app_name = "libraryapp"
@@ -22,15 +33,21 @@ urlpatterns = [
     path("book/<int:pk>/", BookDetailView.as_view(), name="book_detail"),
     path("book/<int:pk>/rate/", RateBookView.as_view(), name="rate_book"),
     path("book/<int:pk>/mark_as_read/", mark_as_read, name="mark_as_read"),
+    path("api/reading-list/", reading_batch, name="reading_batch"),
 
     path("profile/", profile, name="profile"),
+    path("profile/export/<str:dataset>/", export_my_data, name="export_my_data"),
+
+    path("export/<str:dataset>/", export_catalogue, name="export_catalogue"),
+
+    path("autocomplete/<str:field>/", suggest, name="autocomplete"),
 
     path("login/", auth_views.LoginView.as_view(template_name="login.html"), name="login"),
     path("logout/", auth_views.LogoutView.as_view(next_page="libraryapp:book_list"), name="logout"),
 
     path("register/", register, name="register"),
 
-    path("password_reset/", auth_views.PasswordResetView.as_view(template_name="password_reset.html"), name="password_reset"),
+    path("password_reset/", auth_views.PasswordResetView.as_view(template_name="password_reset.html", form_class=QueuedPasswordResetForm), name="password_reset"),
     path("password_reset_done/", auth_views.PasswordResetDoneView.as_view(template_name="password_reset_done.html"), name="password_reset_done"),
     path("reset/<uidb64>/<token>/", auth_views.PasswordResetConfirmView.as_view(template_name="password_reset_confirm.html"), name="password_reset_confirm"),
     path("reset/done/", auth_views.PasswordResetCompleteView.as_view(template_name="password_reset_complete.html"), name="password_reset_complete"),
@@ -38,3 +55,20 @@ urlpatterns = [
     path("password_change/", auth_views.PasswordChangeView.as_view(template_name="password_change.html"), name="password_change"),
     path("password_change/done/", auth_views.PasswordChangeDoneView.as_view(template_name="password_change_done.html"), name="password_change_done"),
 ]
+
+
+def async_urlpatterns():
+    """urlpatterns with the async versions of the read-heavy pages, for ASGI."""
+    views = {
+        "book_list": AsyncBookListView.as_view(),
+        "book_detail": AsyncBookDetailView.as_view(),
+        "profile": profile_async,
+    }
+    return [
+        path(str(pattern.pattern), views[pattern.name], name=pattern.name) if pattern.name in views else pattern
+        for pattern in urlpatterns
+    ]
+
+
+if settings.LIBRARY_ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns()
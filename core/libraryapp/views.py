@@ -1,8 +1,21 @@
+# ##### python #####
+import asyncio
+import json
+
+# ##### django settings #####
+from django.conf import settings
+
+# ##### async #####
+from asgiref.sync import sync_to_async
+
 # ##### django shortcuts #####
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
+from django.template.response import TemplateResponse
 
 # ##### django urls and views #####
 from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import ListView, DetailView, FormView
 
 # ##### django auth #####
@@ -10,40 +23,55 @@ from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 
-# ##### django orm #####
-from django.db.models import Avg
+# ##### django db #####
+from django.db import IntegrityError, transaction
+
+# ##### django http #####
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import InvalidPage, Page
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
 
 # ##### project models #####
-from .models import Book, Author, Genre, Rating, UserBookStatus
+from .models import Book, BookSimilarity, Genre, Rating, UserBookStatus, UserProfile
+
+# ##### project search, caching and pagination #####
+from . import autocomplete, catalogue_cache, conditional, export, facets, search, services
+from .page_cache import AnonymousPageCacheMixin, AsyncAnonymousPageCacheMixin
+from .pagination import CountedPaginator, KeysetPaginator
 
 # ##### project forms #####
 from .forms import RatingForm, CustomUserCreationForm
 
 
 # ##### book list #####
-class BookListView(ListView):
+@method_decorator(
+    condition(etag_func=conditional.catalogue_etag, last_modified_func=conditional.catalogue_last_modified),
+    name="dispatch",
+)
+class BookListView(AnonymousPageCacheMixin, ListView):
     model = Book
     template_name = "book_list.html"
     context_object_name = "books"
     paginate_by = 4
 
     def get_queryset(self):
-        books = Book.objects.all().annotate(avg_rating=Avg("ratings__stars"))
+        books = Book.objects.for_catalogue()
 
         # search params
+        q = self.request.GET.get("q")
         title = self.request.GET.get("title")
         author = self.request.GET.get("author")
         genre = self.request.GET.get("genre")
         year_from = self.request.GET.get("year_from")
         year_to = self.request.GET.get("year_to")
-        order = self.request.GET.get("order", "title")
+        order = self.get_order()
 
-        if title:
-            books = books.filter(title__icontains=title)
-
-        if author:
-            books = books.filter(author__name__icontains=author)
+        # free text and title/author go through the full-text index
+        terms = {None: q, "title": title, "author": author}
+        books = search.get_backend().search(books, {f: t for f, t in terms.items() if t})
 
         if genre:
             books = books.filter(genres__id=genre)
@@ -54,51 +82,120 @@ class BookListView(ListView):
         if year_to:
             books = books.filter(year__lte=year_to)
 
-        if order not in ["title", "year"]:
+        if order == "relevance":
+            order = "-search_rank" if "search_rank" in books.query.annotations else "title"
+
+        return books.order_by(order, "title", "pk").distinct()
+
+    def get_page_version(self):
+        return (
+            catalogue_cache.normalize(self.request.GET, self.get_order()),
+            self.request.GET.get("page"),
+            self.request.GET.get("cursor"),
+            catalogue_cache.generations(["books", "authors", "genres", "ratings"]),
+        )
+
+    def get_pagination_mode(self):
+        # keyset pages need a unique, cursor-friendly sort key
+        if self.get_order() == "relevance" or "page" in self.request.GET:
+            return "offset"
+        if "cursor" in self.request.GET or settings.LIBRARY_CURSOR_PAGINATION:
+            return "cursor"
+        return "offset"
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() == "offset":
+            # page through the cached id list of this filter combination
+            ids = catalogue_cache.matching_ids(self.request.GET, self.get_order(), queryset)
+            if ids is not None:
+                queryset = catalogue_cache.CachedResult(ids, Book.objects.for_catalogue())
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_keyset_fields())
+        page = paginator.page(self.request.GET.get("cursor"))
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_keyset_fields(self):
+        return ("title", "pk") if self.get_order() == "title" else ("year", "title", "pk")
+
+    def get_order(self):
+        # relevance is the default order for a free-text search
+        default = "relevance" if self.request.GET.get("q") else "title"
+        order = self.request.GET.get("order") or default
+        if order not in ["title", "year", "relevance"]:
             order = "title"
+        return order
+
+    def get_genres(self):
+        return Genre.objects.all()
 
-        return books.order_by(order, "title").distinct()
+    def get_facets(self):
+        return facets.get(self.request.GET, self.object_list)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["authors"] = Author.objects.all()
-        context["genres"] = Genre.objects.all()
+        context["facets"] = self.get_facets()
+        context["genres"] = list(self.get_genres())
+        for genre in context["genres"]:
+            genre.book_count = context["facets"]["genres"].get(genre.pk, 0)
+        context["cursor_pagination"] = self.get_pagination_mode() == "cursor"
         context["current"] = {
+            "q": self.request.GET.get("q", ""),
             "title": self.request.GET.get("title", ""),
             "author": self.request.GET.get("author", ""),
             "genre": self.request.GET.get("genre", ""),
             "year_from": self.request.GET.get("year_from", ""),
             "year_to": self.request.GET.get("year_to", ""),
-            "order": self.request.GET.get("order", "title"),
+            "order": self.get_order(),
         }
         return context
 
 
 # ##### book detail #####
-class BookDetailView(DetailView):
+@method_decorator(
+    condition(etag_func=conditional.book_etag, last_modified_func=conditional.book_last_modified),
+    name="dispatch",
+)
+class BookDetailView(AnonymousPageCacheMixin, DetailView):
     model = Book
     template_name = "book_detail.html"
     context_object_name = "book"
     paginate_by = 4
 
+    def get_page_version(self):
+        return conditional.book_version(self.request, self.kwargs["pk"])
+
     def get_queryset(self):
-        return Book.objects.all().annotate(avg_rating=Avg("ratings__stars"))
+        return Book.objects.select_related("author")
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_reader_state(self):
+        """The user's rating of the book and whether they have read it."""
         user = self.request.user
+        if not user.is_authenticated:
+            return None, False
 
-        rating = None
-        has_read = False
-
-        if user.is_authenticated:
-            rating = Rating.objects.filter(book=self.object, user=user).first()
-            has_read = UserBookStatus.objects.filter(
-                user=user,
-                book=self.object,
-                status="read"
-            ).exists()
+        rating = Rating.objects.filter(book=self.object, user=user).first()
+        has_read = UserBookStatus.objects.filter(
+            user=user,
+            book=self.object,
+            status="read"
+        ).exists()
+        return rating, has_read
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        rating, has_read = self.get_reader_state()
+
+        # lazy: only evaluated when the ratings fragment is not cached
+        context["ratings"] = self.object.ratings.select_related("user")
+        # precomputed neighbours (see recommendations.py), one indexed query
+        context["similar_books"] = (
+            BookSimilarity.objects.filter(book=self.object).order_by("-score")
+            .select_related("similar__author")
+            .only("similar__title", "similar__cover", "similar__cover_hash", "similar__cover_width", "similar__author__name")
+        )
+        # the neighbours' titles, covers and authors version that fragment too
+        context["similar_version"] = catalogue_cache.generations(["books", "authors"])
         context["form"] = RatingForm(initial={"stars": getattr(rating, "stars", None)})
         context["user_rating"] = rating
         context["has_read"] = has_read
@@ -108,20 +205,16 @@ class BookDetailView(DetailView):
 # ##### mark as read #####
 @login_required
 def mark_as_read(request, pk):
-    book = get_object_or_404(Book, pk=pk)
-
-    status, created = UserBookStatus.objects.get_or_create(
-        user=request.user,
-        book=book,
-        defaults={"status": "read"}
-    )
-
-    if not created and status.status != "read":
-        status.status = "read"
-        status.save()
+    # one upsert, see services.py
+    try:
+        services.mark_as_read(request.user, pk)
+    except Book.DoesNotExist:
+        raise Http404("Knyga nerasta")
 
-    messages.success(request, f"Knyga „{book.title}“ pažymėta kaip perskaityta.")
-    return redirect("libraryapp:book_detail", pk=book.pk)
+    # RETURNING only sees the status row, so the title takes one more small query
+    title = Book.objects.filter(pk=pk).values_list("title", flat=True).first()
+    messages.success(request, f"Knyga „{title}“ pažymėta kaip perskaityta.")
+    return redirect("libraryapp:book_detail", pk=pk)
 
 
 # ##### rate book #####
@@ -130,32 +223,27 @@ class RateBookView(LoginRequiredMixin, FormView):
     template_name = "book_detail.html"
 
     def form_valid(self, form):
-        book = get_object_or_404(Book, pk=self.kwargs["pk"])
-
-        # only if book is marked as read
-        if not UserBookStatus.objects.filter(
-                user=self.request.user,
-                book=book,
-                status="read"
-        ).exists():
+        pk = self.kwargs["pk"]
+
+        # one upsert that only writes if the book is marked as read (services.py);
+        # the rating and the book's aggregates are committed together
+        try:
+            created = services.rate_book(self.request.user, pk, form.cleaned_data["stars"])
+        except Book.DoesNotExist:
+            raise Http404("Knyga nerasta")
+        except services.NotRead:
             messages.error(
                 self.request,
                 "Norėdami įvertinti, pirmiausia pažymėkite knygą kaip perskaitytą."
             )
-            return redirect(reverse("libraryapp:book_detail", kwargs={"pk": book.pk}))
-
-        rating, created = Rating.objects.update_or_create(
-            book=book,
-            user=self.request.user,
-            defaults={"stars": form.cleaned_data["stars"]}
-        )
+            return redirect(reverse("libraryapp:book_detail", kwargs={"pk": pk}))
 
         if created:
             messages.success(self.request, "Ačiū! Jūsų įvertinimas išsaugotas.")
         else:
             messages.success(self.request, "Jūsų įvertinimas atnaujintas.")
 
-        return redirect(reverse("libraryapp:book_detail", kwargs={"pk": book.pk}))
+        return redirect(reverse("libraryapp:book_detail", kwargs={"pk": pk}))
 
     def form_invalid(self, form):
         messages.error(self.request, "Nepavyko išsaugoti įvertinimo. Patikrinkite formą.")
@@ -176,22 +264,284 @@ def register(request):
 
 
 # ##### profile #####
-@login_required
-def profile(request):
+PROFILE_PAGE_SIZE = 12
+
+
+def profile_filter_status(request):
     # filter by book status
     filter_status = request.GET.get("status", "read")
+    if filter_status not in dict(UserBookStatus.STATUS_CHOICES):
+        filter_status = "read"
+    return filter_status
+
+
+def profile_statuses(user, status):
+    """The user's books with this status, book + author in one query."""
+    return UserBookStatus.objects.filter(
+        user=user,
+        status=status
+    ).select_related("book__author").only(
+        "status", "book__title", "book__year", "book__cover", "book__cover_hash", "book__cover_width", "book__author__name"
+    ).order_by("-created_at", "-pk")
+
+
+def first_visit_profile(user):
+    """
+    Create the profile of a user who has none yet (registration queues it) and
+    count their books. A plain INSERT: get_or_create would SELECT once more.
+    """
+    try:
+        with transaction.atomic():
+            user_profile = UserProfile.objects.create(user=user)
+    except IntegrityError:
+        # the worker got there first
+        return UserProfile.objects.get(user=user)
+    UserProfile.refresh_counters([user.pk])
+    user_profile.refresh_from_db()
+    return user_profile
 
-    books_status = UserBookStatus.objects.filter(
-        user=request.user,
-        status=filter_status
-    ).select_related("book")
 
-    read_count = UserBookStatus.objects.filter(user=request.user, status="read").count()
-    rated_count = Rating.objects.filter(user=request.user).count()
+@login_required
+def profile(request):
+    filter_status = profile_filter_status(request)
+
+    # a plain read, which a replica can answer: get_or_create writes, so it would
+    # send every visit to the primary and pin the reader there
+    user_profile = UserProfile.objects.filter(user=request.user).first()
+    if user_profile is None:
+        user_profile = first_visit_profile(request.user)
+
+    # the page size comes from the stored counter
+    books_status = profile_statuses(request.user, filter_status)
+    paginator = CountedPaginator(
+        books_status, PROFILE_PAGE_SIZE, count=user_profile.status_count(filter_status)
+    )
+    page_obj = paginator.get_page(request.GET.get("page"))
 
     return render(request, "profile.html", {
         "filter_status": filter_status,
-        "books_status": books_status,
-        "read_count": read_count,
-        "rated_count": rated_count,
+        "profile": user_profile,
+        "page_obj": page_obj,
+        "books_status": page_obj.object_list,
+    })
+
+
+# ##### export #####
+def export_response(request, dataset, **kwargs):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in export.FORMATS:
+        raise Http404("Nežinomas formatas")
+    compress = request.GET.get("gzip") == "1"
+
+    chunks = export.astream if isinstance(request, ASGIRequest) else export.stream
+    response = StreamingHttpResponse(
+        chunks(dataset, fmt, compress=compress, **kwargs),
+        content_type="application/gzip" if compress else export.FORMATS[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{export.filename(dataset, fmt, compress)}"'
+    response["Cache-Control"] = "private, no-store"
+    return response
+
+
+@login_required
+def export_my_data(request, dataset):
+    """The user's own statuses or ratings."""
+    if dataset not in export.USER_DATASETS:
+        raise Http404("Nežinomas duomenų rinkinys")
+    model = export.DATASETS[dataset][0]
+    return export_response(
+        request, dataset,
+        queryset=model.objects.filter(user=request.user),
+        fields=export.USER_DATASETS[dataset],
+    )
+
+
+@staff_member_required
+def export_catalogue(request, dataset):
+    """Full dump of books, ratings or statuses, for staff only."""
+    if dataset not in export.DATASETS:
+        raise Http404("Nežinomas duomenų rinkinys")
+    return export_response(request, dataset)
+
+
+# ##### batch reading-list updates #####
+@require_POST
+def reading_batch(request):
+    """
+    JSON API: {"items": [{"book": 1, "status": "read", "stars": 5}, ...]} sets the
+    statuses and ratings of many books at once (services.apply_batch); answers
+    with one result per item. Session authenticated, so send the CSRF token.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Reikia prisijungti."}, status=401)
+    try:
+        items = json.loads(request.body).get("items")
+        results = services.apply_batch(request.user, items)
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Netinkamas JSON."}, status=400)
+    except services.BatchError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    return JsonResponse({"saved": sum(result["ok"] for result in results), "results": results})
+
+
+# ##### autocomplete #####
+def suggest(request, field):
+    """Title or author name suggestions for a typed prefix, from the in-memory index."""
+    if field not in autocomplete.FIELDS:
+        raise Http404("Nežinomas laukas")
+    try:
+        limit = max(1, int(request.GET.get("limit", 8)))
+    except ValueError:
+        limit = 8
+    response = JsonResponse({"results": autocomplete.suggest(field, request.GET.get("q", ""), limit)})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+# ##### async views #####
+# ASGI versions of the read-heavy pages (LIBRARY_ASYNC_VIEWS). They build the
+# same querysets and render the same templates as the views above, but read
+# rows with the async ORM and await independent queries together.
+async def alist(queryset):
+    return [obj async for obj in queryset.aiterator()]
+
+
+class AsyncConditionalMixin:
+    """
+    Resolves the user and the conditional-GET validators before an async
+    dispatch: condition() calls the validators synchronously.
+    """
+
+    etag_func = None
+    last_modified_func = None
+
+    async def prepare_validators(self):
+        raise NotImplementedError
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            await self.prepare_validators()
+        view = condition(etag_func=self.etag_func, last_modified_func=self.last_modified_func)(
+            super().dispatch
+        )
+        return await view(request, *args, **kwargs)
+
+
+class AsyncBookListView(AsyncConditionalMixin, AsyncAnonymousPageCacheMixin, BookListView):
+    etag_func = staticmethod(conditional.catalogue_etag)
+    last_modified_func = staticmethod(conditional.catalogue_last_modified)
+
+    async def prepare_validators(self):
+        await conditional.acatalogue_version(self.request)
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        self.page, self.genres, self.facets = await asyncio.gather(
+            self.apaginate_queryset(self.object_list, self.paginate_by),
+            alist(Genre.objects.all()),
+            sync_to_async(facets.get)(self.request.GET, self.object_list),
+        )
+        return self.render_to_response(self.get_context_data())
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() == "cursor":
+            paginator = KeysetPaginator(queryset, page_size, self.get_keyset_fields())
+            page = await paginator.apage(self.request.GET.get("cursor"))
+            return (None, page, page.object_list, page.has_other_pages())
+
+        ids = await sync_to_async(catalogue_cache.matching_ids)(self.request.GET, self.get_order(), queryset)
+        count = len(ids) if ids is not None else await queryset.acount()
+        paginator = CountedPaginator(queryset if ids is None else ids, page_size, count=count)
+        number = self.request.GET.get(self.page_kwarg) or 1
+        try:
+            page = paginator.page(paginator.num_pages if number == "last" else number)
+        except InvalidPage:
+            raise Http404("Neteisingas puslapis")
+
+        if ids is None:
+            page.object_list = await alist(page.object_list)
+        else:
+            books = Book.objects.for_catalogue().filter(pk__in=page.object_list)
+            rows = {book.pk: book for book in await alist(books)}
+            page.object_list = [rows[pk] for pk in page.object_list if pk in rows]
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.page
+
+    def get_genres(self):
+        return self.genres
+
+    def get_facets(self):
+        return self.facets
+
+
+class AsyncBookDetailView(AsyncConditionalMixin, AsyncAnonymousPageCacheMixin, BookDetailView):
+    etag_func = staticmethod(conditional.book_etag)
+    last_modified_func = staticmethod(conditional.book_last_modified)
+
+    async def prepare_validators(self):
+        await conditional.abook_version(self.request, self.kwargs["pk"])
+
+    async def get(self, request, *args, **kwargs):
+        pk = self.kwargs["pk"]
+        book = self.get_queryset().aget(pk=pk)
+        try:
+            if request.user.is_authenticated:
+                # the book, the user's rating and the read check are independent
+                self.object, *self.reader_state = await asyncio.gather(
+                    book,
+                    Rating.objects.filter(book_id=pk, user=request.user).afirst(),
+                    UserBookStatus.objects.filter(user=request.user, book_id=pk, status="read").aexists(),
+                )
+            else:
+                self.object, self.reader_state = await book, (None, False)
+        except Book.DoesNotExist:
+            raise Http404("Knyga nerasta")
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+    def get_object(self, queryset=None):
+        return self.object
+
+    def get_reader_state(self):
+        return self.reader_state
+
+
+@login_required
+async def profile_async(request):
+    filter_status = profile_filter_status(request)
+    user = await request.auser()
+    books_status = profile_statuses(user, filter_status)
+
+    try:
+        number = max(1, int(request.GET.get("page") or 1))
+    except ValueError:
+        number = 1
+
+    def page_rows(number):
+        return alist(books_status[(number - 1) * PROFILE_PAGE_SIZE:number * PROFILE_PAGE_SIZE])
+
+    # the counters and the requested page load together
+    user_profile, rows = await asyncio.gather(
+        UserProfile.objects.filter(user=user).afirst(),
+        page_rows(number),
+    )
+    if user_profile is None:
+        user_profile = await sync_to_async(first_visit_profile)(user)
+
+    paginator = CountedPaginator(
+        books_status, PROFILE_PAGE_SIZE, count=user_profile.status_count(filter_status)
+    )
+    if number > paginator.num_pages:
+        number = paginator.num_pages
+        rows = await page_rows(number)
+    page_obj = Page(rows, number, paginator)
+
+    # rendered by the handler, off the event loop
+    return TemplateResponse(request, "profile.html", {
+        "filter_status": filter_status,
+        "profile": user_profile,
+        "page_obj": page_obj,
+        "books_status": page_obj.object_list,
     })